@@ -0,0 +1,254 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Cardinality Guards
+----------------------------
+
+This script limits the number of series that panels over per-topic and
+per-subscription Pulsar metrics can return. Queries like
+
+    sum(pulsar_rate_in{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, topic)
+
+return one series per topic, which for a busy namespace can be tens of
+thousands of series that the backend has to return and the browser to draw.
+Such targets are wrapped in topk() (or the MetricsQL limitk()) driven by a
+`limit` template variable, which the script adds to the dashboard:
+
+    topk($limit, sum(pulsar_rate_in{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, topic))
+
+A target is guarded when it returns one series per topic, subscription or
+consumer: it selects a metric of a guarded cardinality level (see
+metric_catalog.py) without matching the topic, subscription or consumer to a
+single value, and without aggregating it away. For example, per-subscription
+series of a single topic
+
+    pulsar_subscription_back_log{cluster=~"$cluster", topic="$topic"}
+
+are guarded, while `sum by (cluster, namespace) (pulsar_rate_in{...})` and
+`pulsar_rate_in{topic="$topic"}` keep their full detail. The guarded levels
+can be chosen with --levels, and metric families that are cheap enough to
+always show in full detail excluded with --full-detail. Targets that already
+are bounded by topk(), bottomk() or limitk() are left as they are.
+
+topk() keeps the largest series at every step, so a range query can still
+return somewhat more than $limit series over time; limitk() is cheaper for
+VictoriaMetrics as it does not sort, but keeps arbitrary series.
+
+Table panels rendering one row per sample (format 'table') are switched to
+instant queries, which only return the latest value of each series.
+
+Usage:
+    python add-cardinality-guards.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --function NAME         Guard function: topk or limitk (default: topk)
+    --levels LIST           Comma separated guarded cardinality levels (default: topic,subscription,consumer)
+    --full-detail REGEX     Never guard metrics whose name fully matches REGEX, can be repeated
+    --limits LIST           Comma separated values of the limit variable, the first is the default (default: 20,10,50,100)
+    --dry-run               Only print the report, do not modify any files
+    --check                 Like --dry-run, but exit with status 1 if any dashboard would be modified
+
+Output:
+    - Guarded targets with the labels they return one series per, and the
+      table panels switched to instant queries
+    - Summary of the targets guarded and dashboards modified
+"""
+
+import argparse
+import re
+import sys
+
+from dashboards import (default_dashboard_files, iter_panels, load_dashboard, matches_single_value, panel_label,
+                        panel_query_targets, template_variables_by_name, write_dashboard)
+from metric_catalog import TOPIC_LEVEL_KEYS, TOPIC_LEVELS, metric_level
+from promql import Aggregation, ParseError, VectorSelector, parse, walk_with_parents
+
+GUARD_FUNCTIONS = ('topk', 'limitk')
+LIMIT_VARIABLE = 'limit'
+DEFAULT_LIMITS = ['20', '10', '50', '100']
+
+TABLE_PANEL_TYPES = {'table', 'table-old'}
+
+
+def limit_variable(values):
+    """Return a custom template variable offering the limit values, the first one selected."""
+    return {
+        'current': {'selected': False, 'text': values[0], 'value': values[0]},
+        'description': 'Maximum number of series shown by per-topic and per-subscription panels',
+        'hide': 0,
+        'includeAll': False,
+        'label': 'Limit',
+        'multi': False,
+        'name': LIMIT_VARIABLE,
+        'options': [{'selected': value == values[0], 'text': value, 'value': value}
+                    for value in sorted(values, key=int)],
+        'query': ','.join(sorted(values, key=int)),
+        'skipUrlSync': False,
+        'type': 'custom',
+    }
+
+
+def unbounded_labels(expr, variables, levels, full_detail):
+    """
+    Return the labels of topic level entities a target returns one series per.
+
+    A selector of a guarded level returns one series per entity (topic,
+    subscription or consumer) unless its key labels (see TOPIC_LEVEL_KEYS in
+    metric_catalog.py) are matched to a single value, e.g. `topic="$topic"`, or
+    dropped by an enclosing aggregation, e.g. `sum by (namespace)`. Enclosing
+    topk(), bottomk() and limitk() aggregations already bound the result.
+
+    Args:
+        expr (str): The PromQL expression of the target
+        variables (dict): Template variables of the dashboard by name
+        levels (set): Guarded cardinality levels
+        full_detail (list): Compiled patterns of metric names that are never guarded
+
+    Returns:
+        list: The unbounded key labels, empty if the target needs no guard
+    """
+    try:
+        root = parse(expr)
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return []
+    unbounded = []
+    for node, parents in walk_with_parents(root):
+        if not isinstance(node, VectorSelector) or not node.metric_name:
+            continue
+        level = metric_level(node.metric_name)
+        if level not in levels or level not in TOPIC_LEVEL_KEYS:
+            continue
+        if any(pattern.fullmatch(node.metric_name) for pattern in full_detail):
+            continue
+        aggregations = [parent for parent in parents if isinstance(parent, Aggregation)]
+        if any(aggregation.op in ('topk', 'bottomk', 'limitk') for aggregation in aggregations):
+            continue
+        for label in TOPIC_LEVEL_KEYS[level]:
+            if any(m.name == label and matches_single_value(m, variables) for m in node.matchers):
+                continue
+            if all((label not in a.grouping) if a.without else (label in a.grouping) for a in aggregations):
+                if label not in unbounded:
+                    unbounded.append(label)
+    return unbounded
+
+
+def add_guards(dashboard, function, levels, full_detail, limits):
+    """
+    Guard the targets of a dashboard and switch its table panels to instant queries.
+
+    Args:
+        dashboard (dict): Dashboard, modified in place
+        function (str): Guard function, one of GUARD_FUNCTIONS
+        levels (set): Guarded cardinality levels
+        full_detail (list): Compiled patterns of metric names that are never guarded
+        limits (list): Values of the limit variable, the first is the default
+
+    Returns:
+        dict: Labels of the guarded targets with their unbounded key labels, the
+              table panels switched to instant queries and whether the limit
+              variable was added
+    """
+    variables = template_variables_by_name(dashboard)
+    result = {'guarded': [], 'instant_tables': [], 'variable_added': False}
+    for panel, _ in iter_panels(dashboard):
+        for target in panel_query_targets(panel):
+            labels = unbounded_labels(target['expr'], variables, levels, full_detail)
+            if labels:
+                target['expr'] = f"{function}(${LIMIT_VARIABLE}, {target['expr'].strip()})"
+                result['guarded'].append((f"{panel_label(panel)} ({target.get('refId', '?')})", labels))
+
+        if panel.get('type') in TABLE_PANEL_TYPES:
+            switched = False
+            for target in panel_query_targets(panel):
+                if target.get('format') == 'table' and not target.get('instant'):
+                    target['instant'] = True
+                    target['range'] = False
+                    switched = True
+            if switched:
+                result['instant_tables'].append(panel_label(panel))
+
+    if result['guarded'] and LIMIT_VARIABLE not in variables:
+        templating = dashboard.setdefault('templating', {})
+        templating.setdefault('list', []).append(limit_variable(limits))
+        result['variable_added'] = True
+    return result
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Cardinality Guards",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--function', choices=GUARD_FUNCTIONS, default='topk',
+                        help='Guard function, limitk requires VictoriaMetrics')
+    parser.add_argument('--levels', default=','.join(sorted(TOPIC_LEVELS)),
+                        help='Comma separated guarded cardinality levels')
+    parser.add_argument('--full-detail', metavar='REGEX', action='append', default=[],
+                        help='Never guard metrics whose name fully matches REGEX, can be repeated')
+    parser.add_argument('--limits', default=','.join(DEFAULT_LIMITS),
+                        help='Comma separated values of the limit variable, the first is the default')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any dashboard would be modified, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    write = not (args.dry_run or args.check)
+
+    levels = {level.strip() for level in args.levels.split(',') if level.strip()}
+    limits = [value.strip() for value in args.limits.split(',') if value.strip()]
+    try:
+        unknown = levels - set(TOPIC_LEVEL_KEYS)
+        if unknown:
+            raise ValueError(f"unknown cardinality levels: {', '.join(sorted(unknown))}")
+        if not limits or not all(value.isdigit() for value in limits):
+            raise ValueError(f"limits must be positive integers: '{args.limits}'")
+        full_detail = [re.compile(pattern) for pattern in args.full_detail]
+    except (ValueError, re.error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    guarded_targets = 0
+    instant_tables = 0
+    modified_files = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        result = add_guards(dashboard, args.function, levels, full_detail, limits)
+        if not result['guarded'] and not result['instant_tables']:
+            continue
+        print(f"- {file_path}:")
+        for label, keys in result['guarded']:
+            print(f"    guarded {label}: one series per {', '.join(keys)}")
+        for label in result['instant_tables']:
+            print(f"    instant table {label}")
+        if result['variable_added']:
+            print(f"    added the '{LIMIT_VARIABLE}' variable")
+        guarded_targets += len(result['guarded'])
+        instant_tables += len(result['instant_tables'])
+        modified_files += 1
+        if write:
+            write_dashboard(file_path, dashboard)
+
+    print(f"\nSummary:")
+    print(f"  Targets guarded with {args.function}(${LIMIT_VARIABLE}, ...): {guarded_targets}")
+    print(f"  Table panels switched to instant queries: {instant_tables}")
+    print(f"  Dashboards {'modified' if write else 'to modify'}: {modified_files}")
+
+    if args.check and modified_files:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
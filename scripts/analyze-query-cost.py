@@ -0,0 +1,282 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Query Cost Analyzer
+-----------------------------
+
+This script statically scores the expected TSDB cost of every panel target in
+Grafana dashboard JSON files, so that expensive queries can be found before a
+dashboard is deployed.
+
+Each target expression is parsed (see promql.py) and every selector is scored
+by the number of series it is expected to match in a reference fleet (see
+metric_catalog.py) multiplied by the number of raw samples read per series:
+1. Series estimates depend on the cardinality level of the metric (per pod,
+   per namespace, per topic, per subscription, ...), narrowed by label matchers
+   that select a single value, e.g. `topic="$topic"`
+2. Range windows read window / scrape interval samples per series
+
+The analyzer also flags known expensive patterns:
+- raw-high-cardinality-selector: topic/subscription level metric selected
+  without any aggregation, all series are returned to Grafana
+- unfiltered-selector: topic/subscription level metric selected without any
+  narrowing label matcher
+- regex-single-value-variable: regex matcher fed by a variable that is neither
+  multi-valued nor includeAll, an equality matcher would do
+- long-range-window: range window longer than the threshold
+- histogram-quantile-unaggregated: histogram_quantile over buckets that are not
+  pre-aggregated with sum by (le, ...)
+- histogram-quantile-missing-le: bucket aggregation that drops the 'le' label
+- unknown-metric: metric missing from metric_catalog.py, costed as an
+  instance-level metric
+
+Usage:
+    python analyze-query-cost.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are analyzed.
+
+Options:
+    --top N                        Number of most expensive targets to list (default: 20)
+    --json FILE                    Write the full machine-readable report to FILE ('-' for stdout)
+    --scrape-interval SECONDS      Scrape interval used to count samples in range windows (default: 30)
+    --long-range-threshold SECONDS Flag range windows longer than this (default: 300)
+
+Output:
+    - Ranked report of dashboards, panels and targets by estimated cost
+    - Optional JSON report with per-target costs and findings
+"""
+
+import argparse
+import json
+import sys
+
+from dashboards import (default_dashboard_files, is_single_variable_regex, iter_panels, load_dashboard,
+                        matches_single_value, panel_label, template_variables_by_name)
+from metric_catalog import REFERENCE_FLEET, TOPIC_LEVELS, estimate_series, is_known_metric, metric_level
+from promql import (Aggregation, Call, MatrixSelector, ParseError, SubqueryExpr, VectorSelector, parse,
+                    unwrap_parens, walk_with_parents)
+
+# Labels that do not narrow down the number of series in a meaningful way
+NON_NARROWING_LABELS = {'cluster', 'job', 'oxia_cluster', '__name__'}
+
+
+def _finding(check, severity, message):
+    return {'check': check, 'severity': severity, 'message': message}
+
+
+def analyze_expr(expr, variables, scrape_interval, long_range_threshold):
+    """
+    Score a single PromQL expression.
+
+    Args:
+        expr (str): The PromQL expression
+        variables (dict): Template variables of the dashboard by name
+        scrape_interval (int): Scrape interval in seconds
+        long_range_threshold (int): Range windows above this many seconds are flagged
+
+    Returns:
+        dict: cost, series and findings of the expression
+    """
+    result = {'cost': 0, 'series': 0, 'findings': []}
+    try:
+        root = parse(expr)
+    except ParseError as e:
+        result['findings'].append(_finding('parse-error', 'error', str(e)))
+        return result
+
+    findings = result['findings']
+    for node, parents in walk_with_parents(root):
+        if isinstance(node, VectorSelector):
+            metric = node.metric_name
+            exact_labels = [m.name for m in node.matchers if matches_single_value(m, variables)]
+            series = estimate_series(metric, exact_labels)
+
+            # Samples read per series depend on the enclosing range window
+            window = None
+            for parent in reversed(parents):
+                if isinstance(parent, (MatrixSelector, SubqueryExpr)):
+                    window = parent.range_seconds
+                    break
+            samples_per_series = max(1, int(window // scrape_interval)) if window else 1
+            result['series'] += series
+            result['cost'] += series * samples_per_series
+
+            level = metric_level(metric)
+            if metric and not is_known_metric(metric):
+                findings.append(_finding(
+                    'unknown-metric', 'info',
+                    f"metric '{metric}' is not in the metric catalog, ~{series} series are assumed"))
+            if level in TOPIC_LEVELS:
+                if not any(isinstance(parent, Aggregation) for parent in parents):
+                    findings.append(_finding(
+                        'raw-high-cardinality-selector', 'warning',
+                        f"{level}-level metric '{metric}' is not aggregated, ~{series} series are returned"))
+                narrowing = [m for m in node.matchers
+                             if m.name not in NON_NARROWING_LABELS and not m.is_negative]
+                if not narrowing:
+                    findings.append(_finding(
+                        'unfiltered-selector', 'warning',
+                        f"{level}-level metric '{metric}' is selected without a narrowing label matcher"))
+
+            for matcher in node.matchers:
+                if is_single_variable_regex(matcher, variables):
+                    findings.append(_finding(
+                        'regex-single-value-variable', 'info',
+                        f"{matcher.name}=~\"{matcher.value}\" uses a regex for a single-valued variable"))
+
+        elif isinstance(node, (MatrixSelector, SubqueryExpr)):
+            seconds = node.range_seconds
+            if seconds is not None and seconds > long_range_threshold:
+                findings.append(_finding(
+                    'long-range-window', 'warning',
+                    f"range window [{node.range}] reads ~{int(seconds // scrape_interval)} samples per series"))
+
+        elif isinstance(node, Call) and node.func == 'histogram_quantile' and len(node.args) == 2:
+            buckets = unwrap_parens(node.args[1])
+            if not isinstance(buckets, Aggregation):
+                findings.append(_finding(
+                    'histogram-quantile-unaggregated', 'warning',
+                    "histogram_quantile over buckets that are not aggregated with sum by (le, ...)"))
+            elif not buckets.without and 'le' not in buckets.grouping:
+                findings.append(_finding(
+                    'histogram-quantile-missing-le', 'error',
+                    f"bucket aggregation '{buckets.op}' drops the 'le' label"))
+
+    return result
+
+
+def analyze_dashboard(file_path, scrape_interval, long_range_threshold):
+    """
+    Score all panel targets of a dashboard file.
+
+    Returns:
+        dict: Dashboard report with per-panel and per-target costs
+    """
+    dashboard = load_dashboard(file_path)
+    variables = template_variables_by_name(dashboard)
+
+    report = {
+        'file': file_path,
+        'title': dashboard.get('title'),
+        'cost': 0,
+        'targets': 0,
+        'findings': 0,
+        'panels': [],
+    }
+    for panel, row in iter_panels(dashboard):
+        targets = [t for t in panel.get('targets') or []
+                   if isinstance(t, dict) and isinstance(t.get('expr'), str) and t['expr'].strip()]
+        if not targets:
+            continue
+        panel_report = {
+            'id': panel.get('id'),
+            'title': panel.get('title'),
+            'type': panel.get('type'),
+            'row': row.get('title') if row else None,
+            'cost': 0,
+            'targets': [],
+        }
+        for target in targets:
+            target_report = analyze_expr(target['expr'], variables, scrape_interval, long_range_threshold)
+            target_report = {'refId': target.get('refId'), 'expr': target['expr'], **target_report}
+            panel_report['targets'].append(target_report)
+            panel_report['cost'] += target_report['cost']
+            report['findings'] += len(target_report['findings'])
+        report['panels'].append(panel_report)
+        report['cost'] += panel_report['cost']
+        report['targets'] += len(targets)
+    return report
+
+
+def print_report(reports, top):
+    print(f"Reference fleet: {REFERENCE_FLEET['topics']} topics, {REFERENCE_FLEET['namespaces']} namespaces, "
+          f"{REFERENCE_FLEET['brokers']} brokers, scrape interval {REFERENCE_FLEET['scrape_interval']}s")
+    print("Cost unit: raw samples read per evaluation step")
+    print()
+
+    print("Dashboards by estimated cost:")
+    print(f"  {'cost':>12}  {'targets':>7}  {'findings':>8}  file")
+    for report in sorted(reports, key=lambda r: r['cost'], reverse=True):
+        print(f"  {report['cost']:>12,}  {report['targets']:>7}  {report['findings']:>8}  {report['file']}")
+    print()
+
+    panels = [(report, panel) for report in reports for panel in report['panels']]
+    print(f"Top {top} panels by estimated cost:")
+    for report, panel in sorted(panels, key=lambda p: p[1]['cost'], reverse=True)[:top]:
+        print(f"  {panel['cost']:>12,}  {report['file']}: {panel_label(panel)}")
+    print()
+
+    targets = [(report, panel, target) for report, panel in panels for target in panel['targets']]
+    print(f"Top {top} targets by estimated cost:")
+    for rank, (report, panel, target) in enumerate(
+            sorted(targets, key=lambda t: t[2]['cost'], reverse=True)[:top], start=1):
+        print(f"{rank:>3}. cost {target['cost']:,}, ~{target['series']:,} series - "
+              f"{report['file']}: {panel_label(panel)} ({target['refId']})")
+        print(f"       {' '.join(target['expr'].split())}")
+        for finding in target['findings']:
+            print(f"       - [{finding['severity']}] {finding['check']}: {finding['message']}")
+    print()
+
+    counts = {}
+    for _, _, target in targets:
+        for finding in target['findings']:
+            counts[finding['check']] = counts.get(finding['check'], 0) + 1
+    print("Findings:")
+    for check, count in sorted(counts.items(), key=lambda c: c[1], reverse=True):
+        print(f"  {count:>5}  {check}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Query Cost Analyzer",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to analyze (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--top', type=int, default=20,
+                        help='Number of most expensive panels and targets to list')
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write the full machine-readable report to FILE ('-' for stdout)")
+    parser.add_argument('--scrape-interval', type=int, default=REFERENCE_FLEET['scrape_interval'],
+                        help='Scrape interval in seconds used to count samples in range windows')
+    parser.add_argument('--long-range-threshold', type=int, default=300,
+                        help='Flag range windows longer than this many seconds')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    file_paths = args.files or default_dashboard_files()
+
+    reports = []
+    failed_count = 0
+    for file_path in file_paths:
+        try:
+            reports.append(analyze_dashboard(file_path, args.scrape_interval, args.long_range_threshold))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error processing '{file_path}': {e}. Skipping.", file=sys.stderr)
+            failed_count += 1
+
+    if args.json != '-':
+        print_report(reports, args.top)
+
+    if args.json:
+        output = {
+            'reference_fleet': REFERENCE_FLEET,
+            'scrape_interval': args.scrape_interval,
+            'long_range_threshold': args.long_range_threshold,
+            'dashboards': sorted(reports, key=lambda r: r['cost'], reverse=True),
+        }
+        if args.json == '-':
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(output, f, indent=2)
+            print(f"\nWrote JSON report to {args.json}")
+
+    if failed_count > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
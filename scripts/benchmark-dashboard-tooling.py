@@ -0,0 +1,397 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "pyyaml",
+# ]
+# ///
+"""
+Dashboard Tooling Benchmark
+---------------------------
+
+This script measures the wall time and the peak memory of the functions the
+release pipeline runs over every dashboard, so that regressions are caught
+before the dashboard corpus outgrows them:
+- process_dashboard()               cleanup-grafana-dashboards.py, in --check mode (nothing is written)
+- generate_uid()                    cleanup-grafana-dashboards.py
+- extract_metrics_from_dashboard()  extract-metric-names.py
+- generate_yaml_config()            generate-victoria-metrics-k8s-stack-values.py, with dashboard URLs
+                                    and with --bundle-configmaps
+
+Every benchmark runs over a corpus of dashboards:
+- real      the dashboards of this repository
+- 100       100 synthetic dashboards with 10k panels
+- 1k        1,000 synthetic dashboards with 100k panels
+
+Synthetic dashboards are copies of the real ones, in turn, whose panels are
+repeated (with new ids, titles and positions) up to the number of panels per
+dashboard, with a row every ROW_EVERY panels. They are written to a temporary
+directory with the same pulsar/ and oxia/ layout before anything is measured.
+
+Each benchmark is timed --repeat times with cold caches (the lru_cache of the
+PromQL parser is cleared before every run), and its peak memory is measured in
+one more run under tracemalloc, which slows the code down and is therefore not
+timed. Results are written as JSON, by default to build/benchmarks/<commit>.json,
+so that runs of different commits can be compared with --compare.
+
+Usage:
+    python benchmark-dashboard-tooling.py [options]
+
+Options:
+    --corpora LIST          Comma separated corpora to run (default: real,1k)
+    --benchmarks LIST       Comma separated benchmarks to run (default: all)
+    --repeat N              Timed runs per benchmark (default: 3)
+    --no-memory             Skip the peak memory run, which takes several times longer than a timed run
+    --output FILE           Results JSON file (default: build/benchmarks/<commit>.json)
+    --compare FILE          Results JSON file of a previous run to compare with
+    --max-regression PCT    With --compare, exit with status 1 if a best time or peak memory grew by more than PCT percent
+
+Output:
+    - Table of the best and median wall time and the peak memory per corpus and benchmark
+    - Comparison with the previous run when --compare is given
+"""
+
+import argparse
+import contextlib
+import copy
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import cycle
+
+from dashboards import REPO_ROOT, default_dashboard_files, iter_panels, load_dashboard, load_script, write_dashboard
+from promql import parse
+
+# Synthetic corpora: name -> (dashboards, panels in total)
+SYNTHETIC_CORPORA = {
+    '100': (100, 10_000),
+    '1k': (1_000, 100_000),
+}
+CORPORA = ['real'] + list(SYNTHETIC_CORPORA)
+DEFAULT_CORPORA = ['real', '1k']
+
+BENCHMARKS = ['process_dashboard', 'generate_uid', 'extract_metrics_from_dashboard', 'generate_yaml_config',
+              'generate_yaml_config_bundled']
+
+# A row panel is added every ROW_EVERY panels of a synthetic dashboard
+ROW_EVERY = 20
+
+RESULTS_VERSION = 1
+
+# Best times shorter than this are too noisy to be reported as regressions
+MIN_REGRESSION_SECONDS = 0.01
+
+
+def synthetic_dashboard(template, index, panel_count):
+    """
+    Return a synthetic dashboard made of the panels of a real one, repeated
+    up to panel_count panels.
+
+    Args:
+        template (dict): The real dashboard
+        index (int): Index of the synthetic dashboard, used in its title and UID
+        panel_count (int): Number of panels, rows excluded
+
+    Returns:
+        dict: The synthetic dashboard
+    """
+    dashboard = {key: copy.deepcopy(value) for key, value in template.items() if key != 'panels'}
+    dashboard['title'] = f"{template.get('title', 'Dashboard')} #{index}"
+    dashboard['uid'] = f"synthetic{index}"
+    sources = [panel for panel, _ in iter_panels(template) if panel.get('type') != 'row'] or [{'type': 'text'}]
+    panels = []
+    y = 0
+    for number, source in zip(range(panel_count), cycle(sources)):
+        if number % ROW_EVERY == 0:
+            panels.append({'type': 'row', 'title': f"Row {number // ROW_EVERY}", 'collapsed': False,
+                           'id': len(panels) + 1, 'gridPos': {'h': 1, 'w': 24, 'x': 0, 'y': y}, 'panels': []})
+            y += 1
+        panel = copy.deepcopy(source)
+        panel['id'] = len(panels) + 1
+        panel['title'] = f"{source.get('title', '')} #{number}"
+        panel['gridPos'] = {'h': 8, 'w': 12, 'x': 12 * (number % 2), 'y': y}
+        y += 8 * (number % 2)
+        panels.append(panel)
+    dashboard['panels'] = panels
+    return dashboard
+
+
+def write_synthetic_corpus(directory, templates, dashboard_count, panel_count):
+    """
+    Write a synthetic corpus into a directory, keeping the dashboard
+    directory of each template (pulsar/ or oxia/).
+
+    Args:
+        directory (str): The output directory
+        templates (list): (file path, dashboard) of the real dashboards
+        dashboard_count (int): Number of dashboards
+        panel_count (int): Number of panels in total, spread evenly over the dashboards
+
+    Returns:
+        list: Paths of the written dashboard files
+    """
+    file_paths = []
+    for index, (template_path, template) in zip(range(dashboard_count), cycle(templates)):
+        dashboard_panels = panel_count // dashboard_count + (1 if index < panel_count % dashboard_count else 0)
+        subdirectory = os.path.basename(os.path.dirname(os.path.abspath(template_path)))
+        name = os.path.splitext(os.path.basename(template_path))[0]
+        file_path = os.path.join(directory, subdirectory, f"{name}-{index}.json")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        write_dashboard(file_path, synthetic_dashboard(template, index, dashboard_panels))
+        file_paths.append(file_path)
+    return file_paths
+
+
+def benchmark_functions(file_paths, dashboards):
+    """
+    Return the benchmarks over a corpus.
+
+    Args:
+        file_paths (list): Paths of the dashboard files
+        dashboards (list): The parsed dashboards, in the order of file_paths
+
+    Returns:
+        dict: Benchmark name -> function running it over the whole corpus
+    """
+    cleanup = load_script('cleanup-grafana-dashboards')
+    extractor = load_script('extract-metric-names')
+    values = load_script('generate-victoria-metrics-k8s-stack-values')
+    project_id = cleanup.get_default_project_id()
+
+    def process_dashboards():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for file_path in file_paths:
+                cleanup.process_dashboard(file_path, project_id, True, True, cleanup.TOP_LEVEL_FIELDS,
+                                          cleanup.RECURSIVE_FIELDS, optimize_variables=True, point_budgets=True,
+                                          migrate_panels=True, write=False)
+
+    def generate_uids():
+        for file_path, dashboard in zip(file_paths, dashboards):
+            cleanup.generate_uid(file_path, dashboard, project_id)
+
+    def extract_metrics():
+        with contextlib.redirect_stderr(io.StringIO()):
+            for dashboard in dashboards:
+                extractor.extract_metrics_from_dashboard(dashboard)
+
+    return {
+        'process_dashboard': process_dashboards,
+        'generate_uid': generate_uids,
+        'extract_metrics_from_dashboard': extract_metrics,
+        'generate_yaml_config': lambda: values.generate_yaml_config(file_paths),
+        'generate_yaml_config_bundled': lambda: values.generate_yaml_config(file_paths, bundle_configmaps=True),
+    }
+
+
+def measure(function, repeat, memory=True):
+    """
+    Time a function with cold parser caches and measure its peak memory.
+
+    Args:
+        function (callable): The benchmark
+        repeat (int): Number of timed runs
+        memory (bool): Whether to measure the peak memory in one more run
+
+    Returns:
+        dict: Wall times of the runs, best and median wall time and peak memory
+              in bytes (None when not measured)
+    """
+    times = []
+    for _ in range(repeat):
+        parse.cache_clear()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        parse.cache_clear()
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        'runs_seconds': [round(t, 6) for t in times],
+        'best_seconds': round(min(times), 6),
+        'median_seconds': round(statistics.median(times), 6),
+        'peak_memory_bytes': peak,
+    }
+
+
+def git_revision():
+    """Return (commit, whether the working tree has changes), or (None, None) outside of a git checkout."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--', 'scripts'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_benchmarks(corpora, benchmarks, repeat, memory=True):
+    """
+    Run the benchmarks over the corpora.
+
+    Returns:
+        list: One result dict per corpus and benchmark
+    """
+    templates = [(file_path, load_dashboard(file_path)) for file_path in default_dashboard_files()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix='dashboard-benchmark-') as directory:
+        for corpus in corpora:
+            if corpus == 'real':
+                file_paths = [file_path for file_path, _ in templates]
+            else:
+                dashboard_count, panel_count = SYNTHETIC_CORPORA[corpus]
+                print(f"Writing the {corpus} corpus: {dashboard_count:,} dashboards, {panel_count:,} panels...",
+                      file=sys.stderr)
+                file_paths = write_synthetic_corpus(os.path.join(directory, corpus), templates,
+                                                    dashboard_count, panel_count)
+            dashboards = [load_dashboard(file_path) for file_path in file_paths]
+            panels = sum(1 for dashboard in dashboards for panel, _ in iter_panels(dashboard)
+                         if panel.get('type') != 'row')
+            functions = benchmark_functions(file_paths, dashboards)
+            for name in benchmarks:
+                print(f"Running {name} over the {corpus} corpus...", file=sys.stderr)
+                result = {'corpus': corpus, 'benchmark': name, 'dashboards': len(file_paths), 'panels': panels}
+                result.update(measure(functions[name], repeat, memory))
+                results.append(result)
+    return results
+
+
+def compare_results(previous, results):
+    """
+    Return the changes of the best wall time and the peak memory per corpus
+    and benchmark, in percent, for the benchmarks present in both runs. The
+    memory change is None when either run did not measure it.
+    """
+    before = {(r['corpus'], r['benchmark']): r for r in previous.get('results', [])}
+    changes = []
+    for result in results:
+        old = before.get((result['corpus'], result['benchmark']))
+        if old is None or not old['best_seconds']:
+            continue
+        memory_change = None
+        if old['peak_memory_bytes'] and result['peak_memory_bytes'] is not None:
+            memory_change = 100 * (result['peak_memory_bytes'] / old['peak_memory_bytes'] - 1)
+        changes.append((result['corpus'], result['benchmark'], old, result,
+                        100 * (result['best_seconds'] / old['best_seconds'] - 1), memory_change))
+    return changes
+
+
+def format_mebibytes(size):
+    """Format a size in bytes as MiB, or '-' when it was not measured."""
+    return '-' if size is None else f"{size / 2**20:.1f}"
+
+
+def parse_list(value, choices, option):
+    """Parse a comma separated list option, raising ValueError for unknown items."""
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in choices]
+    if unknown or not items:
+        raise ValueError(f"{option} must be a comma separated list of {', '.join(choices)}: '{value}'")
+    return items
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Tooling Benchmark",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--corpora', default=','.join(DEFAULT_CORPORA),
+                        help=f"Comma separated corpora to run: {', '.join(CORPORA)} (default: {','.join(DEFAULT_CORPORA)})")
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help='Comma separated benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timed runs per benchmark (default: 3)')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the peak memory run, which takes several times longer than a timed run')
+    parser.add_argument('--output',
+                        help='Results JSON file (default: build/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Results JSON file of a previous run to compare with')
+    parser.add_argument('--max-regression', type=float, metavar='PCT',
+                        help='With --compare, exit with status 1 if a best time or peak memory grew by more than PCT percent')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    try:
+        corpora = parse_list(args.corpora, CORPORA, '--corpora')
+        benchmarks = parse_list(args.benchmarks, BENCHMARKS, '--benchmarks')
+        if args.repeat < 1:
+            raise ValueError(f"--repeat must be at least 1: {args.repeat}")
+        previous = None
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as file:
+                previous = json.load(file)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    commit, dirty = git_revision()
+    results = run_benchmarks(corpora, benchmarks, args.repeat, not args.no_memory)
+    report = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    print(f"{'corpus':<8} {'benchmark':<32} {'dashboards':>10} {'panels':>8} {'best s':>9} {'median s':>9} {'peak MiB':>9}")
+    for r in results:
+        print(f"{r['corpus']:<8} {r['benchmark']:<32} {r['dashboards']:>10,} {r['panels']:>8,} "
+              f"{r['best_seconds']:>9.3f} {r['median_seconds']:>9.3f} {format_mebibytes(r['peak_memory_bytes']):>9}")
+
+    regressions = 0
+    if previous is not None:
+        print(f"\nCompared with {previous.get('commit') or args.compare}:")
+        for corpus, name, old, new, time_change, memory_change in compare_results(previous, results):
+            changes = [time_change] + ([memory_change] if memory_change is not None else [])
+            regressed = (args.max_regression is not None and max(changes) > args.max_regression
+                         and new['best_seconds'] >= MIN_REGRESSION_SECONDS)
+            regressions += regressed
+            memory = ''
+            if memory_change is not None:
+                memory = (f", peak {format_mebibytes(old['peak_memory_bytes'])} -> "
+                          f"{format_mebibytes(new['peak_memory_bytes'])} MiB ({memory_change:+.1f}%)")
+            print(f"  {corpus:<8} {name:<32} time {old['best_seconds']:.3f}s -> {new['best_seconds']:.3f}s "
+                  f"({time_change:+.1f}%){memory}{'  REGRESSION' if regressed else ''}")
+
+    output = args.output or os.path.join(REPO_ROOT, 'build', 'benchmarks',
+                                         f"{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+        file.write('\n')
+    print(f"\nResults written to {output}")
+
+    print(f"\nSummary:")
+    print(f"  Benchmarks run: {len(results)} over {len(corpora)} corpora")
+    print(f"  Total best time: {sum(r['best_seconds'] for r in results):.3f}s")
+    if previous is not None and args.max_regression is not None:
+        print(f"  Regressions over {args.max_regression:g}%: {regressions}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
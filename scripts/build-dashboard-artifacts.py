@@ -0,0 +1,92 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "zstandard",
+# ]
+# ///
+"""
+Dashboard Build Artifacts
+-------------------------
+
+This script builds compact artifacts of Grafana dashboard JSON files for
+provisioning: the dashboards in this repository are pretty-printed for review,
+which makes every Grafana pod download and parse several times the bytes it
+needs on startup.
+
+For each dashboard it writes:
+1. Canonical minified JSON (sorted keys, no whitespace)
+2. Precompressed .gz and .zst siblings of the minified JSON, for web servers
+   that serve precompressed files (e.g. nginx gzip_static, Caddy precompressed)
+3. A manifest.json with the size and SHA-256 checksum of every artifact
+
+Artifacts are only rewritten when their content changes. The manifest can be
+passed to generate-victoria-metrics-k8s-stack-values.py with --artifacts-manifest
+to point Grafana at the published artifacts.
+
+Usage:
+    python build-dashboard-artifacts.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are built.
+
+Options:
+    --output-dir DIR       Directory for the artifacts and manifest (default: build/dashboards)
+    --compressions LIST    Comma separated compression formats: gz, zst (default: gz,zst)
+
+Output:
+    - Minified and compressed artifacts and manifest.json in the output directory
+    - Size report of the source files and artifacts
+"""
+
+import argparse
+import json
+import sys
+
+from dashboard_artifacts import COMPRESSION_FORMATS, DEFAULT_OUTPUT_DIR, MANIFEST_NAME, build_artifacts
+from dashboards import default_dashboard_files
+
+
+def print_report(manifest, output_dir):
+    compressions = manifest['compressions']
+    print(f"{'source':>10} {'minified':>10}" + ''.join(f" {compression:>10}" for compression in compressions)
+          + "  dashboard")
+    totals = [0] * (2 + len(compressions))
+    for path, entry in sorted(manifest['dashboards'].items()):
+        sizes = [entry['source_size'], entry['size']] + [entry['compressed'][c]['size'] for c in compressions]
+        totals = [total + size for total, size in zip(totals, sizes)]
+        print(''.join(f"{size:>10,} " for size in sizes) + f" {path}")
+    print(''.join(f"{size:>10,} " for size in totals) + " total")
+    if totals[0]:
+        ratios = ', '.join(f"{name} {size / totals[0]:.1%}" for name, size
+                           in zip(['minified'] + compressions, totals[1:]))
+        print(f"Size relative to the source files: {ratios}")
+    print(f"Wrote {manifest['written']} changed files to {output_dir} ({MANIFEST_NAME} included)")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Build Artifacts",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to build (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR,
+                        help='Directory for the artifacts and manifest')
+    parser.add_argument('--compressions', default=','.join(COMPRESSION_FORMATS),
+                        help='Comma separated compression formats: gz, zst')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    compressions = [c.strip() for c in args.compressions.split(',') if c.strip()]
+    try:
+        manifest = build_artifacts(args.files or default_dashboard_files(), args.output_dir, compressions)
+    except (OSError, json.JSONDecodeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print_report(manifest, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
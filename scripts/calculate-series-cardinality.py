@@ -0,0 +1,282 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Series Cardinality Calculator
+---------------------------------------
+
+This script calculates how many series every panel target of Grafana dashboard
+JSON files matches in synthetic Pulsar and Oxia fleets of growing size, to
+predict which dashboards fall over at 10k, 100k and 1M topics without a live
+cluster.
+
+Each target expression is parsed (see promql.py) and the label matchers of
+every selector are evaluated against the series model of synthetic_fleet.py,
+the same model generate-synthetic-metrics.py writes fixtures from. Template
+variables are resolved to the worst case a user can select:
+1. Multi-valued and includeAll variables select 'All', i.e. every value
+   (or the allValue of the variable, when set)
+2. Single-valued variables select one value, the first value of the label in
+   the fleet, e.g. the first topic of the first namespace
+3. Unknown variables match every value
+
+Usage:
+    python calculate-series-cardinality.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are calculated.
+
+Options:
+    --scales LIST          Comma separated scales: 10k, 100k, 1M or numbers of topics (default: 10k,100k,1M)
+    --series-limit N       Flag targets matching more series than this (default: 300000)
+    --top N                Number of targets with the most series to list (default: 20)
+    --json FILE            Write the full machine-readable report to FILE ('-' for stdout)
+
+Output:
+    - Series per dashboard load at each scale and the number of targets over the limit
+    - Targets matching the most series at the largest scale
+    - Optional JSON report with per-target series counts
+"""
+
+import argparse
+import json
+import sys
+
+from dashboards import (collect_label_usage, default_dashboard_files, is_multi_valued, iter_panels,
+                        labels_by_metric, load_dashboard, panel_label, template_variables_by_name)
+from promql import (ParseError, VectorSelector, is_template_variable, parse, replace_template_variables,
+                    template_variables, walk)
+from synthetic_fleet import EXTRA_LABEL_VALUES, SCALES, SeriesModel, fleets_for_scales
+
+# VictoriaMetrics -search.maxUniqueTimeseries default
+DEFAULT_SERIES_LIMIT = 300_000
+
+
+def variable_samples(fleet):
+    """Values a single-valued variable stands for when it is only part of a matcher value."""
+    tenant, namespace = fleet.namespace_name(0).split('/')
+    return {
+        'cluster': fleet.cluster,
+        'tenant': tenant,
+        'namespace': namespace,
+        'topic': fleet.topic_name(0, 0),
+        'k8s_namespace': fleet.kubernetes_namespace,
+    }
+
+
+class Calculator:
+    """Counts selector series in one fleet, caching the series model of each metric."""
+
+    def __init__(self, fleet, metric_labels):
+        self.fleet = fleet
+        self.metric_labels = metric_labels
+        self.samples = variable_samples(fleet)
+        self._models = {}
+
+    def model(self, metric):
+        if metric not in self._models:
+            self._models[metric] = SeriesModel(self.fleet, metric, self.metric_labels.get(metric, ()))
+        return self._models[metric]
+
+    def resolve_matcher(self, matcher, variables, model):
+        """
+        Resolve the template variables of a matcher.
+
+        Returns:
+            tuple: (label, op, value) with the variables replaced
+        """
+        names = template_variables(matcher.value)
+        if not names:
+            return matcher.name, matcher.op, matcher.value
+
+        if any(is_multi_valued(variables.get(name)) for name in names):
+            # 'All' is selected
+            variable = variables.get(names[0])
+            all_value = variable.get('allValue') if variable and is_template_variable(matcher.value) else None
+            positive = matcher.op in ('=', '=~')
+            return matcher.name, '=~' if positive else '!~', all_value or '.+'
+
+        if is_template_variable(matcher.value):
+            value = model.first_value(matcher.name) or self.samples.get(names[0], '')
+            op = '=' if matcher.op in ('=', '=~') else '!='
+            return matcher.name, op, value
+
+        # Composite values, e.g. "$tenant/$namespace"
+        unknown = [name for name in names if name not in self.samples]
+        if unknown and matcher.op in ('=', '!='):
+            return matcher.name, '=~' if matcher.op == '=' else '!~', '.*'
+        value = replace_template_variables(matcher.value, lambda name: self.samples.get(name, '.*'))
+        return matcher.name, matcher.op, value
+
+    def count_expr(self, expr, variables):
+        """Return the number of series all selectors of an expression match, None if it does not parse."""
+        try:
+            root = parse(expr)
+        except ParseError:
+            return None
+        series = 0
+        for node in walk(root):
+            if isinstance(node, VectorSelector) and node.metric_name:
+                model = self.model(node.metric_name)
+                matchers = [self.resolve_matcher(m, variables, model)
+                            for m in node.matchers if m.name != '__name__']
+                series += model.count(matchers)
+        return series
+
+
+def calculate_dashboard(file_path, dashboard, calculators, series_limit):
+    """
+    Calculate the series of all panel targets of a dashboard at each scale.
+
+    Args:
+        file_path (str): Path of the dashboard file
+        dashboard (dict): The dashboard JSON object
+        calculators (dict): Calculator by scale name
+        series_limit (int): Targets matching more series are counted as over the limit
+
+    Returns:
+        dict: Dashboard report with per-panel and per-target series counts by scale
+    """
+    variables = template_variables_by_name(dashboard)
+    scales = list(calculators)
+
+    report = {
+        'file': file_path,
+        'title': dashboard.get('title'),
+        'series': dict.fromkeys(scales, 0),
+        'targets_over_limit': dict.fromkeys(scales, 0),
+        'parse_errors': 0,
+        'panels': [],
+    }
+    for panel, row in iter_panels(dashboard):
+        targets = [t for t in panel.get('targets') or []
+                   if isinstance(t, dict) and isinstance(t.get('expr'), str) and t['expr'].strip()]
+        if not targets:
+            continue
+        panel_report = {
+            'id': panel.get('id'),
+            'title': panel.get('title'),
+            'type': panel.get('type'),
+            'row': row.get('title') if row else None,
+            'series': dict.fromkeys(scales, 0),
+            'targets': [],
+        }
+        for target in targets:
+            target_report = {'refId': target.get('refId'), 'expr': target['expr'], 'series': {}}
+            for scale, calculator in calculators.items():
+                series = calculator.count_expr(target['expr'], variables)
+                if series is None:
+                    report['parse_errors'] += 1
+                    break
+                target_report['series'][scale] = series
+                panel_report['series'][scale] += series
+                if series > series_limit:
+                    report['targets_over_limit'][scale] += 1
+            panel_report['targets'].append(target_report)
+        for scale in scales:
+            report['series'][scale] += panel_report['series'][scale]
+        report['panels'].append(panel_report)
+    return report
+
+
+def print_report(reports, fleets, series_limit, top):
+    scales = list(fleets)
+    print("Fleets:")
+    for scale, fleet in fleets.items():
+        print(f"  {scale:>6}: {fleet.topics:,} topics, {fleet.namespaces:,} namespaces, {fleet.tenants:,} tenants, "
+              f"{fleet.brokers} brokers, {fleet.subscriptions_per_topic} subscriptions per topic")
+    print(f"Series limit per target: {series_limit:,}")
+    print()
+
+    largest = scales[-1]
+    print("Series per dashboard load (all targets, worst case variable selection):")
+    print('  ' + ''.join(f"{scale:>14}" for scale in scales) + f"  {'over limit':>10}  file")
+    for report in sorted(reports, key=lambda r: r['series'][largest], reverse=True):
+        over = report['targets_over_limit'][largest]
+        print('  ' + ''.join(f"{report['series'][scale]:>14,}" for scale in scales)
+              + f"  {over or '':>10}  {report['file']}")
+    print()
+
+    targets = [(report, panel, target) for report in reports for panel in report['panels']
+               for target in panel['targets'] if target['series']]
+    print(f"Top {top} targets by series at {largest}:")
+    for rank, (report, panel, target) in enumerate(
+            sorted(targets, key=lambda t: t[2]['series'][largest], reverse=True)[:top], start=1):
+        counts = ', '.join(f"{scale}: {target['series'][scale]:,}" for scale in scales)
+        print(f"{rank:>3}. {counts} - {report['file']}: {panel_label(panel)} ({target['refId']})")
+        print(f"       {' '.join(target['expr'].split())}")
+    print()
+
+    print("Targets over the series limit:")
+    for scale in scales:
+        dashboards = sum(1 for report in reports if report['targets_over_limit'][scale])
+        targets_over = sum(report['targets_over_limit'][scale] for report in reports)
+        print(f"  {scale:>6}: {targets_over} targets in {dashboards} dashboards")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Series Cardinality Calculator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to calculate (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--scales', default=','.join(SCALES),
+                        help='Comma separated scales: 10k, 100k, 1M or numbers of topics')
+    parser.add_argument('--series-limit', type=int, default=DEFAULT_SERIES_LIMIT,
+                        help='Flag targets matching more series than this')
+    parser.add_argument('--top', type=int, default=20,
+                        help='Number of targets with the most series to list')
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write the full machine-readable report to FILE ('-' for stdout)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    try:
+        fleets = fleets_for_scales([scale.strip() for scale in args.scales.split(',') if scale.strip()])
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    file_paths = args.files or default_dashboard_files()
+
+    dashboards = {}
+    failed_count = 0
+    for file_path in file_paths:
+        try:
+            dashboards[file_path] = load_dashboard(file_path)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error processing '{file_path}': {e}. Skipping.", file=sys.stderr)
+            failed_count += 1
+
+    # The series model of a metric depends on all labels it is known to have,
+    # so that counts agree with generate-synthetic-metrics.py
+    metric_labels = labels_by_metric(collect_label_usage(
+        [load_dashboard(file_path) for file_path in default_dashboard_files()] + list(dashboards.values())),
+        EXTRA_LABEL_VALUES)
+    calculators = {scale: Calculator(fleet, metric_labels) for scale, fleet in fleets.items()}
+
+    reports = [calculate_dashboard(file_path, dashboard, calculators, args.series_limit)
+               for file_path, dashboard in dashboards.items()]
+
+    if args.json != '-':
+        print_report(reports, fleets, args.series_limit, args.top)
+
+    if args.json:
+        output = {
+            'fleets': {scale: fleet.as_dict() for scale, fleet in fleets.items()},
+            'series_limit': args.series_limit,
+            'dashboards': sorted(reports, key=lambda r: r['series'][list(fleets)[-1]], reverse=True),
+        }
+        if args.json == '-':
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(output, f, indent=2)
+            print(f"\nWrote JSON report to {args.json}")
+
+    if failed_count > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,24 @@ This script combines multiple functions for Grafana dashboard JSON file manageme
 10. Standardizing template variable current values:
     - For variables with includeAll=true: set current to {"text": "All", "value": "$__all"}
     - For other variables: set current to an empty object {}
+11. Assigning per-panel data point budgets (optional):
+    - Single value panels (stat, gauge, bargauge, singlestat) that show the last
+      value get instant queries, others get a small maxDataPoints budget
+    - Time series panels (timeseries, graph) get maxDataPoints capped by the
+      expected number of series and a minimum interval of the scrape interval
+    - Reporting the worst-case number of data points per dashboard load
+12. Optimizing template variable queries (optional):
+    - Rewriting series queries with a label extracting regex into label_values(metric, label)
+    - Looking up label values from low-cardinality metrics instead of per-topic metrics
+    - Refreshing query variables on dashboard load instead of on every time range change
+    - Reporting variables whose lookups still touch per-topic metrics
+13. Migrating legacy Angular panels (optional):
+    - Graph panels become timeseries panels, with their axes, legend, tooltip,
+      stacking, thresholds, series overrides and alias colors mapped to options,
+      field config defaults and overrides
+    - Singlestat panels become stat panels (gauge panels when showing a gauge),
+      with their reducer, unit, thresholds, colors, sparkline and value mappings
+    - Reporting the settings that have no equivalent and could not be mapped
 
 The UID generation is based on a project identifier, the file path, and dashboard
 characteristics, ensuring:
@@ -35,10 +53,44 @@ Options:
     --remove-prometheus-datasources Remove all Prometheus datasource references and all datasource template variables
     --set-tags TAGS                Set dashboard tags to a comma-separated list of tags (e.g. "production,grafana,pulsar")
     --disable-points               Disable points on all time series panels by setting showPoints to "never"
+    --optimize-variables           Rewrite template variable queries into cheap, bounded label_values lookups
+    --point-budgets                Assign per-panel data point budgets and report the worst-case points per load
+    --scrape-interval SECONDS      Scrape interval the minimum panel interval is aligned to (default: 30)
+    --migrate-panels               Migrate graph panels to timeseries and singlestat panels to stat
+    --jobs N                       Number of files to process in parallel (default: number of CPUs)
+    --check                        Report files that would be modified and exit non-zero if any, without writing
+    --cache-file FILE              Cache of unchanged files (default: build/cleanup-cache.json)
+    --no-cache                     Process all files without reading or writing the cache (implied by the
+                                   report options --point-budgets, --optimize-variables, --migrate-panels,
+                                   --stats and --profile)
+    --stats                        Report the time spent in each processing phase
+    --profile                      Report the time spent on each file and the peak RSS
+    --profile-output FILE          Also write cProfile statistics to FILE (processes the files in a single process)
+    --stats-json FILE              Write the --stats and --profile reports as JSON to FILE
 
 Output:
     - Modified JSON files with removed fields and/or updated UIDs
     - Status report of processed files
+
+The recursive transforms (panel migration, datasource removal, disabling points
+and recursive field removal) are visitors applied in a single traversal of each dashboard,
+and files are processed in a pool of worker processes.
+
+Files whose content hash, path, options and script version match the cache
+from a previous run are known to be clean and are skipped without parsing.
+The cache is not used with the options that report on every file
+(--point-budgets, --optimize-variables, --migrate-panels, --stats and
+--profile), as skipped files would be missing from their reports.
+
+--stats reports the time spent in each phase, summed over the processed files:
+read, parse, top-level removal, uid, templating, defaults, each recursive
+transform (panel migration, datasource removal, points, point budgets,
+recursive removal), the traversal itself, and serialize and write for the
+files that are written. Timing every recursive transform separately slows the
+traversal down, so phases are only split with --stats. --profile reports the
+slowest files and the peak RSS of the worker processes, and with
+--profile-output the cProfile statistics for `python -m pstats`. Cached files
+are not processed and not included.
 """
 
 import json
@@ -46,6 +98,69 @@ import sys
 import os
 import hashlib
 import argparse
+import re
+import io
+import contextlib
+import time
+import cProfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from dashboards import estimate_result_series, template_variables_by_name
+from metric_catalog import DASHBOARD_COMPONENTS, family_for_metric, is_topic_level, label_source
+from promql import Call, ParseError, VectorSelector, duration_seconds, parse
+
+# Fields removed from every dashboard
+RECURSIVE_FIELDS = ['$$hashKey', '__requires', 'pluginVersion', '__inputs', 'prometheusLink']
+TOP_LEVEL_FIELDS = ['id', 'version', 'iteration', 'links', 'gnetId', 'liveNow', 'preload', 'timepicker', 'annotations']
+
+# Number of slowest files listed by --profile, the JSON report lists all
+PROFILE_TOP_FILES = 20
+
+# Matches variable regexes that extract a label value from the full series text,
+# e.g. /.*[^_]cluster=\"([^\"]+)\".*/
+SERIES_LABEL_REGEX = re.compile(r'/(?:\.\*)?(?:\[\^_\]|\\,)?([a-zA-Z_][a-zA-Z0-9_]*)=\\?"\(\[\^\\?"\]\+?\*?\)(?:\\?")?(?:\.\*)?/')
+
+# Refresh variable values on dashboard load
+VARIABLE_REFRESH_ON_LOAD = 1
+
+# Data point budgets: panels showing a single value, time series panels
+SINGLE_VALUE_PANEL_TYPES = {'stat', 'gauge', 'bargauge', 'singlestat'}
+TIME_SERIES_PANEL_TYPES = {'timeseries', 'graph'}
+SINGLE_VALUE_MAX_DATA_POINTS = 100
+# Points per time series panel, divided among its expected series
+TIME_SERIES_POINT_BUDGET = 100_000
+MIN_DATA_POINTS = 100
+MAX_DATA_POINTS = 1_000
+DEFAULT_SCRAPE_INTERVAL = 30
+# Worst-case points are reported for this time range (7 days) on a 1920 pixel wide screen
+REPORT_TIME_RANGE_SECONDS = 7 * 24 * 3600
+REPORT_SCREEN_WIDTH = 1920
+# Maximum number of points per series of a Prometheus range query
+MAX_POINTS_PER_SERIES = 11_000
+
+# Legacy panel migration: legend values and singlestat values to reducer ids
+LEGEND_CALCS = {'current': 'lastNotNull', 'avg': 'mean', 'min': 'min', 'max': 'max', 'total': 'sum'}
+# Legend sort keys to the display names of the reducers, which the timeseries legend sorts by
+LEGEND_SORT_NAMES = {'current': 'Last *', 'avg': 'Mean', 'min': 'Min', 'max': 'Max', 'total': 'Total'}
+SINGLESTAT_CALCS = dict(LEGEND_CALCS, first='firstNotNull', delta='delta', diff='diff', range='range')
+TOOLTIP_SORT = {0: 'none', 1: 'asc', 2: 'desc'}
+THRESHOLD_COLORS = {'critical': 'red', 'warning': 'orange', 'ok': 'green'}
+DEFAULT_SINGLESTAT_COLORS = ['rgba(245, 54, 54, 0.9)', 'rgba(237, 129, 40, 0.89)', 'rgba(50, 172, 45, 0.97)']
+# Settings of the legacy panels, removed after they are migrated
+GRAPH_PANEL_FIELDS = ['aliasColors', 'bars', 'dashLength', 'dashes', 'decimals', 'fill', 'fillGradient', 'grid',
+                      'hiddenSeries', 'instanceColors', 'legend', 'lines', 'linewidth', 'nullPointMode',
+                      'percentage', 'pointradius', 'points', 'renderer', 'seriesOverrides', 'spaceLength',
+                      'stack', 'steppedLine', 'thresholds', 'timeRegions', 'tooltip', 'xaxis', 'yaxes', 'yaxis']
+SINGLESTAT_PANEL_FIELDS = ['colorBackground', 'colorPostfix', 'colorPrefix', 'colorValue', 'colors', 'decimals',
+                           'format', 'gauge', 'mappingType', 'mappingTypes', 'nullPointMode', 'nullText', 'postfix',
+                           'postfixFontSize', 'prefix', 'prefixFontSize', 'rangeMaps', 'sparkline', 'tableColumn',
+                           'thresholds', 'valueFontSize', 'valueMaps', 'valueName']
 
 def generate_uid(file_path, dashboard_data, project_id):
     """
@@ -97,42 +212,6 @@ def generate_uid(file_path, dashboard_data, project_id):
     
     return uid
 
-def remove_recursive(obj, fields_to_remove):
-    """
-    Recursively removes specified fields from a JSON structure.
-    
-    Args:
-        obj: The JSON object or array to process
-        fields_to_remove: List of field names to remove
-    
-    Returns:
-        dict: Counts of removed fields by type
-    """
-    # Initialize removal counters
-    recursive_removals_count = {field: 0 for field in fields_to_remove}
-    
-    if isinstance(obj, dict):
-        # Remove all target fields if present
-        for field in fields_to_remove:
-            if field in obj:
-                del obj[field]
-                recursive_removals_count[field] += 1
-        
-        # Process all dict values
-        for key in list(obj.keys()):
-            sub_counts = remove_recursive(obj[key], fields_to_remove)
-            for field, count in sub_counts.items():
-                recursive_removals_count[field] += count
-    
-    elif isinstance(obj, list):
-        # Process all list items
-        for item in obj:
-            sub_counts = remove_recursive(item, fields_to_remove)
-            for field, count in sub_counts.items():
-                recursive_removals_count[field] += count
-    
-    return recursive_removals_count
-
 def remove_top_level_fields(dashboard, fields_to_remove):
     """
     Removes specific fields at the top level of the dashboard.
@@ -237,29 +316,197 @@ def set_default_values(dashboard, tags_list=None):
     
     return refresh_updated, time_updated, timezone_updated, tags_updated
 
-def remove_prometheus_datasources_recursive(obj):
+def optimize_template_variables(dashboard, file_path):
     """
-    Recursively removes Prometheus datasource fields and template variables.
+    Rewrites template variable queries into cheap, bounded label lookups:
+    - Series queries with a label extracting regex, e.g. 'pulsar_producers_count' with
+      regex '/.*[^_]cluster=\\"([^\\"]+)\\".*/', become 'label_values(metric, cluster)',
+      which is answered from the index instead of fetching every matching series
+    - Per-topic metrics are replaced with a low-cardinality metric of the same component
+      carrying the same labels, e.g. label_values(pulsar_version_info, cluster)
+    - Query variables are refreshed on dashboard load instead of on time range change,
+      which also re-runs the lookups on every auto-refresh
     
     Args:
-        obj: The JSON object or array to process
+        dashboard: The dashboard JSON object
+        file_path (str): Path to the dashboard file, used to determine the component
     
     Returns:
-        bool: True if any changes were made
+        tuple: (variables_optimized, per_topic_variables) where per_topic_variables
+               lists the names of variables whose lookups still touch per-topic metrics
     """
-    modified = False
+    variables_optimized = 0
+    per_topic_variables = []
+    
+    if not isinstance(dashboard.get('templating'), dict):
+        return variables_optimized, per_topic_variables
+    
+    dashboard_name = os.path.splitext(os.path.basename(file_path))[0]
     
-    if isinstance(obj, dict):
+    for variable in dashboard['templating'].get('list') or []:
+        if not isinstance(variable, dict) or variable.get('type') != 'query':
+            continue
+        
+        query = variable.get('query')
+        query_text = query.get('query') if isinstance(query, dict) else query
+        if not isinstance(query_text, str) or not query_text.strip():
+            continue
+        
+        try:
+            expr = parse(query_text)
+        except ParseError:
+            continue
+        
+        # Find the selector and the label that is looked up
+        regex_match = None
+        if isinstance(expr, Call) and expr.func == 'label_values' and len(expr.args) == 2 \
+                and isinstance(expr.args[0], VectorSelector) and isinstance(expr.args[1], VectorSelector):
+            selector, label = expr.args[0], expr.args[1].metric
+        elif isinstance(expr, VectorSelector) and isinstance(variable.get('regex'), str):
+            regex_match = SERIES_LABEL_REGEX.fullmatch(variable['regex'])
+            if not regex_match:
+                continue
+            selector, label = expr, regex_match.group(1)
+        else:
+            continue
+        
+        # Drop matchers that only require the looked up label to be present
+        matchers = [m for m in selector.matchers if not (m.name == label and m.value in ('.+', '.*'))]
+        
+        # Look up the label from a cheaper metric when the selector touches per-topic series
+        metric = selector.metric
+        if metric is None or is_topic_level(metric):
+            component = family_for_metric(metric).component if metric else DASHBOARD_COMPONENTS.get(dashboard_name)
+            source = label_source(component, label, [m.name for m in matchers])
+            if source:
+                metric = source
+        
+        matchers_text = ', '.join(query_text[m.start:m.end] for m in matchers)
+        selector_text = f"{metric or ''}{{{matchers_text}}}" if matchers or not metric else metric
+        new_query = f"label_values({selector_text}, {label})"
+        
+        changed = False
+        if new_query != query_text and (regex_match or metric != selector.metric):
+            if isinstance(query, dict):
+                query['query'] = new_query
+            else:
+                variable['query'] = new_query
+            variable['definition'] = new_query
+            if regex_match:
+                variable['regex'] = ''
+            changed = True
+        
+        if variable.get('refresh') != VARIABLE_REFRESH_ON_LOAD:
+            variable['refresh'] = VARIABLE_REFRESH_ON_LOAD
+            changed = True
+        
+        if changed:
+            variables_optimized += 1
+        
+        if metric is None or is_topic_level(metric):
+            per_topic_variables.append(variable.get('name'))
+    
+    return variables_optimized, per_topic_variables
+
+class DashboardVisitor(ABC):
+    """
+    Base class of the transforms that are applied to every JSON object of a
+    dashboard during a single traversal, see traverse_dashboard().
+    
+    Subclasses implement visit() to modify the object in place and keep their
+    own counters, a subclass without it cannot be instantiated. Fields removed
+    from an object are not traversed any further.
+    
+    Attributes:
+        phase (str): Name of the transform in the --stats phase timings
+    """
+    
+    phase = 'other'
+    
+    @abstractmethod
+    def visit(self, obj):
+        """
+        Visit a JSON object before its values are traversed.
+        
+        Args:
+            obj (dict): The JSON object to process
+        """
+
+def traverse_dashboard(obj, visitors, timings=None):
+    """
+    Traverses a JSON structure once, applying all visitors to every JSON object
+    in the given order before descending into its values.
+    
+    Args:
+        obj: The JSON object or array to process
+        visitors (list): DashboardVisitor instances to apply
+        timings (dict, optional): Seconds spent in each visitor by phase, updated
+            in place when given. Timing every visit slows the traversal down.
+    """
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            if timings is None:
+                for visitor in visitors:
+                    visitor.visit(current)
+            else:
+                for visitor in visitors:
+                    start = time.perf_counter()
+                    visitor.visit(current)
+                    timings[visitor.phase] = timings.get(visitor.phase, 0.0) + time.perf_counter() - start
+            values = list(current.values())
+        elif isinstance(current, list):
+            values = current
+        else:
+            continue
+        # Push in reverse so that values are visited in document order
+        stack.extend(value for value in reversed(values) if isinstance(value, (dict, list)))
+
+class FieldRemover(DashboardVisitor):
+    """
+    Removes specified fields from every JSON object.
+    
+    Attributes:
+        counts (dict): Counts of removed fields by field name
+    """
+    
+    phase = 'recursive removal'
+    
+    def __init__(self, fields_to_remove):
+        self.fields_to_remove = fields_to_remove
+        self.counts = {field: 0 for field in fields_to_remove}
+    
+    def visit(self, obj):
+        for field in self.fields_to_remove:
+            if field in obj:
+                del obj[field]
+                self.counts[field] += 1
+
+class PrometheusDatasourceRemover(DashboardVisitor):
+    """
+    Removes Prometheus datasource fields and datasource template variables.
+    
+    Attributes:
+        modified (bool): True if any changes were made
+    """
+    
+    phase = 'datasource removal'
+    
+    def __init__(self):
+        self.modified = False
+    
+    def visit(self, obj):
         # If this is a datasource object with type 'prometheus', mark for removal
         if 'datasource' in obj and isinstance(obj['datasource'], dict) and (obj['datasource'].get('type') == 'prometheus' or obj['datasource'].get('uid') == '${DataSource}'):
             del obj['datasource']
-            modified = True
-
+            self.modified = True
+        
         # If this is a field called 'datasource' and it's a string with value 'Prometheus' (ignore case), set it to null
         if 'datasource' in obj and isinstance(obj['datasource'], str) and obj['datasource'].lower() == 'prometheus':
             obj['datasource'] = None
-            modified = True
-       
+            self.modified = True
+        
         # Check for templating.list array and remove datasource template variables
         if 'templating' in obj and isinstance(obj['templating'], dict) and 'list' in obj['templating'] and isinstance(obj['templating']['list'], list):
             templating_list = obj['templating']['list']
@@ -268,20 +515,571 @@ def remove_prometheus_datasources_recursive(obj):
             obj['templating']['list'] = [item for item in templating_list if not (isinstance(item, dict) and item.get('type') == 'datasource')]
             # Check if any items were removed
             if len(obj['templating']['list']) < original_length:
-                modified = True
+                self.modified = True
+
+class PointsDisabler(DashboardVisitor):
+    """
+    Disables points on time series panels by setting showPoints to "never".
+    
+    Attributes:
+        panels_modified (int): Count of panels modified
+    """
+    
+    phase = 'points'
+    
+    def __init__(self):
+        self.panels_modified = 0
+    
+    def visit(self, obj):
+        if obj.get('type') != 'timeseries':
+            return
+        custom = obj.setdefault('fieldConfig', {}).setdefault('defaults', {}).setdefault('custom', {})
+        if custom.get('showPoints') != 'never':
+            custom['showPoints'] = 'never'
+            self.panels_modified += 1
+
+class PointBudgetAssigner(DashboardVisitor):
+    """
+    Assigns data point budgets to the panels of a dashboard:
+    - Single value panels reducing to the last value get instant queries, which
+      return one point per series; other single value panels get a small
+      maxDataPoints budget
+    - Time series panels get maxDataPoints capped so that all their expected
+      series together stay within TIME_SERIES_POINT_BUDGET, and a minimum
+      interval of the scrape interval, as smaller steps only repeat samples.
+      Minimum intervals set to a template variable (e.g. $interval) are kept.
+    
+    Attributes:
+        panels_updated (int): Count of panels whose budget was changed
+        points_before (int): Worst-case points per dashboard load before the change
+        points_after (int): Worst-case points per dashboard load after the change
+    """
+    
+    phase = 'point budgets'
+    
+    def __init__(self, variables, scrape_interval=DEFAULT_SCRAPE_INTERVAL):
+        self.variables = variables
+        self.scrape_interval = scrape_interval
+        self.panels_updated = 0
+        self.points_before = 0
+        self.points_after = 0
+    
+    def visit(self, obj):
+        if not isinstance(obj.get('targets'), list) or obj.get('type') not in SINGLE_VALUE_PANEL_TYPES | TIME_SERIES_PANEL_TYPES:
+            return
+        targets = [t for t in obj['targets'] if isinstance(t, dict) and isinstance(t.get('expr'), str) and t['expr'].strip() and not t.get('hide')]
+        series = [self.expected_series(target['expr']) for target in targets]
+        self.points_before += self.panel_points(obj, targets, series)
         
-        # Continue traversing all dictionary values
-        for key in list(obj.keys()):
-            if remove_prometheus_datasources_recursive(obj[key]):
-                modified = True
+        changed = False
+        if obj['type'] in SINGLE_VALUE_PANEL_TYPES:
+            if shows_last_value(obj):
+                for target in targets:
+                    if not target.get('instant') or target.get('range') is not False:
+                        target['instant'] = True
+                        target['range'] = False
+                        changed = True
+            max_data_points = SINGLE_VALUE_MAX_DATA_POINTS
+        else:
+            budget = TIME_SERIES_POINT_BUDGET // max(1, sum(series))
+            max_data_points = max(MIN_DATA_POINTS, min(MAX_DATA_POINTS, budget))
+            # Panels without a minimum interval get the scrape interval, literal ones below it are
+            # raised to it, and variable intervals (e.g. $interval) chosen by the user are kept
+            interval = obj.get('interval') or None
+            seconds = duration_seconds(interval)
+            if interval is None or (seconds is not None and seconds < self.scrape_interval):
+                obj['interval'] = f"{self.scrape_interval}s"
+                changed = True
+        
+        # Budgets only ever lower the points requested today
+        max_data_points = min(max_data_points, effective_max_data_points(obj))
+        if obj.get('maxDataPoints') != max_data_points:
+            obj['maxDataPoints'] = max_data_points
+            changed = True
+        
+        if changed:
+            self.panels_updated += 1
+        self.points_after += self.panel_points(obj, targets, series)
+    
+    def expected_series(self, expr):
+        try:
+            return estimate_result_series(parse(expr), self.variables)
+        except ParseError:
+            return 1
+    
+    def panel_points(self, panel, targets, series):
+        """Return the worst-case points the targets of a panel return over REPORT_TIME_RANGE_SECONDS."""
+        max_data_points = effective_max_data_points(panel)
+        interval = duration_seconds(panel.get('interval') or None) or 1
+        points_per_series = min(max_data_points, REPORT_TIME_RANGE_SECONDS // interval, MAX_POINTS_PER_SERIES)
+        return sum(count if target.get('instant') and not target.get('range') else count * points_per_series
+                   for target, count in zip(targets, series))
+
+def effective_max_data_points(panel):
+    """
+    Return the maxDataPoints Grafana queries a panel with: the panel setting, or
+    one point per pixel of the panel width on a REPORT_SCREEN_WIDTH wide screen.
+    
+    Args:
+        panel (dict): The panel JSON object
+    
+    Returns:
+        int: Maximum number of data points per series
+    """
+    if panel.get('maxDataPoints'):
+        return panel['maxDataPoints']
+    width = (panel.get('gridPos') or {}).get('w', 24)
+    return REPORT_SCREEN_WIDTH * width // 24
+
+def shows_last_value(panel):
+    """
+    Whether a single value panel only shows the last value of each series,
+    so that an instant query returns everything it needs.
+    
+    Args:
+        panel (dict): The panel JSON object
+    
+    Returns:
+        bool: False for panels reducing over the time range or drawing a sparkline
+    """
+    options = panel.get('options') or {}
+    if panel.get('type') == 'singlestat':
+        return panel.get('valueName', 'avg') == 'current' and not (panel.get('sparkline') or {}).get('show')
+    # Stat panels draw a sparkline by default
+    if panel.get('type') == 'stat' and options.get('graphMode', 'area') != 'none':
+        return False
+    calcs = (options.get('reduceOptions') or {}).get('calcs') or ['lastNotNull']
+    return all(calc in ('last', 'lastNotNull') for calc in calcs)
+
+def _axis_number(value):
+    """Return an axis or gauge bound as a number, None if it is not set or not a number."""
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+def _sorted_dict(obj):
+    """Reorder the keys of a dict in place alphabetically, like Grafana saves panels."""
+    items = sorted(obj.items())
+    obj.clear()
+    obj.update(items)
+    return obj
+
+def _override(matcher_id, matcher_options, properties):
+    return {
+        'matcher': {'id': matcher_id, 'options': matcher_options},
+        'properties': [{'id': key, 'value': value} for key, value in properties]
+    }
+
+def _series_matcher(alias):
+    # Aliases between slashes are regular expressions, e.g. /.*-in/
+    if len(alias) > 1 and alias.startswith('/') and alias.endswith('/'):
+        return 'byRegexp', alias[1:-1]
+    return 'byName', alias
+
+def _field_config(panel):
+    """Return the defaults and overrides of the field config of a panel, creating them if needed."""
+    field_config = panel.get('fieldConfig') if isinstance(panel.get('fieldConfig'), dict) else {}
+    field_config = {'defaults': field_config.get('defaults') or {}, 'overrides': field_config.get('overrides') or []}
+    panel['fieldConfig'] = field_config
+    return field_config['defaults'], field_config['overrides']
+
+def _axis_properties(axis, unmapped, name):
+    """Return (property, value) pairs of the unit, bounds, label and scale of a graph y-axis."""
+    properties = []
+    if axis.get('format'):
+        properties.append(('unit', axis['format']))
+    for bound in ('min', 'max'):
+        value = _axis_number(axis.get(bound))
+        if value is not None:
+            properties.append((bound, value))
+        elif axis.get(bound) not in (None, ''):
+            unmapped.append(f"{name} y-axis {bound} '{axis[bound]}'")
+    if axis.get('decimals') is not None:
+        properties.append(('decimals', axis['decimals']))
+    if axis.get('label'):
+        properties.append(('custom.axisLabel', axis['label']))
+    log_base = axis.get('logBase') or 1
+    properties.append(('custom.scaleDistribution', {'log': log_base, 'type': 'log'} if log_base > 1 else {'type': 'linear'}))
+    return properties
+
+def _series_override_properties(key, value, right_axis, percentage):
+    """
+    Return the (property, value) pairs of a setting of a graph series override,
+    or None if the setting has no timeseries equivalent.
+    """
+    if key == 'yaxis':
+        return right_axis if value == 2 else []
+    if key == 'color':
+        return [('color', {'fixedColor': value, 'mode': 'fixed'})]
+    if key == 'fill':
+        return [('custom.fillOpacity', value * 10)]
+    if key == 'fillGradient':
+        return [('custom.gradientMode', 'opacity' if value else 'none')]
+    if key == 'linewidth':
+        return [('custom.lineWidth', value)]
+    if key == 'lines':
+        return [('custom.drawStyle', 'line')] if value else [('custom.lineWidth', 0)]
+    if key == 'bars':
+        return [('custom.drawStyle', 'bars' if value else 'line')]
+    if key == 'points':
+        return [('custom.showPoints', 'always' if value else 'never')]
+    if key == 'pointradius':
+        return [('custom.pointSize', 2 + value * 2)]
+    if key == 'steppedLine':
+        return [('custom.lineInterpolation', 'stepAfter' if value else 'linear')]
+    if key == 'dashes':
+        return [('custom.lineStyle', {'dash': [10, 10], 'fill': 'dash'} if value else {'fill': 'solid'})]
+    if key == 'stack':
+        if value is False:
+            return [('custom.stacking', {'group': 'A', 'mode': 'none'})]
+        group = value if isinstance(value, str) else 'A'
+        return [('custom.stacking', {'group': group, 'mode': 'percent' if percentage else 'normal'})]
+    if key == 'transform' and value == 'negative-Y':
+        return [('custom.transform', 'negative-Y')]
+    return None
+
+def _threshold_color(threshold):
+    if threshold.get('colorMode') == 'custom':
+        return threshold.get('lineColor') or threshold.get('fillColor') or 'red'
+    return THRESHOLD_COLORS.get(threshold.get('colorMode'), 'red')
+
+def _graph_thresholds(panel, defaults, custom, unmapped):
+    """Map the thresholds of a graph panel to threshold steps drawn as lines and areas."""
+    thresholds = [t for t in panel.get('thresholds') or [] if isinstance(t, dict) and _axis_number(t.get('value')) is not None]
+    if not thresholds:
+        return
+    colors = [(_axis_number(t['value']), _threshold_color(t)) for t in thresholds]
+    ops = {t.get('op', 'gt') for t in thresholds}
+    if ops == {'gt'}:
+        steps = [{'color': 'transparent', 'value': None}]
+        steps += [{'color': color, 'value': value} for value, color in sorted(colors)]
+    elif len(thresholds) == 1:
+        value, color = colors[0]
+        steps = [{'color': color, 'value': None}, {'color': 'transparent', 'value': value}]
+    else:
+        unmapped.append("thresholds mixing 'gt' and 'lt'")
+        return
+    defaults['thresholds'] = {'mode': 'absolute', 'steps': steps}
+    fill = any(t.get('fill') for t in thresholds)
+    line = any(t.get('line') for t in thresholds)
+    custom['thresholdsStyle'] = {'mode': 'line+area' if fill and line else 'area' if fill else 'line' if line else 'off'}
+    if any(t.get('yaxis') == 'right' for t in thresholds):
+        unmapped.append('thresholds of the right y-axis, drawn on the left y-axis')
+
+def migrate_graph_panel(panel):
+    """
+    Convert a legacy Angular graph panel in place into a timeseries panel,
+    mapping its axes, legend, tooltip, draw style, stacking, thresholds, series
+    overrides and alias colors.
+    
+    Args:
+        panel (dict): The graph panel JSON object
+    
+    Returns:
+        list: Descriptions of the settings that could not be mapped
+    """
+    unmapped = []
+    defaults, overrides = _field_config(panel)
+    custom = defaults.setdefault('custom', {})
+    yaxes = [axis if isinstance(axis, dict) else {} for axis in panel.get('yaxes') or []] + [{}, {}]
+    left_axis, right_axis = yaxes[0], yaxes[1]
+    
+    # Draw style
+    if panel.get('bars'):
+        custom['drawStyle'] = 'bars'
+        if panel.get('lines'):
+            unmapped.append('lines drawn together with bars')
+    elif panel.get('lines', True) or not panel.get('points'):
+        custom['drawStyle'] = 'line'
+    else:
+        custom['drawStyle'] = 'points'
+    custom['lineWidth'] = panel.get('linewidth', 1)
+    custom['fillOpacity'] = panel.get('fill', 1) * 10
+    custom['gradientMode'] = 'opacity' if panel.get('fillGradient') else 'none'
+    custom['lineInterpolation'] = 'stepAfter' if panel.get('steppedLine') else 'linear'
+    if panel.get('dashes'):
+        custom['lineStyle'] = {'dash': [panel.get('dashLength', 10), panel.get('spaceLength', 10)], 'fill': 'dash'}
+    custom['showPoints'] = 'always' if panel.get('points') else 'never'
+    if isinstance(panel.get('pointradius'), (int, float)):
+        custom['pointSize'] = 2 + panel['pointradius'] * 2
+    
+    null_point_mode = panel.get('nullPointMode', 'null')
+    custom['spanNulls'] = null_point_mode == 'connected'
+    if null_point_mode not in ('null', 'connected'):
+        unmapped.append(f"null point mode '{null_point_mode}', shown as gaps")
+    
+    # Stacking
+    stack_mode = ('percent' if panel.get('percentage') else 'normal') if panel.get('stack') else 'none'
+    custom['stacking'] = {'group': 'A', 'mode': stack_mode}
+    if panel.get('percentage') and not panel.get('stack'):
+        unmapped.append('percentage without stacking')
+    
+    # The left y-axis applies to all series, the right y-axis to the series overridden to it
+    for key, value in _axis_properties(left_axis, unmapped, 'left'):
+        if key.startswith('custom.'):
+            custom[key[len('custom.'):]] = value
+        else:
+            defaults[key] = value
+    if panel.get('decimals') is not None:
+        defaults['decimals'] = panel['decimals']
+    custom['axisPlacement'] = 'auto' if left_axis.get('show', True) else 'hidden'
+    right_axis_properties = [('custom.axisPlacement', 'right' if right_axis.get('show', True) else 'hidden')]
+    right_axis_properties += _axis_properties(right_axis, unmapped, 'right')
+    if (panel.get('yaxis') or {}).get('align'):
+        unmapped.append('aligned y-axes')
+    
+    # Legend and tooltip
+    legend = panel.get('legend') or {}
+    options = panel.get('options') if isinstance(panel.get('options'), dict) else {}
+    calcs = [calc for key, calc in LEGEND_CALCS.items() if legend.get(key)] if legend.get('values') else []
+    legend_options = {
+        'calcs': calcs,
+        'displayMode': 'table' if legend.get('alignAsTable') else 'list',
+        'placement': 'right' if legend.get('rightSide') else 'bottom',
+        'showLegend': legend.get('show', True)
+    }
+    if legend.get('rightSide') and legend.get('sideWidth'):
+        legend_options['width'] = legend['sideWidth']
+    if calcs and legend.get('sort') in LEGEND_SORT_NAMES:
+        legend_options['sortBy'] = LEGEND_SORT_NAMES[legend['sort']]
+        legend_options['sortDesc'] = bool(legend.get('sortDesc'))
+    for key in ('hideEmpty', 'hideZero'):
+        if legend.get(key):
+            unmapped.append(f"legend option '{key}'")
+    tooltip = panel.get('tooltip') or {}
+    tooltip_options = {'mode': 'multi' if tooltip.get('shared', True) else 'single',
+                       'sort': TOOLTIP_SORT.get(tooltip.get('sort', 0), 'none')}
+    if tooltip.get('value_type', 'individual') != 'individual':
+        unmapped.append(f"tooltip value type '{tooltip['value_type']}'")
+    if options.get('dataLinks'):
+        defaults['links'] = (defaults.get('links') or []) + options['dataLinks']
+    panel['options'] = {'legend': legend_options, 'tooltip': tooltip_options}
+    
+    # Thresholds
+    _graph_thresholds(panel, defaults, custom, unmapped)
+    
+    # Series overrides and alias colors
+    for override in panel.get('seriesOverrides') or []:
+        if not isinstance(override, dict) or not override:
+            continue
+        alias = override.get('alias')
+        if not isinstance(alias, str) or not alias:
+            unmapped.append(f"series override without alias {json.dumps(override, sort_keys=True)}")
+            continue
+        properties = []
+        hide_from = {}
+        for key, value in override.items():
+            if key == 'alias':
+                continue
+            if key in ('legend', 'hideTooltip', 'hideSeries'):
+                hide_from[{'legend': 'legend', 'hideTooltip': 'tooltip', 'hideSeries': 'viz'}[key]] = (
+                    not value if key == 'legend' else bool(value))
+                continue
+            mapped = _series_override_properties(key, value, right_axis_properties, panel.get('percentage'))
+            if mapped is None:
+                unmapped.append(f"series override '{key}' of '{alias}'")
+            else:
+                properties.extend(mapped)
+        if any(hide_from.values()):
+            properties.append(('custom.hideFrom', dict({'legend': False, 'tooltip': False, 'viz': False}, **hide_from)))
+        if properties:
+            overrides.append(_override(*_series_matcher(alias), properties))
+    for alias, color in (panel.get('aliasColors') or {}).items():
+        overrides.append(_override('byName', alias, [('color', {'fixedColor': color, 'mode': 'fixed'})]))
+    
+    # Settings without an equivalent
+    if panel.get('timeRegions'):
+        unmapped.append('time regions')
+    if (panel.get('xaxis') or {}).get('mode', 'time') != 'time':
+        unmapped.append(f"x-axis mode '{panel['xaxis']['mode']}'")
+    if any(value is not None for value in (panel.get('grid') or {}).values()):
+        unmapped.append('grid thresholds')
+    if panel.get('instanceColors'):
+        unmapped.append('instance colors')
+    
+    defaults.setdefault('color', {'mode': 'palette-classic'})
+    _sorted_dict(custom)
+    _sorted_dict(defaults)
+    for field in GRAPH_PANEL_FIELDS:
+        panel.pop(field, None)
+    panel['type'] = 'timeseries'
+    _sorted_dict(panel)
+    return unmapped
+
+def _singlestat_mappings(panel, unmapped):
+    """Map the value or range to text mappings of a singlestat panel to value mappings."""
+    range_maps = panel.get('mappingType', 1) == 2
+    mappings = []
+    for index, mapping in enumerate((panel.get('rangeMaps') if range_maps else panel.get('valueMaps')) or []):
+        result = {'index': index, 'text': mapping.get('text', '')}
+        if range_maps:
+            low, high = mapping.get('from'), mapping.get('to')
+            if low == 'null' and high == 'null':
+                mappings.append({'options': {'match': 'null', 'result': result}, 'type': 'special'})
+            elif _axis_number(low) is not None or _axis_number(high) is not None:
+                mappings.append({'options': {'from': _axis_number(low), 'result': result, 'to': _axis_number(high)},
+                                 'type': 'range'})
+            else:
+                unmapped.append(f"range mapping from '{low}' to '{high}'")
+        elif mapping.get('op', '=') != '=':
+            unmapped.append(f"value mapping with operator '{mapping['op']}'")
+        elif mapping.get('value') == 'null':
+            mappings.append({'options': {'match': 'null', 'result': result}, 'type': 'special'})
+        else:
+            mappings.append({'options': {str(mapping.get('value')): result}, 'type': 'value'})
+    return mappings
+
+def migrate_singlestat_panel(panel):
+    """
+    Convert a legacy Angular singlestat panel in place into a stat panel, or a
+    gauge panel when it shows a gauge, mapping its reducer, unit, thresholds,
+    colors, sparkline and value mappings.
+    
+    Args:
+        panel (dict): The singlestat panel JSON object
+    
+    Returns:
+        list: Descriptions of the settings that could not be mapped
+    """
+    unmapped = []
+    defaults, _ = _field_config(panel)
+    gauge = panel.get('gauge') or {}
+    sparkline = panel.get('sparkline') or {}
+    
+    value_name = panel.get('valueName', 'avg')
+    calc = SINGLESTAT_CALCS.get(value_name)
+    if calc is None:
+        unmapped.append(f"value '{value_name}', showing the last value")
+        calc = 'lastNotNull'
+    reduce_options = {'calcs': [calc], 'fields': '', 'values': False}
+    
+    # Prefix and postfix are only kept as a custom unit of values without a unit
+    unit = panel.get('format') or 'none'
+    prefix, postfix = panel.get('prefix') or '', panel.get('postfix') or ''
+    if unit in ('none', 'short') and bool(prefix) != bool(postfix):
+        unit = f"prefix:{prefix}" if prefix else f"suffix:{postfix}"
+    else:
+        for name, text in (('prefix', prefix), ('postfix', postfix)):
+            if text:
+                unmapped.append(f"{name} '{text}'")
+    defaults['unit'] = unit
+    if panel.get('decimals') is not None:
+        defaults['decimals'] = panel['decimals']
+    if panel.get('nullText'):
+        defaults['noValue'] = panel['nullText']
+    
+    # Threshold values separate the colors, e.g. "80,90" with three colors
+    colors = panel.get('colors') or DEFAULT_SINGLESTAT_COLORS
+    steps = [{'color': colors[0], 'value': None}]
+    for index, value in enumerate(str(panel.get('thresholds') or '').split(',')):
+        if not value.strip():
+            continue
+        if _axis_number(value) is None:
+            unmapped.append(f"threshold '{value.strip()}'")
+            continue
+        steps.append({'color': colors[min(index + 1, len(colors) - 1)], 'value': _axis_number(value)})
+    defaults['thresholds'] = {'mode': 'absolute', 'steps': steps}
+    defaults['color'] = {'mode': 'thresholds'}
+    mappings = _singlestat_mappings(panel, unmapped)
+    if mappings:
+        defaults['mappings'] = (defaults.get('mappings') or []) + mappings
+    
+    if gauge.get('show'):
+        panel['type'] = 'gauge'
+        for bound, key in (('min', 'minValue'), ('max', 'maxValue')):
+            if _axis_number(gauge.get(key)) is not None:
+                defaults[bound] = _axis_number(gauge[key])
+        panel['options'] = {
+            'orientation': 'auto',
+            'reduceOptions': reduce_options,
+            'showThresholdLabels': bool(gauge.get('thresholdLabels')),
+            'showThresholdMarkers': bool(gauge.get('thresholdMarkers', True))
+        }
+        if sparkline.get('show'):
+            unmapped.append('sparkline of a gauge')
+    else:
+        panel['type'] = 'stat'
+        color_mode = 'background' if panel.get('colorBackground') else 'value' if panel.get('colorValue') else 'none'
+        panel['options'] = {
+            'colorMode': color_mode,
+            'graphMode': 'area' if sparkline.get('show') else 'none',
+            'justifyMode': 'auto',
+            'orientation': 'horizontal',
+            'reduceOptions': reduce_options,
+            'textMode': 'auto'
+        }
+        for bound in ('min', 'max'):
+            if sparkline.get('show') and _axis_number(sparkline.get(f"y{bound}")) is not None:
+                defaults[bound] = _axis_number(sparkline[f"y{bound}"])
+    if panel.get('tableColumn'):
+        unmapped.append(f"table column '{panel['tableColumn']}'")
+    
+    _sorted_dict(defaults)
+    for field in SINGLESTAT_PANEL_FIELDS:
+        panel.pop(field, None)
+    _sorted_dict(panel)
+    return unmapped
+
+class PanelMigrator(DashboardVisitor):
+    """
+    Migrates panels of the deprecated Angular panel types, which Grafana renders
+    much slower and migrates on every load, to their replacements: graph panels
+    to timeseries, singlestat panels to stat (or gauge).
+    
+    Attributes:
+        panels_migrated (int): Count of migrated panels
+        unmapped (list): (panel title, description) of the settings that could not be mapped
+    """
+    
+    phase = 'panel migration'
+    
+    def __init__(self):
+        self.panels_migrated = 0
+        self.unmapped = []
+    
+    def visit(self, obj):
+        if obj.get('type') == 'graph':
+            unmapped = migrate_graph_panel(obj)
+        elif obj.get('type') == 'singlestat':
+            unmapped = migrate_singlestat_panel(obj)
+        else:
+            return
+        self.panels_migrated += 1
+        title = obj.get('title') or f"panel {obj.get('id')}"
+        self.unmapped.extend((title, description) for description in unmapped)
+
+def remove_recursive(obj, fields_to_remove):
+    """
+    Recursively removes specified fields from a JSON structure.
+    
+    Args:
+        obj: The JSON object or array to process
+        fields_to_remove: List of field names to remove
+    
+    Returns:
+        dict: Counts of removed fields by type
+    """
+    remover = FieldRemover(fields_to_remove)
+    traverse_dashboard(obj, [remover])
+    return remover.counts
+
+def remove_prometheus_datasources_recursive(obj):
+    """
+    Recursively removes Prometheus datasource fields and template variables.
     
-    elif isinstance(obj, list):
-        # Traverse all list items
-        for item in obj:
-            if remove_prometheus_datasources_recursive(item):
-                modified = True
+    Args:
+        obj: The JSON object or array to process
     
-    return modified
+    Returns:
+        bool: True if any changes were made
+    """
+    remover = PrometheusDatasourceRemover()
+    traverse_dashboard(obj, [remover])
+    return remover.modified
 
 def disable_points_recursive(obj):
     """
@@ -293,60 +1091,53 @@ def disable_points_recursive(obj):
     Returns:
         int: Count of panels modified
     """
-    panels_modified = 0
+    disabler = PointsDisabler()
+    traverse_dashboard(obj, [disabler])
+    return disabler.panels_modified
+
+class PhaseTimer:
+    """
+    Accumulates the wall time spent in the phases of processing a dashboard.
     
-    if isinstance(obj, dict):
-        # Check if this is a time series panel
-        if obj.get('type') == 'timeseries':
-            # Initialize fieldConfig if it doesn't exist
-            if 'fieldConfig' not in obj:
-                obj['fieldConfig'] = {}
-            
-            # Initialize defaults if it doesn't exist
-            if 'defaults' not in obj['fieldConfig']:
-                obj['fieldConfig']['defaults'] = {}
-            
-            # Initialize custom if it doesn't exist
-            if 'custom' not in obj['fieldConfig']['defaults']:
-                obj['fieldConfig']['defaults']['custom'] = {}
-            
-            # Set showPoints to "never"
-            if obj['fieldConfig']['defaults']['custom'].get('showPoints') != 'never':
-                obj['fieldConfig']['defaults']['custom']['showPoints'] = 'never'
-                panels_modified += 1
-        
-        # Process panels array if it exists
-        if 'panels' in obj and isinstance(obj['panels'], list):
-            for panel in obj['panels']:
-                panels_modified += disable_points_recursive(panel)
-        
-        # Continue traversing all dictionary values (except 'panels' which we already processed)
-        for key in list(obj.keys()):
-            if key != 'panels':  # Skip 'panels' as we've already processed it
-                panels_modified += disable_points_recursive(obj[key])
+    Attributes:
+        timings (dict): Seconds spent by phase, in the order the phases first ran
+    """
     
-    elif isinstance(obj, list):
-        # Traverse all list items
-        for item in obj:
-            panels_modified += disable_points_recursive(item)
+    def __init__(self):
+        self.timings = {}
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as part of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+def peak_rss():
+    """
+    Return the peak resident set size of the current process.
     
-    return panels_modified
+    Returns:
+        int: Peak RSS in bytes, or None where the resource module is not available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
 
-def process_dashboard(file_path, project_id, remove_prometheus, disable_points, top_level_fields, recursive_fields, tags_list=None):
+def new_results(top_level_fields, recursive_fields):
     """
-    Process a single dashboard file by removing fields and updating UIDs.
+    Create the results dict of a dashboard file with nothing changed.
     
     Args:
-        file_path (str): Path to the dashboard JSON file
-        project_id (str): Project identifier for UID generation
-        remove_prometheus (bool): Whether to remove Prometheus datasource configurations
-        disable_points (bool): Whether to disable points on all time series panels
         top_level_fields (list): Fields to remove at the top level
         recursive_fields (list): Fields to remove recursively
-        tags_list (list, optional): List of tags to set on the dashboard
     
     Returns:
-        dict: Results of processing the file
+        dict: Results of processing a file
     """
     results = {
         'success': False,
@@ -359,7 +1150,17 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
         'timezone_updated': False,
         'tags_updated': False,
         'templates_updated': False,
-        'variables_standardized': 0
+        'variables_standardized': 0,
+        'variables_optimized': 0,
+        'per_topic_variables': [],
+        'point_budgets_assigned': 0,
+        'points_before': 0,
+        'points_after': 0,
+        'panels_migrated': 0,
+        'unmapped_panel_settings': [],
+        'timings': {},
+        'elapsed': 0.0,
+        'peak_rss': None
     }
     
     # Add fields to track for recursive removal
@@ -370,6 +1171,34 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
     for field in top_level_fields:
         results[f"{field}_removed"] = False
     
+    return results
+
+def process_dashboard(file_path, project_id, remove_prometheus, disable_points, top_level_fields, recursive_fields, tags_list=None, optimize_variables=False, point_budgets=False, scrape_interval=DEFAULT_SCRAPE_INTERVAL, migrate_panels=False, write=True, time_visitors=False):
+    """
+    Process a single dashboard file by removing fields and updating UIDs.
+    
+    Args:
+        file_path (str): Path to the dashboard JSON file
+        project_id (str): Project identifier for UID generation
+        remove_prometheus (bool): Whether to remove Prometheus datasource configurations
+        disable_points (bool): Whether to disable points on all time series panels
+        top_level_fields (list): Fields to remove at the top level
+        recursive_fields (list): Fields to remove recursively
+        tags_list (list, optional): List of tags to set on the dashboard
+        optimize_variables (bool): Whether to optimize template variable queries
+        point_budgets (bool): Whether to assign per-panel data point budgets
+        scrape_interval (int): Scrape interval in seconds the minimum panel interval is aligned to
+        migrate_panels (bool): Whether to migrate graph and singlestat panels to timeseries and stat
+        write (bool): Whether to write the modified dashboard back to the file
+        time_visitors (bool): Whether to time each recursive transform separately, which slows the traversal down
+    
+    Returns:
+        dict: Results of processing the file, with the seconds spent by phase in 'timings'
+    """
+    results = new_results(top_level_fields, recursive_fields)
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    
     try:
         # Check if file exists
         if not os.path.isfile(file_path):
@@ -377,9 +1206,12 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
             return results
         
         # Read and parse the JSON file
-        with open(file_path, 'r', encoding='utf-8') as file:
+        with timer.phase('read'):
+            with open(file_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+        with timer.phase('parse'):
             try:
-                dashboard = json.load(file)
+                dashboard = json.loads(content)
             except json.JSONDecodeError:
                 print(f"Error: '{file_path}' is not a valid JSON file. Skipping.")
                 return results
@@ -388,7 +1220,8 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
         old_uid = dashboard.get('uid', None)
         
         # Remove top-level fields
-        top_level_removals = remove_top_level_fields(dashboard, top_level_fields)
+        with timer.phase('top-level removal'):
+            top_level_removals = remove_top_level_fields(dashboard, top_level_fields)
         
         # Update results with top-level removals
         for field, removed in top_level_removals.items():
@@ -398,7 +1231,8 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
                 print(f"- Removed '{field}' from '{file_path}'")
         
         # Generate and update UID
-        new_uid = generate_uid(file_path, dashboard, project_id)
+        with timer.phase('uid'):
+            new_uid = generate_uid(file_path, dashboard, project_id)
         if old_uid != new_uid:
             dashboard['uid'] = new_uid
             results['uid_updated'] = True
@@ -410,7 +1244,8 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
                 print(f"- Assigned new UID '{new_uid}' to '{file_path}'")
         
         # Standardize template variable current values
-        templates_updated, variables_standardized = standardize_template_variables(dashboard)
+        with timer.phase('templating'):
+            templates_updated, variables_standardized = standardize_template_variables(dashboard)
         results['templates_updated'] = templates_updated
         results['variables_standardized'] = variables_standardized
         
@@ -418,8 +1253,23 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
             results['file_modified'] = True
             print(f"- Standardized {variables_standardized} template variables in '{file_path}'")
         
+        # Optimize template variable queries if requested
+        if optimize_variables:
+            with timer.phase('templating'):
+                variables_optimized, per_topic_variables = optimize_template_variables(dashboard, file_path)
+            results['variables_optimized'] = variables_optimized
+            results['per_topic_variables'] = per_topic_variables
+            
+            if variables_optimized > 0:
+                results['file_modified'] = True
+                print(f"- Optimized {variables_optimized} template variable queries in '{file_path}'")
+            
+            for name in per_topic_variables:
+                print(f"- Template variable '{name}' in '{file_path}' still looks up values from per-topic metrics")
+        
         # Set default values for refresh, time, timezone, and tags if provided
-        refresh_updated, time_updated, timezone_updated, tags_updated = set_default_values(dashboard, tags_list)
+        with timer.phase('defaults'):
+            refresh_updated, time_updated, timezone_updated, tags_updated = set_default_values(dashboard, tags_list)
         results['refresh_updated'] = refresh_updated
         results['time_updated'] = time_updated
         results['timezone_updated'] = timezone_updated
@@ -441,44 +1291,254 @@ def process_dashboard(file_path, project_id, remove_prometheus, disable_points,
             results['file_modified'] = True
             print(f"- Set tags to {tags_list} in '{file_path}'")
         
+        # Apply the recursive transforms in a single traversal of the dashboard
+        panel_migrator = PanelMigrator() if migrate_panels else None
+        prometheus_remover = PrometheusDatasourceRemover() if remove_prometheus else None
+        points_disabler = PointsDisabler() if disable_points else None
+        budget_assigner = PointBudgetAssigner(template_variables_by_name(dashboard), scrape_interval) if point_budgets else None
+        field_remover = FieldRemover(recursive_fields)
+        visitors = [v for v in (panel_migrator, prometheus_remover, points_disabler, budget_assigner, field_remover) if v is not None]
+        visitor_timings = {} if time_visitors else None
+        with timer.phase('traversal'):
+            traverse_dashboard(dashboard, visitors, visitor_timings)
+        # Without timing each visitor, the traversal phase includes all recursive transforms
+        if visitor_timings:
+            timer.timings['traversal'] -= sum(visitor_timings.values())
+            timer.timings.update(visitor_timings)
+        
+        # Migrate legacy graph and singlestat panels if requested
+        if panel_migrator:
+            results['panels_migrated'] = panel_migrator.panels_migrated
+            results['unmapped_panel_settings'] = panel_migrator.unmapped
+            if panel_migrator.panels_migrated > 0:
+                results['file_modified'] = True
+                print(f"- Migrated {panel_migrator.panels_migrated} graph and singlestat panels in '{file_path}'")
+            for title, description in panel_migrator.unmapped:
+                print(f"- Could not map {description} of panel '{title}' in '{file_path}'")
+        
         # Remove Prometheus datasource configurations if requested
-        if remove_prometheus:
-            prometheus_modified = remove_prometheus_datasources_recursive(dashboard)
-            results['prometheus_removed'] = prometheus_modified
-            if prometheus_modified:
+        if prometheus_remover:
+            results['prometheus_removed'] = prometheus_remover.modified
+            if prometheus_remover.modified:
                 results['file_modified'] = True
                 print(f"- Removed datasource configurations from '{file_path}'")
         
         # Disable points on all time series panels if requested
-        if disable_points:
-            panels_modified = disable_points_recursive(dashboard)
-            results['points_disabled'] = panels_modified
-            if panels_modified > 0:
+        if points_disabler:
+            results['points_disabled'] = points_disabler.panels_modified
+            if points_disabler.panels_modified > 0:
                 results['file_modified'] = True
-                print(f"- Disabled points on {panels_modified} time series panels in '{file_path}'")
+                print(f"- Disabled points on {points_disabler.panels_modified} time series panels in '{file_path}'")
         
-        # Perform recursive field removal
-        recursive_removals_count = remove_recursive(dashboard, recursive_fields)
+        # Assign per-panel data point budgets if requested
+        if budget_assigner:
+            results['point_budgets_assigned'] = budget_assigner.panels_updated
+            results['points_before'] = budget_assigner.points_before
+            results['points_after'] = budget_assigner.points_after
+            if budget_assigner.panels_updated > 0:
+                results['file_modified'] = True
+                print(f"- Assigned data point budgets to {budget_assigner.panels_updated} panels in '{file_path}', "
+                      f"worst-case points per load over 7 days: {budget_assigner.points_before:,} -> {budget_assigner.points_after:,}")
         
         # Update results with removed counts
-        for field, count in recursive_removals_count.items():
+        for field, count in field_remover.counts.items():
             results[f"{field}_removed"] = count
             if count > 0:
                 results['file_modified'] = True
                 print(f"- Removed {count} '{field}' fields from '{file_path}'")
         
         # Write the modified dashboard back to the file if any changes were made
-        if results['file_modified']:
-            with open(file_path, 'w', encoding='utf-8') as output_file:
-                json.dump(dashboard, output_file, indent=2, ensure_ascii=False)
+        if results['file_modified'] and write:
+            with timer.phase('serialize'):
+                content = json.dumps(dashboard, indent=2, ensure_ascii=False)
+            with timer.phase('write'):
+                with open(file_path, 'w', encoding='utf-8') as output_file:
+                    output_file.write(content)
         
         results['success'] = True
         
     except Exception as e:
         print(f"Error processing '{file_path}': {str(e)}. Skipping.")
     
+    results['timings'] = timer.timings
+    results['elapsed'] = time.perf_counter() - start
+    results['peak_rss'] = peak_rss()
     return results
 
+def process_dashboard_captured(file_path, *args):
+    """
+    Process a single dashboard file in a worker process, capturing its status
+    messages so that they can be printed in file order by the main process.
+    
+    Args:
+        file_path (str): Path to the dashboard JSON file
+        *args: Remaining arguments of process_dashboard
+    
+    Returns:
+        tuple: (results, output) with the results dict and the captured messages
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        results = process_dashboard(file_path, *args)
+    return results, output.getvalue()
+
+def process_dashboards(file_paths, args, jobs):
+    """
+    Process dashboard files, in a pool of worker processes when there is more
+    than one job and file.
+    
+    Args:
+        file_paths (list): Paths to the dashboard JSON files
+        args (tuple): Remaining arguments of process_dashboard
+        jobs (int): Number of worker processes
+    
+    Yields:
+        tuple: (file_path, results) in the order of file_paths
+    """
+    if jobs <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield file_path, process_dashboard(file_path, *args)
+        return
+    
+    with ProcessPoolExecutor(max_workers=min(jobs, len(file_paths))) as executor:
+        futures = [executor.submit(process_dashboard_captured, file_path, *args) for file_path in file_paths]
+        for file_path, future in zip(file_paths, futures):
+            results, output = future.result()
+            print(output, end='')
+            yield file_path, results
+
+def script_version():
+    """
+    Return a hash of the source code of this script and the modules it uses,
+    so that cached results are invalidated when the cleanup logic changes.
+    
+    Returns:
+        str: Hex digest of the source files
+    """
+    hash_obj = hashlib.sha256()
+    for module_file in (__file__, sys.modules['dashboards'].__file__, sys.modules['metric_catalog'].__file__,
+                        sys.modules['promql'].__file__):
+        with open(module_file, 'rb') as source:
+            hash_obj.update(source.read())
+    return hash_obj.hexdigest()
+
+def file_content_hash(file_path):
+    """
+    Return the SHA-256 hash of the content of a file.
+    
+    Args:
+        file_path (str): Path to the file
+    
+    Returns:
+        str: Hex digest of the content, or None if the file cannot be read
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+def cache_key(file_path, content_hash, options_hash):
+    """
+    Return the cache key of a dashboard file. The UID depends on the file path,
+    so the path is part of the key along with the content and options.
+    
+    Args:
+        file_path (str): Path to the dashboard file
+        content_hash (str): Hash of the file content
+        options_hash (str): Hash of the script version and processing options
+    
+    Returns:
+        str: Cache key
+    """
+    key_input = f"{options_hash}:{os.path.normpath(file_path)}:{content_hash}"
+    return hashlib.sha256(key_input.encode('utf-8')).hexdigest()
+
+def load_cache(cache_file):
+    """
+    Load the cache of files that are known to be unchanged by the cleanup.
+    
+    Args:
+        cache_file (str): Path to the cache file
+    
+    Returns:
+        dict: Map of normalized file paths to cache keys
+    """
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            entries = json.load(file).get('files')
+    except (OSError, ValueError, AttributeError):
+        return {}
+    return entries if isinstance(entries, dict) else {}
+
+def save_cache(cache_file, entries):
+    """
+    Atomically write the cache of files that are known to be unchanged by the cleanup.
+    
+    Args:
+        cache_file (str): Path to the cache file
+        entries (dict): Map of normalized file paths to cache keys
+    """
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    temp_file = f"{cache_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({'files': entries}, file, indent=2, sort_keys=True)
+    os.replace(temp_file, cache_file)
+
+def timing_report(phase_totals, file_costs, skipped_count, jobs, stats, profile):
+    """
+    Build the --stats and --profile report.
+    
+    Args:
+        phase_totals (dict): Seconds spent by phase, summed over the processed files
+        file_costs (list): Dicts with the file, seconds, phases and peak RSS of each processed file
+        skipped_count (int): Number of files skipped by the cache, which are not included
+        jobs (int): Number of worker processes
+        stats (bool): Whether to include the phase timings
+        profile (bool): Whether to include the per-file costs and the peak RSS
+    
+    Returns:
+        dict: The report, as written by --stats-json
+    """
+    report = {'files_processed': len(file_costs), 'files_skipped': skipped_count, 'jobs': jobs}
+    if stats:
+        report['phases'] = {phase: round(seconds, 6) for phase, seconds in
+                            sorted(phase_totals.items(), key=lambda item: item[1], reverse=True)}
+        report['total_seconds'] = round(sum(phase_totals.values()), 6)
+    if profile:
+        report['files'] = [dict(cost, seconds=round(cost['seconds'], 6),
+                                phases={phase: round(seconds, 6) for phase, seconds in cost['phases'].items()})
+                           for cost in sorted(file_costs, key=lambda cost: cost['seconds'], reverse=True)]
+        rss = [cost['peak_rss_bytes'] for cost in file_costs if cost['peak_rss_bytes'] is not None]
+        report['peak_rss_bytes'] = max(rss + [peak_rss() or 0]) or None
+    return report
+
+def print_timing_report(report):
+    """
+    Print the --stats and --profile report.
+    
+    Args:
+        report (dict): The report built by timing_report()
+    """
+    cached_note = f", {report['files_skipped']} cached files not included" if report['files_skipped'] else ''
+    if 'phases' in report:
+        total = report['total_seconds']
+        print(f"\nPhase timings ({report['files_processed']} files, --jobs {report['jobs']}{cached_note}):")
+        for phase, seconds in report['phases'].items():
+            share = 100 * seconds / total if total else 0
+            print(f"  {phase:<20} {seconds:>10.3f}s {share:>6.1f}%")
+        print(f"  {'total':<20} {total:>10.3f}s")
+    if 'files' in report:
+        print(f"\nSlowest files (of {report['files_processed']} processed{cached_note}):")
+        for cost in report['files'][:PROFILE_TOP_FILES]:
+            slowest = max(cost['phases'].items(), key=lambda item: item[1], default=None)
+            slowest_text = f" (slowest phase: {slowest[0]}, {slowest[1] * 1000:.1f} ms)" if slowest else ''
+            print(f"  {cost['seconds'] * 1000:>10.1f} ms  {cost['file']}{slowest_text}")
+        if report['peak_rss_bytes'] is not None:
+            print(f"  Peak RSS: {report['peak_rss_bytes'] / 2**20:.1f} MiB")
+
 def get_default_project_id():
     """
     Return the default project identifier from the original script.
@@ -533,6 +1593,81 @@ def parse_arguments():
         help='Disable points on all time series panels by setting showPoints to "never"'
     )
     
+    parser.add_argument(
+        '--optimize-variables',
+        action='store_true',
+        help='Rewrite template variable queries into cheap, bounded label_values lookups'
+    )
+    
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Report the files that would be modified and exit with a non-zero status if there are any, without writing files'
+    )
+    
+    parser.add_argument(
+        '--cache-file',
+        type=str,
+        default='build/cleanup-cache.json',
+        help='Cache of files unchanged by the cleanup, keyed by content, options and script version (default: build/cleanup-cache.json)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Process all files and do not read or write the cache'
+    )
+    
+    parser.add_argument(
+        '--point-budgets',
+        action='store_true',
+        help='Assign per-panel data point budgets (maxDataPoints, interval, instant queries) and report the worst-case points per load'
+    )
+    
+    parser.add_argument(
+        '--scrape-interval',
+        type=int,
+        default=DEFAULT_SCRAPE_INTERVAL,
+        help=f'Scrape interval in seconds the minimum panel interval is aligned to (default: {DEFAULT_SCRAPE_INTERVAL})'
+    )
+    
+    parser.add_argument(
+        '--migrate-panels',
+        action='store_true',
+        help='Migrate legacy graph panels to timeseries and singlestat panels to stat, reporting settings that could not be mapped'
+    )
+    
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Report the time spent in each processing phase, timing each recursive transform separately'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Report the time spent on each file and the peak RSS'
+    )
+    
+    parser.add_argument(
+        '--profile-output',
+        type=str,
+        help='Write cProfile statistics to this file, processing the files in a single process'
+    )
+    
+    parser.add_argument(
+        '--stats-json',
+        type=str,
+        help='Write the --stats and --profile reports as JSON to this file (implies --stats without --profile)'
+    )
+    
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of dashboard files to process in parallel (default: number of CPUs)'
+    )
+    
     # Parse arguments
     args = parser.parse_args()
     
@@ -545,9 +1680,14 @@ def main():
     file_paths = args.files
     total_files = len(file_paths)
     
+    # The JSON report needs something to report, and cProfile only sees the main process
+    if args.stats_json and not args.profile:
+        args.stats = True
+    jobs = 1 if args.profile_output else args.jobs
+    
     # Define field lists
-    recursive_fields = ['$$hashKey', '__requires', 'pluginVersion', '__inputs', 'prometheusLink']
-    top_level_fields = ['id', 'version', 'iteration', 'links', 'gnetId', 'liveNow', 'preload', 'timepicker', 'annotations']
+    recursive_fields = RECURSIVE_FIELDS
+    top_level_fields = TOP_LEVEL_FIELDS
     
     # Process tags if provided
     tags_list = None
@@ -575,8 +1715,23 @@ def main():
     if args.disable_points:
         print("Disabling points on all time series panels")
         
+    if args.optimize_variables:
+        print("Optimizing template variable queries")
+        
+    if args.migrate_panels:
+        print("Migrating graph panels to timeseries and singlestat panels to stat")
+        
+    if args.point_budgets:
+        print(f"Assigning per-panel data point budgets, aligned to a {args.scrape_interval}s scrape interval")
+        
     if tags_list:
         print(f"Setting dashboard tags to: {tags_list}")
+    
+    if args.check:
+        print("Checking files only, no files are written")
+    
+    if args.profile_output:
+        print(f"Profiling with cProfile in a single process, writing statistics to '{args.profile_output}'")
     print()
     
     # Track statistics
@@ -590,6 +1745,12 @@ def main():
     tags_updated_count = 0
     templates_updated_count = 0
     total_variables_standardized = 0
+    variables_optimized_count = 0
+    point_budgets_assigned_count = 0
+    points_per_load = []
+    panels_migrated_count = 0
+    unmapped_panel_settings = []
+    per_topic_variables = []
     
     # Track top-level field removals
     top_level_removed_files = {field: 0 for field in top_level_fields}
@@ -599,12 +1760,41 @@ def main():
     total_fields_removed = {field: 0 for field in recursive_fields}
     
     modified_count = 0
+    modified_files = []
     failed_count = 0
     
-    # Process each file
+    process_args = (args.project_id, args.remove_prometheus_datasources, args.disable_points,
+                    top_level_fields, recursive_fields, tags_list, args.optimize_variables,
+                    args.point_budgets, args.scrape_interval, args.migrate_panels)
+    
+    # Skip files that are unchanged since a previous run with the same options and script version,
+    # unless the files are processed for the reports of every file
+    reporting = args.point_budgets or args.optimize_variables or args.migrate_panels or args.stats or args.profile
+    use_cache = not args.no_cache and not reporting
+    cache_entries = load_cache(args.cache_file) if use_cache else {}
+    options_hash = hashlib.sha256(json.dumps([script_version(), process_args]).encode('utf-8')).hexdigest()
+    files_to_process = []
+    skipped_count = 0
     for file_path in file_paths:
-        results = process_dashboard(file_path, args.project_id, args.remove_prometheus_datasources, 
-                                  args.disable_points, top_level_fields, recursive_fields, tags_list)
+        content_hash = file_content_hash(file_path) if use_cache else None
+        if content_hash and cache_entries.get(os.path.normpath(file_path)) == cache_key(file_path, content_hash, options_hash):
+            skipped_count += 1
+            success_count += 1
+        else:
+            files_to_process.append(file_path)
+    
+    # Process the files in parallel and aggregate the per-file results in file order
+    phase_totals = {}
+    file_costs = []
+    profiler = cProfile.Profile() if args.profile_output else None
+    if profiler:
+        profiler.enable()
+    for file_path, results in process_dashboards(files_to_process, process_args + (not args.check, args.stats), jobs):
+        # Track the time spent by phase and file
+        for phase, seconds in results['timings'].items():
+            phase_totals[phase] = phase_totals.get(phase, 0.0) + seconds
+        file_costs.append({'file': file_path, 'seconds': results['elapsed'], 'phases': results['timings'],
+                           'peak_rss_bytes': results['peak_rss']})
         
         if results['success']:
             success_count += 1
@@ -643,6 +1833,20 @@ def main():
             if results['templates_updated']:
                 templates_updated_count += 1
                 total_variables_standardized += results['variables_standardized']
+            
+            # Track template variable query optimizations
+            variables_optimized_count += results['variables_optimized']
+            
+            # Track data point budgets
+            point_budgets_assigned_count += results['point_budgets_assigned']
+            if results['points_before'] or results['points_after']:
+                points_per_load.append((file_path, results['points_before'], results['points_after']))
+            per_topic_variables.extend(f"{file_path}: {name}" for name in results['per_topic_variables'])
+            
+            # Track panel migrations
+            panels_migrated_count += results['panels_migrated']
+            unmapped_panel_settings.extend(f"{file_path}: {title}: {description}"
+                                           for title, description in results['unmapped_panel_settings'])
                 
             # Track recursive field removals
             for field in recursive_fields:
@@ -654,14 +1858,25 @@ def main():
             # Track modified files
             if results['file_modified']:
                 modified_count += 1
+                modified_files.append(file_path)
+            
+            # Remember the processed content as clean
+            if use_cache and not args.check:
+                content_hash = file_content_hash(file_path)
+                if content_hash:
+                    cache_entries[os.path.normpath(file_path)] = cache_key(file_path, content_hash, options_hash)
         else:
             failed_count += 1
+    if profiler:
+        profiler.disable()
     
     # Print summary
     print("\n" + "="*60)
     print(f"Summary:")
     print(f"  Total files processed: {total_files}")
     print(f"  Successfully processed: {success_count}")
+    if use_cache:
+        print(f"  Files skipped (unchanged since last run): {skipped_count}")
     
     # Print top-level field removal statistics
     for field in top_level_fields:
@@ -694,11 +1909,60 @@ def main():
     if args.disable_points:
         print(f"  Total time series panels with points disabled: {panels_with_points_disabled}")
     
-    print(f"  Total files modified: {modified_count}")
+    if args.optimize_variables:
+        print(f"  Total template variable queries optimized: {variables_optimized_count}")
+        print(f"  Template variables still looking up per-topic metrics: {len(per_topic_variables)}")
+        for entry in per_topic_variables:
+            print(f"    - {entry}")
+    
+    if args.migrate_panels:
+        print(f"  Total graph and singlestat panels migrated: {panels_migrated_count}")
+        print(f"  Panel settings that could not be mapped: {len(unmapped_panel_settings)}")
+        for entry in unmapped_panel_settings:
+            print(f"    - {entry}")
+    
+    if args.point_budgets:
+        print(f"  Total panels with data point budgets assigned: {point_budgets_assigned_count}")
+        print("  Worst-case points per dashboard load over 7 days (before -> after):")
+        for file_path, points_before, points_after in sorted(points_per_load, key=lambda p: p[2], reverse=True):
+            print(f"    - {file_path}: {points_before:,} -> {points_after:,}")
+        print(f"    Total: {sum(p[1] for p in points_per_load):,} -> {sum(p[2] for p in points_per_load):,}")
+    
+    if args.check:
+        print(f"  Files that would be modified: {modified_count}")
+        for file_path in modified_files:
+            print(f"    - {file_path}")
+    else:
+        print(f"  Total files modified: {modified_count}")
     print(f"  Files failed: {failed_count}")
     
-    # Return non-zero exit code if any files failed
-    if failed_count > 0:
+    # Print and write the timing report
+    if args.stats or args.profile:
+        report = timing_report(phase_totals, file_costs, skipped_count, min(jobs, max(len(files_to_process), 1)),
+                               args.stats, args.profile)
+        print_timing_report(report)
+        if args.stats_json:
+            try:
+                with open(args.stats_json, 'w', encoding='utf-8') as file:
+                    json.dump(report, file, indent=2)
+                    file.write('\n')
+            except OSError as e:
+                print(f"Warning: Could not write stats file '{args.stats_json}': {e}")
+    if profiler:
+        try:
+            profiler.dump_stats(args.profile_output)
+            print(f"\ncProfile statistics written to '{args.profile_output}', view them with: python -m pstats {args.profile_output}")
+        except OSError as e:
+            print(f"Warning: Could not write profile file '{args.profile_output}': {e}")
+    
+    if use_cache and not args.check:
+        try:
+            save_cache(args.cache_file, cache_entries)
+        except OSError as e:
+            print(f"Warning: Could not write cache file '{args.cache_file}': {e}")
+    
+    # Return non-zero exit code if any files failed or would be modified in check mode
+    if failed_count > 0 or (args.check and modified_count > 0):
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Row Collapser
+-----------------------
+
+This script restructures large Grafana dashboards so that opening them only
+issues a limited number of queries. Grafana queries the panels of expanded
+rows as soon as a dashboard is opened, but the panels of a collapsed row only
+when the row is expanded, so a dashboard with everything expanded (like the
+ZooKeeper dashboard with 100+ panels) fires nearly all of its queries on
+every open and every auto-refresh.
+
+The panels are walked in dashboard order and kept expanded until the
+above-the-fold query budget is used up:
+1. Sections (the panels before the first row, and every row with its panels)
+   stay expanded as long as all their queries fit in the budget
+2. The section that exceeds the budget is split between two lines of the grid:
+   the lines that fit stay expanded and the rest move into a new collapsed row
+   titled "<row title> (more)"
+3. All later rows are collapsed, their panels moved into the row
+
+Rows that are already collapsed are left collapsed and do not count against
+the budget. Queries are counted per panel target that Grafana sends to
+Prometheus (hidden targets and panels using the '-- Dashboard --' or other
+non-Prometheus data sources are free). The number of copies of repeated rows
+and panels is only known at runtime, so they are assumed to repeat
+--repeat-count times; repeated rows are never split, and the saved copies of
+a repeated row follow the state of the row.
+
+Panel order is kept, and the gridPos of all panels is recomputed from top to
+bottom, keeping the relative layout of the panels within each section.
+Panels of collapsed rows are given the position they take when the row is
+expanded, like Grafana does when saving a dashboard with collapsed rows.
+
+Usage:
+    python collapse-dashboard-rows.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --budget N          Number of queries allowed above the fold (default: 20)
+    --repeat-count N    Number of copies assumed for repeated rows and panels (default: 10)
+    --dry-run           Only print the report, do not modify any files
+    --check             Like --dry-run, but exit with status 1 if any dashboard would be restructured
+
+The queries issued on load before and after can be verified with
+simulate-dashboard-load.py, which reports the panels of collapsed rows as
+deferred.
+
+Output:
+    - Report of the rows kept expanded and collapsed per restructured dashboard
+    - Summary of the queries issued on open before and after
+"""
+
+import argparse
+import sys
+
+from dashboards import default_dashboard_files, load_dashboard, panel_query_targets, write_dashboard
+from metric_catalog import REFERENCE_FLEET
+
+# Number of queries issued when opening a dashboard, about three waves of the
+# browser's six concurrent requests per host
+DEFAULT_QUERY_BUDGET = 20
+
+MORE_ROW_TITLE = 'More'
+
+# Number of copies assumed for repeated rows and panels, the number of brokers
+# (and bookies) in the reference fleet
+DEFAULT_REPEAT_COUNT = REFERENCE_FLEET['brokers']
+
+
+def panel_queries(panel, repeat_count):
+    # Saved copies of repeated panels are dropped and re-created by Grafana on load
+    if 'repeatPanelId' in panel:
+        return 0
+    queries = len(panel_query_targets(panel))
+    return queries * repeat_count if panel.get('repeat') else queries
+
+
+def section_queries(row, panels, repeat_count):
+    if row is not None and 'repeatPanelId' in row:
+        return 0
+    queries = sum(panel_queries(p, repeat_count) for p in panels)
+    return queries * repeat_count if row is not None and row.get('repeat') else queries
+
+
+def split_sections(dashboard):
+    """
+    Split the top level panels of a dashboard into sections.
+
+    Returns:
+        list: [row, panels] pairs in dashboard order, row is None for the panels before the first row
+    """
+    sections = []
+    for panel in dashboard.get('panels') or []:
+        if not isinstance(panel, dict):
+            continue
+        if panel.get('type') == 'row':
+            nested = (panel.get('panels') or []) if panel.get('collapsed') else []
+            sections.append([panel, [p for p in nested if isinstance(p, dict)]])
+            continue
+        if not sections:
+            sections.append([None, []])
+        sections[-1][1].append(panel)
+    return sections
+
+
+def grid_lines(panels):
+    """Group panels by their gridPos.y into lines of the grid, keeping the panel order within a line."""
+    lines = {}
+    for panel in panels:
+        lines.setdefault((panel.get('gridPos') or {}).get('y', 0), []).append(panel)
+    return [lines[y] for y in sorted(lines)]
+
+
+def next_panel_id(dashboard):
+    ids = [p.get('id') for p in dashboard.get('panels') or [] if isinstance(p, dict)]
+    ids += [n.get('id') for p in dashboard.get('panels') or [] if isinstance(p, dict)
+            for n in p.get('panels') or [] if isinstance(n, dict)]
+    return max((i for i in ids if isinstance(i, int)), default=0) + 1
+
+
+def new_row(title, panel_id):
+    return {'collapsed': True, 'gridPos': {'h': 1, 'w': 24, 'x': 0, 'y': 0}, 'id': panel_id,
+            'panels': [], 'title': title, 'type': 'row'}
+
+
+def plan_sections(dashboard, budget, repeat_count):
+    """
+    Decide which sections stay expanded within the query budget.
+
+    Returns:
+        tuple: (sections as [row, panels, expanded] lists, queries above the fold)
+    """
+    planned = []
+    used = 0
+    exhausted = False
+    panel_id = next_panel_id(dashboard)
+    expanded_rows = {}
+    for row, panels in split_sections(dashboard):
+        if row is not None and 'repeatPanelId' in row:
+            # Saved copies of a repeated row follow the row they repeat
+            planned.append([row, panels, expanded_rows.get(row['repeatPanelId'], False)])
+            continue
+        if row is not None and row.get('collapsed'):
+            planned.append([row, panels, False])
+            continue
+        cost = section_queries(row, panels, repeat_count)
+        if not exhausted and used + cost <= budget:
+            planned.append([row, panels, True])
+            if row is not None:
+                expanded_rows[row.get('id')] = True
+            used += cost
+            continue
+
+        kept = []
+        # Repeated rows are collapsed as a whole
+        if not exhausted and not (row is not None and row.get('repeat')):
+            for line in grid_lines(panels):
+                line_cost = sum(panel_queries(p, repeat_count) for p in line)
+                if used + line_cost > budget:
+                    break
+                kept.extend(line)
+                used += line_cost
+        exhausted = True
+        rest = [p for p in panels if not any(p is k for k in kept)]
+        if kept or row is None:
+            planned.append([row, kept, True])
+            title = f"{row.get('title')} (more)" if row is not None and row.get('title') else MORE_ROW_TITLE
+            planned.append([new_row(title, panel_id), rest, False])
+            panel_id += 1
+        else:
+            planned.append([row, panels, False])
+    return planned, used
+
+
+def layout(planned):
+    """
+    Return the top level panels of planned sections with recomputed gridPos.
+
+    Within a section, panels keep their position relative to the topmost panel.
+    """
+    result = []
+    y = 0
+    for row, panels, expanded in planned:
+        top = min(((p.get('gridPos') or {}).get('y', 0) for p in panels), default=0)
+        height = max(((p.get('gridPos') or {}).get('y', 0) - top + (p.get('gridPos') or {}).get('h', 0)
+                      for p in panels), default=0)
+        if row is not None:
+            row.setdefault('gridPos', {'h': 1, 'w': 24, 'x': 0})['y'] = y
+            y += 1
+        for panel in panels:
+            grid_pos = panel.setdefault('gridPos', {})
+            grid_pos['y'] = y + grid_pos.get('y', 0) - top
+
+        if row is None:
+            result.extend(panels)
+            y += height
+        elif expanded:
+            if row.get('collapsed'):
+                row['collapsed'] = False
+            if row.get('panels'):
+                row['panels'] = []
+            result.append(row)
+            result.extend(panels)
+            y += height
+        else:
+            row['collapsed'] = True
+            row['panels'] = panels
+            result.append(row)
+    return result
+
+
+def collapse_rows(dashboard, budget, repeat_count=DEFAULT_REPEAT_COUNT):
+    """
+    Restructure a dashboard so that at most `budget` queries are issued on open.
+
+    Args:
+        dashboard (dict): Dashboard, modified in place
+        budget (int): Number of queries allowed above the fold
+        repeat_count (int): Number of copies assumed for repeated rows and panels
+
+    Returns:
+        dict: Queries on open before and after, and the titles of the expanded and collapsed rows
+    """
+    before = sum(section_queries(row, panels, repeat_count) for row, panels in split_sections(dashboard)
+                 if row is None or not row.get('collapsed'))
+    result = {'before': before, 'after': before, 'expanded': [], 'collapsed': []}
+    if before <= budget:
+        return result
+
+    planned, result['after'] = plan_sections(dashboard, budget, repeat_count)
+    dashboard['panels'] = layout(planned)
+    result['expanded'] = [row.get('title') if row is not None else '(panels above the first row)'
+                          for row, panels, expanded in planned if expanded and (row is not None or panels)]
+    result['collapsed'] = [row.get('title') for row, _, expanded in planned if row is not None and not expanded]
+    return result
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Row Collapser",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--budget', type=int, default=DEFAULT_QUERY_BUDGET,
+                        help='Number of queries allowed above the fold')
+    parser.add_argument('--repeat-count', type=int, default=DEFAULT_REPEAT_COUNT,
+                        help='Number of copies assumed for repeated rows and panels')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any dashboard would be restructured, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    write = not (args.dry_run or args.check)
+
+    total_before = 0
+    total_after = 0
+    restructured = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        result = collapse_rows(dashboard, args.budget, args.repeat_count)
+        total_before += result['before']
+        total_after += result['after']
+        if result['after'] == result['before']:
+            continue
+
+        restructured += 1
+        print(f"- {file_path}: {result['before']} -> {result['after']} queries on open")
+        print(f"    expanded: {', '.join(result['expanded']) or '(none)'}")
+        print(f"    collapsed: {', '.join(result['collapsed'])}")
+        if write:
+            write_dashboard(file_path, dashboard)
+
+    print(f"\nSummary:")
+    print(f"  Query budget above the fold: {args.budget}")
+    print(f"  Dashboards {'restructured' if write else 'to restructure'}: {restructured}")
+    print(f"  Queries on open of all dashboards: {total_before} -> {total_after}")
+
+    if args.check and restructured:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
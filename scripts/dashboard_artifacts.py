@@ -0,0 +1,145 @@
+"""
+Dashboard Build Artifacts
+-------------------------
+
+Shared helpers for the compact dashboard artifacts written by
+build-dashboard-artifacts.py: canonical minified JSON with precompressed .gz
+and .zst siblings, and a manifest of their sizes and checksums that
+generate-victoria-metrics-k8s-stack-values.py references the artifacts from.
+
+Compression is deterministic (no timestamps in the gzip header), so an
+unchanged dashboard always produces identical artifacts and checksums.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # only needed for the .zst artifacts
+    zstandard = None
+
+from dashboards import REPO_ROOT, load_dashboard
+
+DEFAULT_OUTPUT_DIR = os.path.join('build', 'dashboards')
+MANIFEST_NAME = 'manifest.json'
+
+# Compression formats by file extension
+COMPRESSION_FORMATS = ('gz', 'zst')
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+
+
+def minify_dashboard(dashboard: Dict[str, Any]) -> bytes:
+    """Serialize a dashboard as canonical minified JSON: sorted keys, no whitespace."""
+    return json.dumps(dashboard, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def check_compression(compression: str):
+    """
+    Check that artifacts can be compressed in a format.
+
+    Raises:
+        ValueError: If the format is unknown or its module is not installed
+    """
+    if compression not in COMPRESSION_FORMATS:
+        raise ValueError(f"unknown compression format '{compression}', expected one of: {', '.join(COMPRESSION_FORMATS)}")
+    if compression == 'zst' and zstandard is None:
+        raise ValueError("the 'zstandard' package is required for .zst artifacts, install it or use --compressions gz")
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    """Compress data in one of COMPRESSION_FORMATS, see check_compression() for the errors raised."""
+    check_compression(compression)
+    if compression == 'gz':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def artifact_path(file_path: str) -> str:
+    """
+    Return the path of the artifact of a dashboard file relative to the output
+    directory, e.g. 'pulsar/topic.json' for 'pulsar/topic.json'. The directory
+    is the provider name, like in generate-victoria-metrics-k8s-stack-values.py.
+    """
+    dir_path, filename = os.path.split(os.path.normpath(file_path))
+    provider_name = os.path.basename(dir_path) if dir_path else 'dashboards'
+    return f"{provider_name}/{filename}"
+
+
+def _file_entry(path: str, data: bytes) -> Dict[str, Any]:
+    return {'path': path, 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def _write_if_changed(full_path: str, data: bytes) -> bool:
+    try:
+        with open(full_path, 'rb') as existing:
+            if existing.read() == data:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as output:
+        output.write(data)
+    return True
+
+
+def build_artifacts(file_paths: List[str], output_dir: str = DEFAULT_OUTPUT_DIR,
+                    compressions: List[str] = COMPRESSION_FORMATS) -> Dict[str, Any]:
+    """
+    Write the minified and compressed artifacts of dashboard files and their manifest.
+
+    Args:
+        file_paths: Dashboard JSON files
+        output_dir: Directory to write the artifacts and manifest.json to
+        compressions: Compression formats of the precompressed siblings
+
+    Returns:
+        dict: The manifest, with the number of files written under 'written'
+              (not part of the manifest file)
+    """
+    for compression in compressions:
+        check_compression(compression)
+
+    manifest = {'compressions': list(compressions), 'dashboards': {}}
+    written = 0
+    for file_path in file_paths:
+        dashboard = load_dashboard(file_path)
+        path = artifact_path(file_path)
+        data = minify_dashboard(dashboard)
+        source = os.path.relpath(os.path.abspath(file_path), REPO_ROOT)
+        if source.startswith('..'):
+            source = os.path.normpath(file_path)
+
+        entry = {
+            'source': source,
+            'uid': dashboard.get('uid'),
+            'title': dashboard.get('title'),
+            'source_size': os.path.getsize(file_path),
+            **_file_entry(path, data),
+            'compressed': {},
+        }
+        written += _write_if_changed(os.path.join(output_dir, path), data)
+        for compression in compressions:
+            compressed = compress(data, compression)
+            compressed_path = f"{path}.{compression}"
+            entry['compressed'][compression] = _file_entry(compressed_path, compressed)
+            written += _write_if_changed(os.path.join(output_dir, compressed_path), compressed)
+        manifest['dashboards'][path] = entry
+
+    manifest_data = (json.dumps(manifest, indent=2, sort_keys=True) + '\n').encode('utf-8')
+    written += _write_if_changed(os.path.join(output_dir, MANIFEST_NAME), manifest_data)
+    return {**manifest, 'written': written}
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Any]:
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def manifest_entry(manifest: Dict[str, Any], file_path: str) -> Optional[Dict[str, Any]]:
+    """Return the manifest entry of a dashboard file, or None if it has no artifact."""
+    return manifest.get('dashboards', {}).get(artifact_path(file_path))
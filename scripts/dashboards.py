@@ -0,0 +1,364 @@
+"""
+Dashboard Helpers
+-----------------
+
+Shared helpers for reading, traversing and writing the Grafana dashboard JSON
+files in this repository, used by the analysis and rewriting scripts.
+"""
+
+import importlib.util
+import json
+import os
+import re
+import sys
+from types import ModuleType
+from typing import Any, Collection, Dict, Iterator, List, Optional, Set, Tuple
+
+from metric_catalog import FLEET_LABEL_VALUES, LEVELS, estimate_series, metric_level
+from promql import (Aggregation, BinaryExpr, Call, LabelMatcher, Node, NumberLiteral, ParseError, StringLiteral,
+                    TemplateVariable, VectorSelector, is_template_variable, parse, selectors, strip_template_variables, template_variables,
+                    unwrap_parens, walk_with_parents)
+
+# Dashboard directories of this repository, relative to the repository root
+DASHBOARD_DIRS = ['pulsar', 'oxia']
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Grafana data sources that do not query Prometheus; '-- Dashboard --' reuses the results of another panel
+DASHBOARD_DATASOURCE = '-- Dashboard --'
+NON_PROMETHEUS_DATASOURCES = {DASHBOARD_DATASOURCE, '-- Grafana --', '-- Mixed --', 'grafana', 'datasource'}
+NO_QUERY_PANEL_TYPES = {'row', 'text', 'news', 'dashlist', 'welcome', 'annolist', 'alertlist'}
+
+# Labels of the result series referenced in a legend format, e.g. {{topic}}
+_LEGEND_LABEL_RE = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+
+# Functions reading labels given as string arguments: function name to the index of the first label argument
+_LABEL_ARGUMENT_FUNCTIONS = {'label_replace': 3, 'label_join': 3, 'sort_by_label': 1, 'sort_by_label_desc': 1}
+
+# Kinds of label references of collect_label_usage() showing that a metric has the label
+SERIES_LABEL_KINDS = {'matcher', 'label_values'}
+
+
+def default_dashboard_files() -> List[str]:
+    """Return the dashboard files of this repository, relative to the current directory."""
+    files = []
+    for directory in DASHBOARD_DIRS:
+        full_dir = os.path.join(REPO_ROOT, directory)
+        if os.path.isdir(full_dir):
+            files.extend(os.path.relpath(os.path.join(full_dir, name)) for name in sorted(os.listdir(full_dir))
+                         if name.endswith('.json'))
+    return files
+
+
+def load_dashboard(file_path: str) -> Dict[str, Any]:
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def dump_dashboard(dashboard: Dict[str, Any]) -> str:
+    """Serialize a dashboard the same way cleanup-grafana-dashboards.py writes it."""
+    return json.dumps(dashboard, indent=2, ensure_ascii=False)
+
+
+def write_dashboard(file_path: str, dashboard: Dict[str, Any]):
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        json.dump(dashboard, output_file, indent=2, ensure_ascii=False)
+
+
+def dashboard_name(file_path: str) -> str:
+    """Return the dashboard name used for a file, e.g. 'topic' for 'pulsar/topic.json'."""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def load_script(script_name: str) -> ModuleType:
+    """
+    Import one of the scripts next to this module, whose file names are not
+    valid module names, e.g. load_script('cleanup-grafana-dashboards').generate_uid.
+    """
+    module_name = script_name.replace('-', '_')
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{script_name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
+
+
+def iter_panels(dashboard: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+    """
+    Yield all panels of a dashboard in order, including the panels nested in
+    collapsed rows.
+
+    Yields:
+        tuple: (panel, row) where row is the enclosing collapsed row panel or None
+    """
+    def walk(panels, row):
+        for panel in panels or []:
+            if not isinstance(panel, dict):
+                continue
+            yield panel, row
+            if 'panels' in panel:
+                yield from walk(panel['panels'], panel)
+
+    yield from walk(dashboard.get('panels'), None)
+
+
+def iter_targets(dashboard: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Yield (panel, target) pairs for all targets with a non-empty PromQL expression.
+    """
+    for panel, _ in iter_panels(dashboard):
+        for target in panel.get('targets') or []:
+            if isinstance(target, dict) and isinstance(target.get('expr'), str) and target['expr'].strip():
+                yield panel, target
+
+
+def datasource_uid(datasource: Any) -> Optional[str]:
+    """Return the UID of a datasource reference, which is a name or a {type, uid} dict depending on the Grafana version."""
+    return datasource.get('uid') if isinstance(datasource, dict) else datasource
+
+
+def panel_query_targets(panel: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Return the targets of a panel that Grafana queries Prometheus with when the
+    panel is shown: none for rows, text and library panels and panels using a
+    non-Prometheus data source, otherwise the targets that are not hidden.
+    """
+    if panel.get('type') in NO_QUERY_PANEL_TYPES or panel.get('libraryPanel'):
+        return []
+    if datasource_uid(panel.get('datasource')) in NON_PROMETHEUS_DATASOURCES:
+        return []
+    return [target for target in panel.get('targets') or []
+            if isinstance(target, dict) and not target.get('hide') and str(target.get('expr') or '').strip()]
+
+
+def panel_label(panel: Dict[str, Any]) -> str:
+    """Return a short human readable label for a panel."""
+    title = panel.get('title') or '(untitled)'
+    if 'id' in panel:
+        return f"{title} [id={panel['id']}]"
+    return title
+
+
+def template_variables_by_name(dashboard: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    templating = dashboard.get('templating')
+    if not isinstance(templating, dict):
+        return {}
+    return {variable['name']: variable for variable in templating.get('list') or []
+            if isinstance(variable, dict) and 'name' in variable}
+
+
+def variable_query_text(variable: Dict[str, Any]) -> Optional[str]:
+    """Return the query of a query variable, which is a string or a dict depending on the Grafana version."""
+    if variable.get('type') != 'query':
+        return None
+    query = variable.get('query')
+    query_text = query.get('query') if isinstance(query, dict) else query
+    if not isinstance(query_text, str) or not query_text.strip():
+        return None
+    return query_text
+
+
+def collect_label_usage(dashboards: List[Dict[str, Any]]) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    Return an index of the labels each metric is referenced with in panel
+    targets and template variable queries, with how they are referenced:
+    'matcher', 'by' and 'without' clauses of enclosing aggregations, 'on',
+    'ignoring' and 'group' modifiers of enclosing binary operations, 'function'
+    arguments (e.g. the source label of label_replace), 'label_values' lookups
+    and the 'legend' format of the target.
+
+    Legend labels are attributed to all metrics of the target, as the result
+    series carry the labels of any of them.
+
+    Returns:
+        dict: {metric: {label: set of reference kinds}}
+    """
+    index: Dict[str, Dict[str, Set[str]]] = {}
+
+    def add(metric, labels, kind):
+        for label in labels:
+            if label != '__name__':
+                index.setdefault(metric, {}).setdefault(label, set()).add(kind)
+
+    def collect(root, legend):
+        for node, parents in walk_with_parents(root):
+            if isinstance(node, Call) and node.func == 'label_values' and len(node.args) == 2 \
+                    and isinstance(node.args[0], VectorSelector) and isinstance(node.args[1], VectorSelector):
+                selector, label = node.args[0], node.args[1].metric
+                if selector.metric_name:
+                    add(selector.metric_name, [label], 'label_values')
+                    add(selector.metric_name, [m.name for m in selector.matchers], 'matcher')
+                continue
+            # The arguments of label_values are recorded with the call, its label argument is no metric
+            if not isinstance(node, VectorSelector) or not node.metric_name or any(
+                    isinstance(parent, Call) and parent.func == 'label_values' for parent in parents):
+                continue
+            metric = node.metric_name
+            index.setdefault(metric, {})
+            add(metric, [m.name for m in node.matchers], 'matcher')
+            add(metric, legend, 'legend')
+            for parent in parents:
+                if isinstance(parent, Aggregation):
+                    add(metric, parent.grouping, 'without' if parent.without else 'by')
+                elif isinstance(parent, BinaryExpr) and parent.matching is not None:
+                    add(metric, parent.matching.labels, 'on' if parent.matching.on else 'ignoring')
+                    add(metric, parent.matching.include, 'group')
+                elif isinstance(parent, Call) and parent.func in _LABEL_ARGUMENT_FUNCTIONS:
+                    arguments = parent.args[_LABEL_ARGUMENT_FUNCTIONS[parent.func]:]
+                    add(metric, [a.value for a in arguments if isinstance(a, StringLiteral)], 'function')
+
+    for dashboard in dashboards:
+        for _, target in iter_targets(dashboard):
+            legend = _LEGEND_LABEL_RE.findall(target.get('legendFormat') or '')
+            try:
+                collect(parse(target['expr']), legend)
+            except ParseError:
+                continue
+        for query in filter(None, map(variable_query_text, template_variables_by_name(dashboard).values())):
+            try:
+                collect(parse(query), [])
+            except ParseError:
+                continue
+    return index
+
+
+def labels_by_metric(label_index: Dict[str, Dict[str, Set[str]]],
+                     grouping_labels: Collection[str] = ()) -> Dict[str, Set[str]]:
+    """
+    Return the labels each metric is matched on or looked up with label_values
+    in an index of collect_label_usage(), i.e. the labels the metric is known
+    to have.
+
+    A metric grouped `by` a label may not have it, e.g. `broker` in
+    avg(pulsar_subscriptions_count) by (broker), so labels only grouped by are
+    left out unless they are in grouping_labels.
+    """
+    return {metric: {label for label, kinds in labels.items()
+                     if kinds & SERIES_LABEL_KINDS or ('by' in kinds and label in grouping_labels)}
+            for metric, labels in label_index.items()}
+
+
+def is_multi_valued(variable: Optional[Dict[str, Any]]) -> bool:
+    """
+    Whether a template variable can expand to more than one value.
+
+    Unknown variables (e.g. Grafana built-ins) are treated as multi-valued so
+    that callers stay on the safe side.
+    """
+    if variable is None:
+        return True
+    if variable.get('type') in ('constant', 'textbox', 'interval'):
+        return False
+    return bool(variable.get('multi')) or bool(variable.get('includeAll'))
+
+
+_REGEX_META_RE = re.compile(r'[.*+?()\[\]{}|^$\\]')
+
+
+def is_literal(value: str) -> bool:
+    """Whether a label value contains no regex metacharacters and no variables."""
+    return not _REGEX_META_RE.search(value)
+
+
+def matches_single_value(matcher: LabelMatcher, variables: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Whether a positive matcher always selects exactly one label value at query
+    time, e.g. `topic="$topic"` or `cluster=~"$cluster"` with a single-valued
+    `cluster` variable.
+    """
+    if matcher.is_negative:
+        return False
+    names = template_variables(matcher.value)
+    if any(is_multi_valued(variables.get(name)) for name in names):
+        return False
+    if matcher.op == '=':
+        return True
+    # A regex matcher selects one value if it is only made of single-valued
+    # variables and literal text
+    return is_literal(strip_template_variables(matcher.value))
+
+
+def is_single_variable_regex(matcher: LabelMatcher, variables: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Whether a matcher is a regex matcher fed only by a single-valued variable,
+    e.g. `cluster=~"$cluster"` where `cluster` is neither multi nor includeAll.
+    """
+    return (matcher.op == '=~' and is_template_variable(matcher.value)
+            and not is_multi_valued(variables.get(template_variables(matcher.value)[0])))
+
+
+def _distinct_label_values(node: Node, label: str, variables: Dict[str, Dict[str, Any]]) -> int:
+    """Estimate the number of distinct values of a label in the series an expression selects."""
+    distinct = 1
+    for selector in selectors(node):
+        if any(m.name == label and matches_single_value(m, variables) for m in selector.matchers):
+            continue
+        level = LEVELS[metric_level(selector.metric_name)]
+        narrowing = level['narrowing'].get(label)
+        if narrowing:
+            distinct = max(distinct, level['series'] // narrowing)
+        else:
+            distinct = max(distinct, min(level['series'], FLEET_LABEL_VALUES.get(label, level['series'])))
+    return distinct
+
+
+def _aggregation_param(node: Optional[Node], variables: Dict[str, Dict[str, Any]]) -> Optional[int]:
+    """
+    Return the largest value the numeric parameter of topk/bottomk/limitk can
+    take, resolving a template variable (e.g. topk($limit, ...)) to its largest
+    option or current value, or None if it is unknown.
+    """
+    node = unwrap_parens(node) if node is not None else None
+    if isinstance(node, NumberLiteral):
+        values = [node.value]
+    elif isinstance(node, TemplateVariable) and node.name in variables:
+        variable = variables[node.name]
+        values = [option.get('value') for option in variable.get('options') or []]
+        values.append((variable.get('current') or {}).get('value'))
+        if variable.get('type') in ('custom', 'constant') and isinstance(variable.get('query'), str):
+            values.extend(variable['query'].split(','))
+    else:
+        return None
+    numbers = []
+    for value in values:
+        for item in value if isinstance(value, list) else [value]:
+            try:
+                numbers.append(int(float(str(item).strip())))
+            except ValueError:
+                continue
+    return max(1, max(numbers)) if numbers else None
+
+
+def estimate_result_series(node: Node, variables: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Estimate the number of series an expression returns in the reference fleet
+    of metric_catalog.py, e.g. one per group of `sum by (...)`.
+
+    Args:
+        node: The parsed expression
+        variables: Template variables of the dashboard by name
+
+    Returns:
+        int: Estimated number of result series, 1 for scalars
+    """
+    node = unwrap_parens(node)
+    if isinstance(node, VectorSelector):
+        exact_labels = [m.name for m in node.matchers if matches_single_value(m, variables)]
+        return estimate_series(node.metric_name, exact_labels)
+    if isinstance(node, Aggregation):
+        series = estimate_result_series(node.expr, variables)
+        if not node.without:
+            groups = 1
+            for label in node.grouping:
+                groups *= _distinct_label_values(node.expr, label, variables)
+            if node.op in ('topk', 'bottomk', 'limitk'):
+                # An unknown k does not bound the number of series
+                k = _aggregation_param(node.param, variables)
+                groups = groups * k if k is not None else series
+            series = min(series, groups)
+        return series
+    # Functions, operators and subqueries return at most as many series as their largest operand
+    return max([estimate_result_series(child, variables) for child in node.children()
+                if not isinstance(child, LabelMatcher)] or [1])
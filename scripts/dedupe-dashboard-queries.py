@@ -0,0 +1,272 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Query Deduplicator
+----------------------------
+
+This script finds panels whose queries are all already issued by another
+panel of the same dashboard, and rewires them to Grafana's '-- Dashboard --'
+data source, which reuses the results of the other panel instead of querying
+Prometheus again. Every deduplicated panel saves one request per target on
+every load and auto-refresh of the dashboard.
+
+Targets are compared by their parsed and canonically formatted expression
+(see promql.py), so differences in whitespace and formatting do not matter,
+together with the options that change the request: instant/range, format,
+interval and intervalFactor of the target, and the interval, maxDataPoints,
+timeFrom and timeShift of the panel.
+
+A panel is rewired when:
+1. All its queried targets are issued by one other panel, the source panel,
+   which keeps querying Prometheus
+2. Neither panel is a library panel, repeated or in a repeated row
+3. The source panel is queried whenever the panel is shown: it is not in a
+   collapsed row, or in the same collapsed row
+
+The rewired panel selects the frames of its targets with a filterByRefId
+transformation (when it uses a subset of the source panel targets), followed
+by its own transformations. A different legend is kept with a displayName
+override on the frames of the target, where {{label}} becomes
+${__field.labels.label}. Legacy panels (graph, singlestat, table-old) do not
+support overrides, so they are only rewired when the legends are the same.
+The resolution of a rewired panel follows the source panel.
+
+Usage:
+    python dedupe-dashboard-queries.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --dry-run    Only print the report, do not modify any files
+    --check      Like --dry-run, but exit with status 1 if any panel would be rewired
+
+Output:
+    - Rewired panels and their source panels per dashboard
+    - Summary of the backend queries saved per load and per refresh
+"""
+
+import argparse
+import re
+import sys
+
+from dashboards import (DASHBOARD_DATASOURCE, default_dashboard_files, iter_panels, load_dashboard, panel_label,
+                        panel_query_targets, write_dashboard)
+from promql import ParseError, format_expr, parse
+
+# Panel types without field config overrides, see the module docstring
+LEGACY_PANEL_TYPES = {'graph', 'singlestat', 'table-old'}
+
+# Panel options that change the requests of all its targets
+PANEL_QUERY_OPTIONS = ('interval', 'maxDataPoints', 'timeFrom', 'timeShift')
+
+_LEGEND_LABEL_RE = re.compile(r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}')
+
+
+def canonical_expr(expr):
+    try:
+        return format_expr(parse(expr))
+    except ParseError:
+        return ' '.join(expr.split())
+
+
+def target_key(panel, target):
+    """Return the key of the request a target issues, equal for targets issuing the same request."""
+    return (
+        canonical_expr(target['expr']),
+        bool(target.get('instant')),
+        target.get('range', not target.get('instant')) is not False,
+        target.get('format') or 'time_series',
+        target.get('interval') or '',
+        target.get('intervalFactor') or 1,
+        tuple(panel.get(option) for option in PANEL_QUERY_OPTIONS),
+    )
+
+
+def legend_display_name(legend):
+    """Convert a Prometheus legend format to a Grafana displayName, e.g. '{{pod}} in' to '${__field.labels.pod} in'."""
+    return _LEGEND_LABEL_RE.sub(r'${__field.labels.\1}', legend)
+
+
+def is_repeated(panel):
+    return bool(panel.get('repeat')) or 'repeatPanelId' in panel
+
+
+def iter_shareable_panels(dashboard):
+    """
+    Yield (panel, collapsed row) for the panels that can share their queries:
+    panels with an id that are not library panels, not repeated and not in a
+    repeated row, where template variables have a different value per copy.
+    """
+    section_row = None
+    for panel, row in iter_panels(dashboard):
+        if panel.get('type') == 'row':
+            section_row = panel
+            continue
+        if row is None and section_row is not None and not section_row.get('collapsed'):
+            containing_row = section_row
+        else:
+            containing_row = row
+        if containing_row is not None and is_repeated(containing_row):
+            continue
+        if isinstance(panel.get('id'), int) and not is_repeated(panel) and not panel.get('libraryPanel'):
+            yield panel, row
+
+
+def find_source(panel, row, candidates, consumers):
+    """
+    Find the source panel issuing all queries of a panel.
+
+    Args:
+        panel (dict): Panel to rewire
+        row (dict, optional): Collapsed row of the panel
+        candidates (list): (panel, collapsed row, {target key: target}) of the possible source panels
+        consumers (set): Ids of the panels already rewired, which cannot be a source
+
+    Returns:
+        tuple: (source panel, [(target, source target)]) or None
+    """
+    targets = panel_query_targets(panel)
+    for source, source_row, source_targets in candidates:
+        if source is panel or id(source) in consumers:
+            continue
+        if source_row is not None and source_row is not row:
+            continue
+        pairs = []
+        for target in targets:
+            source_target = source_targets.get(target_key(panel, target))
+            if source_target is None:
+                break
+            legend = target.get('legendFormat') or ''
+            if legend != (source_target.get('legendFormat') or ''):
+                if panel.get('type') in LEGACY_PANEL_TYPES or not legend:
+                    break
+            pairs.append((target, source_target))
+        else:
+            return source, pairs
+    return None
+
+
+def rewire_panel(panel, source, pairs):
+    """Rewire a panel to the '-- Dashboard --' data source, reusing the results of the source panel."""
+    datasource = {'type': 'datasource', 'uid': DASHBOARD_DATASOURCE}
+    source_ref_ids = [source_target['refId'] for _, source_target in pairs]
+
+    transformations = []
+    if len(panel_query_targets(source)) > len(set(source_ref_ids)):
+        include = source_ref_ids[0] if len(set(source_ref_ids)) == 1 else f"({'|'.join(sorted(set(source_ref_ids)))})"
+        transformations.append({'id': 'filterByRefId', 'options': {'include': include}})
+    transformations.extend(panel.get('transformations') or [])
+
+    overrides = []
+    for target, source_target in pairs:
+        legend = target.get('legendFormat') or ''
+        if legend != (source_target.get('legendFormat') or ''):
+            overrides.append({
+                'matcher': {'id': 'byFrameRefID', 'options': source_target['refId']},
+                'properties': [{'id': 'displayName', 'value': legend_display_name(legend)}],
+            })
+    if overrides:
+        field_config = panel.setdefault('fieldConfig', {'defaults': {}, 'overrides': []})
+        field_config['overrides'] = overrides + (field_config.get('overrides') or [])
+
+    panel['datasource'] = datasource
+    panel['targets'] = [{'datasource': datasource, 'panelId': source['id'], 'refId': 'A'}]
+    if transformations:
+        panel['transformations'] = transformations
+
+
+def dedupe_dashboard(dashboard):
+    """
+    Rewire the panels of a dashboard whose queries are issued by another panel.
+
+    Args:
+        dashboard (dict): Dashboard, modified in place
+
+    Returns:
+        list: (panel label, source panel label, queries saved, shown on load) of the rewired panels
+    """
+    candidates = []
+    panels = []
+    for panel, row in iter_shareable_panels(dashboard):
+        if not panel_query_targets(panel):
+            continue
+        panels.append((panel, row))
+        source_targets = {}
+        for target in panel_query_targets(panel):
+            source_targets.setdefault(target_key(panel, target), target)
+        candidates.append((panel, row, source_targets))
+
+    rewired = []
+    consumers = set()
+    sources = set()
+    # Bottom up, so that the topmost of identical panels stays the source
+    for panel, row in reversed(panels):
+        if id(panel) in sources:
+            continue
+        found = find_source(panel, row, candidates, consumers)
+        if found is None:
+            continue
+        source, pairs = found
+        queries = len(panel_query_targets(panel))
+        rewire_panel(panel, source, pairs)
+        consumers.add(id(panel))
+        sources.add(id(source))
+        rewired.append((panel_label(panel), panel_label(source), queries, row is None))
+    return rewired[::-1]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Query Deduplicator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any panel would be rewired, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    write = not (args.dry_run or args.check)
+
+    rewired_panels = 0
+    rewired_files = 0
+    saved_on_load = 0
+    saved_deferred = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        rewired = dedupe_dashboard(dashboard)
+        if not rewired:
+            continue
+        print(f"- {file_path}:")
+        for label, source_label, queries, on_load in rewired:
+            print(f"    {label} <- {source_label} ({queries} {'queries' if queries != 1 else 'query'} saved"
+                  f"{'' if on_load else ', in a collapsed row'})")
+            if on_load:
+                saved_on_load += queries
+            else:
+                saved_deferred += queries
+        rewired_panels += len(rewired)
+        rewired_files += 1
+        if write:
+            write_dashboard(file_path, dashboard)
+
+    print(f"\nSummary:")
+    print(f"  Panels {'rewired' if write else 'to rewire'}: {rewired_panels} in {rewired_files} dashboards")
+    print(f"  Backend queries saved per load and per refresh: {saved_on_load}")
+    print(f"  Backend queries saved when expanding collapsed rows: {saved_deferred}")
+
+    if args.check and rewired_panels:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
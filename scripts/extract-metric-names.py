@@ -1,79 +1,104 @@
 #!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "pyyaml",
+# ]
+# ///
+"""
+Dashboard Metric Name and Label Extractor
+-----------------------------------------
+
+This script extracts the metric names queried by Grafana dashboards, and
+optionally an index of the labels each metric is referenced with, built from
+all panel targets and template variable queries: label matchers, by/without
+clauses, on/ignoring/group_left modifiers, label arguments of functions like
+label_replace() and the {{label}} placeholders of legend formats.
+
+From them it generates metric relabel configs for each scraped component
+(broker, bookie, zookeeper, proxy, function worker and Oxia, see
+scrape_relabeling.py), applied at scrape time so that series no dashboard
+uses are never ingested.
+
+With --keep, a keep rule allows only the metric families queried by panels
+and template variables. Histograms and summaries are kept as a family: a
+dashboard querying only foo_bucket keeps foo_bucket, foo_sum and foo_count,
+and a summary foo also keeps its foo quantile series. The JVM and process
+metrics that all components expose are kept for all components. Every other
+metric is dropped, including metrics used by alerts or other dashboards, so
+the rules are meant for deployments where these dashboards are the only
+consumers.
+
+With --labeldrop, a labeldrop rule drops the labels no dashboard uses on the
+metrics of a component. Only labels that service
+discovery attaches to every series of a scrape target are dropped (see
+SERVICE_DISCOVERY_LABELS in metric_catalog.py, e.g. pod, container or
+controller_revision_hash): they have one value per target, so dropping them
+never makes two series of a target collide, but they are stored in every
+series and labels like controller_revision_hash create new series on every
+rollout. Labels used on the JVM and process metrics that all components
+expose are kept for all components. instance and job are never dropped.
+
+Usage:
+    python extract-metric-names.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --labels               Print the label index instead of the metric names
+    --json                 Print the metric names or the label index as JSON
+    --keep                 Print the keep relabel configs per component as YAML
+    --labeldrop            Print the labeldrop relabel configs per component as YAML
+    --style STYLE          Relabel config style: 'operator' for the metricRelabelConfigs of a
+                           VMPodScrape/VMServiceScrape or PodMonitor endpoint, 'prometheus' for the
+                           metric_relabel_configs of a Prometheus or vmagent scrape job (default: operator)
+    --candidates LIST      Comma separated labels that may be dropped (default: SERVICE_DISCOVERY_LABELS)
+
+The keep rules can also be added to the Pulsar Helm chart values with the
+--scrape-allowlist option of generate-victoria-metrics-k8s-stack-values.py.
+
+Output:
+    - Metric names, one per line, the label index or the relabel configs on stdout
+    - Number of metrics per dashboard and the labels dropped per component on stderr
+"""
+
+import argparse
 import json
-import re
 import sys
 from pathlib import Path
-from typing import Set, Dict, Any
+from typing import Set, Dict, Any, Optional
+
+import yaml
+
+from dashboards import collect_label_usage, default_dashboard_files
+from metric_catalog import SERVICE_DISCOVERY_LABELS
+from promql import parse, metric_names, ParseError
+from scrape_relabeling import (RELABEL_STYLES, component_metric_families, dashboard_metric_names, keep_relabel_configs,
+                               labeldrop_relabel_configs, unused_labels)
 
 def extract_metric_names_from_promql(promql: str) -> Set[str]:
     """
     Extract metric names from a PromQL query string.
     
+    The query is parsed into an AST (see promql.py), so function names,
+    keywords, label names in `by (...)` clauses, durations and anything
+    inside label value strings or template variables are never mistaken
+    for metric names.
+    
     Args:
         promql: A PromQL query string
         
     Returns:
         A set of unique metric names found in the query
     """
-    # This regex pattern matches metric names in PromQL
-    # A metric name must follow Prometheus naming conventions:
-    # It must match the regex [a-zA-Z_:][a-zA-Z0-9_:]*
-    pattern = r'(?<![a-zA-Z0-9_:])([a-zA-Z_:][a-zA-Z0-9_:]*)(?={|\[|\(|\s|$)'
-    
-    # Find all matches in the query
-    metric_names = re.findall(pattern, promql)
-    
-    # Comprehensive list of PromQL keywords, operators, and functions
-    promql_keywords = {
-        # Operators
-        'and', 'or', 'unless', 'by', 'without', 'on', 'ignoring', 'group_left', 
-        'group_right', 'offset', 'bool',
-        
-        # Aggregation operators
-        'sum', 'min', 'max', 'avg', 'group', 'stddev', 'stdvar', 'count', 'count_values', 
-        'bottomk', 'topk', 'quantile',
-        
-        # Functions for counter/gauge
-        'rate', 'increase', 'irate', 'delta', 'idelta', 'predict_linear', 'deriv',
-        'resets', 'changes',
-        
-        # Functions for histogram
-        'histogram_quantile', 'histogram_sum', 'histogram_count', 'histogram_fraction',
-        
-        # Range vector functions
-        'avg_over_time', 'min_over_time', 'max_over_time', 'sum_over_time',
-        'count_over_time', 'quantile_over_time', 'stddev_over_time', 'stdvar_over_time',
-        'last_over_time', 'present_over_time',
-        
-        # PromQL 2.x functions
-        'label_join', 'label_replace', 'absent', 'scalar', 'vector', 'time',
-        
-        # Mathematical functions
-        'abs', 'ceil', 'floor', 'exp', 'sqrt', 'ln', 'log2', 'log10', 'round',
-        'clamp', 'clamp_min', 'clamp_max',
-        
-        # Trigonometric functions
-        'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'deg', 'rad', 'pi',
-        
-        # Date & time functions
-        'day_of_week', 'day_of_month', 'day_of_year', 'days_in_month', 'month',
-        'year', 'hour', 'minute', 'timestamp',
-        
-        # Label manipulation
-        'label_replace', 'label_join',
-        
-        # String functions
-        'sort', 'sort_desc',
-        
-        # Other utility functions
-        'sgn', 'absent', 'absent_over_time', 'present_over_time', 'vector',
-        
-        # Common time units often used in expressions
-        's', 'm', 'h', 'd', 'w', 'y'
-    }
+    if not promql.strip():
+        return set()
     
-    # Return filtered unique metric names
-    return {name for name in metric_names if name not in promql_keywords}
+    try:
+        return metric_names(parse(promql))
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return set()
 
 def extract_metrics_from_dashboard(dashboard_json: Dict[Any, Any]) -> Set[str]:
     """
@@ -107,48 +132,120 @@ def extract_metrics_from_dashboard(dashboard_json: Dict[Any, Any]) -> Set[str]:
     
     return metrics
 
-def process_dashboard_file(file_path: Path) -> Set[str]:
+def load_dashboard_file(file_path: Path) -> Optional[Dict[str, Any]]:
     """
-    Process a Grafana dashboard JSON file and extract metric names.
+    Load a Grafana dashboard JSON file.
     
     Args:
         file_path: Path to the dashboard JSON file
         
     Returns:
-        A set of unique metric names
+        The parsed dashboard, or None if it cannot be read
     """
     try:
         with open(file_path, 'r') as f:
-            dashboard = json.load(f)
-        return extract_metrics_from_dashboard(dashboard)
+            return json.load(f)
     except json.JSONDecodeError:
         print(f"Error: {file_path} is not a valid JSON file", file=sys.stderr)
-        return set()
+        return None
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}", file=sys.stderr)
-        return set()
+        return None
+
+def process_dashboard_file(file_path: Path) -> Set[str]:
+    """
+    Process a Grafana dashboard JSON file and extract metric names.
+    
+    Args:
+        file_path: Path to the dashboard JSON file
+        
+    Returns:
+        A set of unique metric names
+    """
+    dashboard = load_dashboard_file(file_path)
+    return extract_metrics_from_dashboard(dashboard) if dashboard is not None else set()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Metric Name and Label Extractor",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--labels', action='store_true',
+                        help='Print the labels each metric is referenced with instead of the metric names')
+    output.add_argument('--keep', action='store_true',
+                        help='Print keep relabel configs per component for the metric families the dashboards query')
+    output.add_argument('--labeldrop', action='store_true',
+                        help='Print labeldrop relabel configs per component for the labels no dashboard uses')
+    parser.add_argument('--style', choices=RELABEL_STYLES, default='operator',
+                        help='Relabel config style: operator (metricRelabelConfigs) or prometheus (metric_relabel_configs)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the metric names or the label index as JSON')
+    parser.add_argument('--candidates', default=','.join(SERVICE_DISCOVERY_LABELS),
+                        help='Comma separated labels that may be dropped (default: the service discovery labels)')
+    return parser.parse_args()
 
 def main():
-    # Check if file paths were provided
-    if len(sys.argv) < 2:
-        print("Usage: python extract_metrics.py <dashboard_file1.json> [dashboard_file2.json ...]", file=sys.stderr)
-        sys.exit(1)
+    args = parse_arguments()
     
     # Process all input files
     all_metrics = set()
-    for file_path in sys.argv[1:]:
+    dashboards = []
+    for file_path in args.files or default_dashboard_files():
         path = Path(file_path)
         if not path.exists():
             print(f"Warning: File {file_path} does not exist", file=sys.stderr)
             continue
         
-        metrics = process_dashboard_file(path)
+        dashboard = load_dashboard_file(path)
+        if dashboard is None:
+            continue
+        dashboards.append(dashboard)
+        metrics = extract_metrics_from_dashboard(dashboard)
         all_metrics.update(metrics)
         print(f"Found {len(metrics)} unique metrics in {file_path}", file=sys.stderr)
     
+    if args.labels:
+        label_index = collect_label_usage(dashboards)
+        if args.json:
+            print(json.dumps({metric: {label: sorted(kinds) for label, kinds in sorted(labels.items())}
+                              for metric, labels in sorted(label_index.items())}, indent=2))
+            return
+        for metric, labels in sorted(label_index.items()):
+            references = [f"{label} ({', '.join(sorted(kinds))})" for label, kinds in sorted(labels.items())]
+            print(f"{metric}: {', '.join(references)}")
+        return
+    
+    if args.keep:
+        families = component_metric_families(*dashboard_metric_names(dashboards))
+        for component, component_families in families.items():
+            histograms = sum(1 for histogram in component_families.values() if histogram)
+            print(f"{component}: keeping {len(component_families)} metric families, "
+                  f"{histograms} of them histograms or summaries", file=sys.stderr)
+        yaml.dump({component: keep_relabel_configs(component_families, args.style)
+                   for component, component_families in families.items()},
+                  sys.stdout, default_flow_style=False, sort_keys=False, width=float('inf'))
+        return
+    
+    if args.labeldrop:
+        candidates = [label.strip() for label in args.candidates.split(',') if label.strip()]
+        dropped = unused_labels(collect_label_usage(dashboards), candidates)
+        for component, labels in dropped.items():
+            kept = sorted(set(candidates) - set(labels))
+            print(f"{component}: dropping {len(labels)} of {len(candidates)} candidate labels"
+                  f"{', keeping ' + ', '.join(kept) if kept else ''}", file=sys.stderr)
+        yaml.dump({component: labeldrop_relabel_configs(labels) for component, labels in dropped.items()},
+                  sys.stdout, default_flow_style=False, sort_keys=False, width=float('inf'))
+        return
+    
     # Sort the metrics and print to stdout
+    if args.json:
+        print(json.dumps(sorted(all_metrics), indent=2))
+        return
     for metric in sorted(all_metrics):
         print(metric)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "pyyaml",
+# ]
+# ///
+"""
+Long-Range Dashboard Generator
+------------------------------
+
+The dashboards default to the last 15 minutes with a 30s refresh, and their
+queries are written for that: rate() over [1m] windows, per-pod breakdowns,
+the scrape interval as the step. Opened over 30 to 90 days for capacity
+reviews, they scan every raw sample at full resolution and return one series
+per pod. This script writes a "long-range" variant of each dashboard, which
+can be provisioned next to the original:
+
+1. Queries read coarser data:
+   - Aggregations recorded by generate-recording-rules.py (--recording-rules)
+     read the recorded series, averaged over the step with avg_over_time()
+     (max_over_time() and min_over_time() for max and min)
+   - irate() becomes rate(), which at a coarse step covers the whole step
+     instead of the last two samples
+   - Fixed rate windows become $__rate_interval, and increase(v[w]) becomes
+     rate(v[$__rate_interval]) * w, see normalize-rate-intervals.py (the
+     hourly and daily totals of its default allowlist are kept)
+2. Per-pod breakdowns are dropped: the pod labels (kubernetes_pod_name, pod,
+   instance) are removed from the by() clauses of the outermost aggregations
+   and from the legends (sums over summary quantiles become max()). Pod
+   variables keep filtering, e.g.
+       sum(rate(bookie_WRITE_BYTES{kubernetes_pod_name=~"$instance"}[60s])) by (kubernetes_pod_name)
+   becomes
+       sum(rate(bookie_WRITE_BYTES{kubernetes_pod_name=~"$instance"}[$__rate_interval]))
+   Queries that also read raw per-pod series outside of an aggregation, or
+   match on pod labels, keep their breakdown and are reported.
+3. Every query panel gets a minimum interval (--min-interval), so that the
+   step and $__rate_interval never go below it
+4. The variant defaults to the last 30 days without auto-refresh, is tagged
+   'long-range', and gets its own UID from the generate_uid() scheme of
+   cleanup-grafana-dashboards.py for the path <dir>/<dashboard>-long-range.json,
+   so both variants can be provisioned side by side. The cleanup script keeps
+   that UID, but would reset the time range and refresh of the variant.
+
+Usage:
+    python generate-long-range-dashboards.py [options] [file1.json ...]
+
+    Without file arguments, pulsar/bookkeeper.json, pulsar/overview.json and
+    oxia/oxia-shards.json are processed.
+
+Options:
+    --output-dir DIR         Directory for the variants (default: build/long-range)
+    --time-from TIME         Default start of the time range (default: now-30d)
+    --min-interval DURATION  Minimum interval of the query panels (default: 1h)
+    --recording-rules FILE   Recording rules file generated by generate-recording-rules.py
+    --project-id ID          Project identifier for UID generation (default: "lhotari/pulsar-grafana-dashboards")
+
+Output:
+    - <output-dir>/<dir>/<dashboard>-long-range.json long-range variants
+    - Report of the rewritten queries and the panels still showing per-pod series
+"""
+
+import argparse
+import copy
+import os
+import re
+import sys
+from collections import Counter
+
+import yaml
+
+from dashboards import (REPO_ROOT, dashboard_name, iter_panels, load_dashboard, load_script, panel_label,
+                        panel_query_targets, template_variables_by_name, write_dashboard)
+from promql import (Aggregation, BinaryExpr, Call, ParseError, VectorSelector, apply_edits, duration_seconds, parse,
+                    walk, walk_with_parents)
+
+DEFAULT_DASHBOARDS = ['pulsar/bookkeeper.json', 'pulsar/overview.json', 'oxia/oxia-shards.json']
+
+VARIANT_SUFFIX = 'long-range'
+VARIANT_TAG = 'long-range'
+
+# Labels identifying a pod, whose breakdowns are dropped
+POD_LABELS = ['kubernetes_pod_name', 'pod', 'instance']
+
+# Function averaging a recorded series over the step, by the aggregation of the rule (default avg_over_time)
+OVER_TIME_FUNCTIONS = {'max': 'max_over_time', 'min': 'min_over_time'}
+
+STEP_INTERVAL = '$__interval'
+AUTO_LEGEND = '__auto'
+
+
+def load_recorded_names(rules_path):
+    """Return the recorded series names of a rules file in any format of generate-recording-rules.py."""
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        document = yaml.safe_load(f)
+    groups = (document.get('spec') or document).get('groups') or []
+    return {rule['record'] for group in groups for rule in group.get('rules') or [] if 'record' in rule}
+
+
+def read_recorded_series(query, variables, records):
+    """
+    Rewrite the aggregations of a query that have recorded series, averaging
+    the recorded series over the step.
+
+    Returns:
+        tuple: (rewritten query, number of recorded series used)
+    """
+    recording_rules = load_script('generate-recording-rules')
+    query, used = recording_rules.rewrite_query(query, variables, {}, allowed=records)
+    if not used:
+        return query, 0
+    edits = []
+    for node in walk(parse(query)):
+        if isinstance(node, VectorSelector) and node.metric in records:
+            op = node.metric.split(':')[2].split('_')[0]
+            function = OVER_TIME_FUNCTIONS.get(op, 'avg_over_time')
+            edits.append((node.start, node.end, f"{function}({query[node.start:node.end]}[{STEP_INTERVAL}])"))
+    return apply_edits(query, edits), len(used)
+
+
+def _grouping_edit(query, node, labels):
+    """Return the edit removing labels from the by() clause of an aggregation."""
+    start, end = node.grouping_span
+    kept = [label for label in node.grouping if label not in labels]
+    if kept:
+        return query.index('(', start), end, f"({', '.join(kept)})"
+    # Without any label left, the clause is removed with the whitespace around it
+    while start > 0 and query[start - 1].isspace():
+        start -= 1
+    if node.grouping_first:
+        while end < len(query) and query[end].isspace():
+            end += 1
+    return start, end, ''
+
+
+def coarse_query_edits(query, root):
+    """
+    Return the edits replacing irate() with rate() and dropping per-pod
+    breakdowns from the outermost aggregations of a query.
+
+    Returns:
+        tuple: (edits, pod labels dropped, reason the breakdown was kept or None)
+    """
+    edits = []
+    dropped = set()
+    pod_aggregations = []
+    raw_selectors = False
+    matching_pods = False
+    for node, parents in walk_with_parents(root):
+        if isinstance(node, Call) and node.func == 'irate':
+            edits.append((node.start, node.start + len('irate'), 'rate'))
+        elif isinstance(node, VectorSelector):
+            raw_selectors = raw_selectors or not any(isinstance(parent, Aggregation) for parent in parents)
+        elif isinstance(node, BinaryExpr) and node.matching is not None:
+            matching_pods = matching_pods or bool(set(node.matching.labels + node.matching.include) & set(POD_LABELS))
+        elif isinstance(node, Aggregation) and not any(isinstance(parent, Aggregation) for parent in parents):
+            labels = set(node.grouping_labels) & set(POD_LABELS)
+            if labels:
+                pod_aggregations.append((node, labels))
+
+    if not pod_aggregations:
+        return edits, dropped, None
+    if raw_selectors:
+        return edits, dropped, 'reads raw series outside of an aggregation'
+    if matching_pods:
+        return edits, dropped, 'matches series on pod labels'
+    for node, labels in pod_aggregations:
+        edits.append(_grouping_edit(query, node, labels))
+        dropped |= labels
+        # The sum of the quantiles of one pod becomes the largest quantile of all pods
+        if node.op == 'sum' and all(s.matchers_for('quantile') for s in walk(node.expr) if isinstance(s, VectorSelector)):
+            edits.append((node.start, node.start + len('sum'), 'max'))
+    return edits, dropped, None
+
+
+def strip_legend_labels(legend, labels):
+    """Remove the {{label}} references of labels, with the separator before them, from a legend format."""
+    for label in labels:
+        legend = re.sub(r'(\s*[-|:/,]\s*)?\{\{\s*' + re.escape(label) + r'\s*\}\}', '', legend)
+    legend = re.sub(r'^[\s\-|:/,]+', '', legend).strip()
+    return legend or AUTO_LEGEND
+
+
+def rewrite_target(query, file_path, panel, variables, records, normalize, stats):
+    """
+    Rewrite a query for long time ranges.
+
+    Returns:
+        tuple: (rewritten query, pod labels dropped, reason the per-pod breakdown was kept or None)
+    """
+    if records:
+        query, recorded = read_recorded_series(query, variables, records)
+        stats['recorded series read'] += recorded
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {file_path}: {panel_label(panel)}: {e}", file=sys.stderr)
+        return query, set(), None
+    edits, dropped, kept_reason = coarse_query_edits(query, root)
+    stats['irate() replaced with rate()'] += sum(1 for _, _, text in edits if text == 'rate')
+    query = apply_edits(query, edits)
+    window_stats = Counter()
+    query, _ = normalize.normalize_query(query, file_path, panel, normalize.DEFAULT_ALLOWLIST, window_stats)
+    stats['rate windows normalized'] += sum(n for key, n in window_stats.items() if key[2] == 'rewritten')
+    return query, dropped, kept_reason
+
+
+def set_min_interval(panel, min_interval):
+    """Raise the minimum interval of a query panel and its targets to min_interval, returns whether it changed."""
+    changed = False
+    current = duration_seconds(panel['interval']) if panel.get('interval') else 0
+    if current is not None and current < duration_seconds(min_interval):
+        panel['interval'] = min_interval
+        changed = True
+    for target in panel_query_targets(panel):
+        seconds = duration_seconds(target['interval']) if target.get('interval') else None
+        if seconds is not None and seconds < duration_seconds(min_interval):
+            del target['interval']
+            changed = True
+    return changed
+
+
+def long_range_variant(dashboard, file_path, project_id, time_from, min_interval, records):
+    """
+    Build the long-range variant of a dashboard.
+
+    Args:
+        dashboard (dict): Dashboard, not modified
+        file_path (str): Path of the dashboard file
+        project_id (str): Project identifier for UID generation
+        time_from (str): Default start of the time range
+        min_interval (str): Minimum interval of the query panels
+        records (set): Recorded series names that can be read, may be empty
+
+    Returns:
+        tuple: (variant, relative path of the variant, results)
+    """
+    cleanup = load_script('cleanup-grafana-dashboards')
+    normalize = load_script('normalize-rate-intervals')
+    variant = copy.deepcopy(dashboard)
+    variables = template_variables_by_name(variant)
+    rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(file_path)), REPO_ROOT)
+    variant_path = os.path.join(rel_dir, f"{dashboard_name(file_path)}-{VARIANT_SUFFIX}.json")
+
+    results = {'stats': Counter(), 'targets_rewritten': 0, 'per_pod': []}
+    for panel, _ in iter_panels(variant):
+        targets = panel_query_targets(panel)
+        if not targets:
+            continue
+        if set_min_interval(panel, min_interval):
+            results['stats']['panel intervals raised'] += 1
+        for target in targets:
+            new_expr, dropped, kept_reason = rewrite_target(target['expr'], file_path, panel, variables, records,
+                                                            normalize, results['stats'])
+            if dropped:
+                results['stats']['per-pod breakdowns dropped'] += 1
+                if target.get('legendFormat'):
+                    target['legendFormat'] = strip_legend_labels(target['legendFormat'], POD_LABELS)
+            if kept_reason:
+                results['per_pod'].append((f"{panel_label(panel)} ({target.get('refId', '?')})", kept_reason))
+            if new_expr != target['expr']:
+                target['expr'] = new_expr
+                results['targets_rewritten'] += 1
+
+    variant['title'] = f"{dashboard.get('title', dashboard_name(file_path))} (long range)"
+    variant['tags'] = list(dashboard.get('tags') or []) + [VARIANT_TAG]
+    variant['time'] = {'from': time_from, 'to': 'now'}
+    variant['refresh'] = ''
+    variant['uid'] = cleanup.generate_uid(variant_path, variant, project_id)
+    return variant, variant_path, results
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Long-Range Dashboard Generator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: bookkeeper, overview and oxia-shards)')
+    parser.add_argument('--output-dir', default='build/long-range',
+                        help='Directory for the variants')
+    parser.add_argument('--time-from', default='now-30d',
+                        help='Default start of the time range')
+    parser.add_argument('--min-interval', default='1h',
+                        help='Minimum interval of the query panels')
+    parser.add_argument('--recording-rules', metavar='FILE',
+                        help='Recording rules file generated by generate-recording-rules.py')
+    parser.add_argument('--project-id', default=load_script('cleanup-grafana-dashboards').get_default_project_id(),
+                        help='Project identifier for UID generation')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    file_paths = args.files or [os.path.relpath(os.path.join(REPO_ROOT, path)) for path in DEFAULT_DASHBOARDS]
+
+    if not duration_seconds(args.min_interval):
+        print(f"Error: '{args.min_interval}' is not a valid interval")
+        sys.exit(1)
+    records = set()
+    if args.recording_rules:
+        try:
+            records = load_recorded_names(args.recording_rules)
+        except (OSError, yaml.YAMLError, AttributeError) as e:
+            print(f"Error reading '{args.recording_rules}': {e}")
+            sys.exit(1)
+
+    totals = Counter()
+    variants = 0
+    for file_path in file_paths:
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        variant, variant_path, results = long_range_variant(dashboard, file_path, args.project_id, args.time_from,
+                                                            args.min_interval, records)
+        output_path = os.path.join(args.output_dir, os.path.basename(os.path.dirname(variant_path)),
+                                   os.path.basename(variant_path))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        write_dashboard(output_path, variant)
+        variants += 1
+
+        print(f"- Wrote '{output_path}' (uid '{variant['uid']}', original '{dashboard.get('uid')}')")
+        print(f"    targets rewritten: {results['targets_rewritten']}")
+        for name, count in sorted(results['stats'].items()):
+            print(f"    {name}: {count}")
+        for label, reason in results['per_pod']:
+            print(f"    kept per-pod breakdown of {label}: {reason}")
+        totals.update(results['stats'])
+        totals['targets rewritten'] += results['targets_rewritten']
+        totals['targets still per pod'] += len(results['per_pod'])
+
+    print(f"\nSummary:")
+    print(f"  Long-range variants written: {variants}")
+    print(f"  Targets rewritten: {totals['targets rewritten']}")
+    print(f"  Recorded series read: {totals['recorded series read']}")
+    print(f"  irate() replaced with rate(): {totals['irate() replaced with rate()']}")
+    print(f"  Rate windows normalized: {totals['rate windows normalized']}")
+    print(f"  Per-pod breakdowns dropped: {totals['per-pod breakdowns dropped']}")
+    print(f"  Targets still showing per-pod series: {totals['targets still per pod']}")
+    print(f"  Panel intervals raised to {args.min_interval}: {totals['panel intervals raised']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "pyyaml",
+# ]
+# ///
+"""
+Dashboard Recording Rule Generator
+----------------------------------
+
+This script finds aggregations over raw per-topic (and per-subscription)
+series in Grafana dashboard queries, e.g.
+
+    sum(pulsar_throughput_in{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, namespace)
+
+and turns them into recording rules that precompute the aggregation once per
+rule evaluation instead of on every dashboard refresh:
+
+    record: cluster_namespace:pulsar_throughput_in:sum
+    expr: sum by (cluster, namespace) (pulsar_throughput_in)
+
+Labels bound to template variables are moved from the matchers into the
+grouping of the rule, so the dashboards can keep filtering on them. It then
+writes rewritten dashboard variants that query the recorded series:
+
+    sum(cluster_namespace:pulsar_throughput_in:sum{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, namespace)
+
+Only aggregations that can be re-aggregated without changing the result are
+rewritten (sum, min, max, count, and avg when all variable bound labels are
+single-valued), and only when the rule actually reduces the number of series,
+i.e. the grouping does not keep the topic (or subscription) label.
+
+Recorded series names follow the Prometheus `level:metric:operations`
+convention and are derived from the expression only, so they are stable
+across runs.
+
+Usage:
+    python generate-recording-rules.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --output-dir DIR      Directory for rewritten dashboards and the rules file (default: build/recording-rules)
+    --format FORMAT       Rules file format: 'vmrule', 'prometheusrule' or 'rules' (plain rule file) (default: vmrule)
+    --min-uses N          Only record expressions used at least N times across all dashboards (default: 1)
+    --interval DURATION   Rule group evaluation interval (default: 30s)
+    --name NAME           Name of the VMRule/PrometheusRule object and rule group prefix (default: pulsar-dashboards)
+
+The rules file can be passed to generate-victoria-metrics-k8s-stack-values.py
+with --recording-rules to deploy the rules together with the dashboards.
+
+Output:
+    - <output-dir>/recording-rules.yaml with the recording rules
+    - <output-dir>/<dir>/<dashboard>.json rewritten dashboards querying the recorded series
+    - Report of the recorded expressions and their uses
+"""
+
+import argparse
+import copy
+import hashlib
+import os
+import re
+import sys
+from typing import Optional
+
+import yaml
+
+from dashboards import (dashboard_name, default_dashboard_files, iter_targets, load_dashboard,
+                        matches_single_value, template_variables_by_name, write_dashboard)
+from metric_catalog import metric_level
+from promql import (Aggregation, Call, MatrixSelector, ParseError, VectorSelector, apply_edits, duration_seconds,
+                    format_matchers, parse, walk)
+
+# Aggregations whose results can be aggregated again with the given operator
+REAGGREGATION = {'sum': 'sum', 'min': 'min', 'max': 'max', 'count': 'sum'}
+
+# Functions over counters that can be precomputed in a recording rule
+RECORDABLE_FUNCTIONS = {'rate', 'irate', 'increase'}
+
+# Labels that identify a single series of a topic-level metric family. A rule
+# that keeps one of them does not reduce the number of series.
+LEVEL_KEY_LABELS = {
+    'topic': {'topic'},
+    'subscription': {'subscription'},
+    'consumer': {'consumer_name', 'consumer_id'},
+}
+
+RULE_FORMATS = ['vmrule', 'prometheusrule', 'rules']
+
+
+class RecordingRule:
+    """A recording rule and the dashboard targets that use it."""
+
+    def __init__(self, record, expr, metric):
+        self.record = record
+        self.expr = expr
+        self.metric = metric
+        self.uses = []
+
+    def to_dict(self):
+        return {'record': self.record, 'expr': self.expr}
+
+
+def _strip_total(metric):
+    return metric[:-len('_total')] if metric.endswith('_total') else metric
+
+
+def recorded_name(grouping, metric, func, window, op, literal_matchers):
+    """
+    Build a stable `level:metric:operations` name for a recorded series.
+    """
+    level = '_'.join(grouping) if grouping else 'global'
+    if func:
+        metric = _strip_total(metric)
+        operations = f"{op}_{func}{window}"
+    else:
+        operations = op
+    if literal_matchers:
+        # Different fixed filters record different series
+        digest = hashlib.sha256(literal_matchers.encode('utf-8')).hexdigest()[:8]
+        operations += f"_{digest}"
+    return f"{level}:{metric}:{operations}"
+
+
+def find_candidate(query, node, variables) -> Optional[tuple]:
+    """
+    Check if an aggregation node can be replaced by a recorded series.
+
+    Returns:
+        tuple: (rule_record, rule_expr, metric, replacement_edits) or None
+    """
+    if not isinstance(node, Aggregation) or node.without or node.param is not None or node.extra_args:
+        return None
+    op = node.op
+    if op not in REAGGREGATION and op != 'avg':
+        return None
+
+    inner = node.expr
+    func, window = None, None
+    if isinstance(inner, Call) and inner.func in RECORDABLE_FUNCTIONS and len(inner.args) == 1:
+        matrix = inner.args[0]
+        if not isinstance(matrix, MatrixSelector) or duration_seconds(matrix.range) is None:
+            return None
+        func, window = inner.func, matrix.range
+        selector = matrix.vector
+    elif isinstance(inner, VectorSelector):
+        selector = inner
+    else:
+        return None
+    if selector.offset or selector.at or not selector.metric:
+        return None
+
+    metric = selector.metric
+    level = metric_level(metric)
+    if level not in LEVEL_KEY_LABELS:
+        return None
+
+    variable_matchers, literal_matchers = [], []
+    for matcher in selector.matchers:
+        if matcher.variables:
+            if matcher.is_negative:
+                return None
+            variable_matchers.append(matcher)
+        else:
+            literal_matchers.append(matcher)
+
+    if op == 'avg' and not all(matches_single_value(m, variables) for m in variable_matchers):
+        # avg of averages is only exact if every variable selects a single group
+        return None
+
+    grouping = sorted(set(node.grouping) | {m.name for m in variable_matchers})
+    if LEVEL_KEY_LABELS[level] & set(grouping):
+        return None
+
+    literal_text = format_matchers(literal_matchers) if literal_matchers else ''
+    rule_selector = f"{metric}{literal_text}"
+    if func:
+        rule_selector = f"{func}({rule_selector}[{window}])"
+    dashboard_op = REAGGREGATION.get(op, op)
+    rule_expr = f"{op} by ({', '.join(grouping)}) ({rule_selector})" if grouping else f"{op}({rule_selector})"
+    record = recorded_name(grouping, metric, func, window, op, literal_text)
+
+    # Query the recorded series, keeping the original variable matchers verbatim
+    replacement = record
+    if variable_matchers:
+        replacement += '{' + ', '.join(query[m.start:m.end] for m in variable_matchers) + '}'
+    edits = [(inner.start, inner.end, replacement)]
+    if dashboard_op != op:
+        edits.append((node.start, node.start + len(op), dashboard_op))
+    return record, rule_expr, metric, edits
+
+
+def rewrite_query(query, variables, rules, allowed=None):
+    """
+    Rewrite all recordable aggregations of a query.
+
+    Args:
+        query (str): The PromQL expression
+        variables (dict): Template variables of the dashboard by name
+        rules (dict): Recording rules by record name, updated in place
+        allowed (set, optional): Only rewrite to these record names
+
+    Returns:
+        tuple: (rewritten query, list of record names used)
+    """
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return query, []
+
+    edits, used = [], []
+    for node in walk(root):
+        candidate = find_candidate(query, node, variables)
+        if candidate is None:
+            continue
+        record, rule_expr, metric, node_edits = candidate
+        if allowed is not None and record not in allowed:
+            continue
+        rule = rules.get(record)
+        if rule is None:
+            rule = rules[record] = RecordingRule(record, rule_expr, metric)
+        elif rule.expr != rule_expr:
+            print(f"Warning: conflicting expressions for '{record}': '{rule.expr}' and '{rule_expr}'",
+                  file=sys.stderr)
+            continue
+        edits.extend(node_edits)
+        used.append(record)
+    return apply_edits(query, edits), used
+
+
+def build_rules_document(rules, rule_format, name, interval):
+    group = {
+        'name': f"{name}.recording-rules",
+        'interval': interval,
+        'rules': [rule.to_dict() for rule in sorted(rules, key=lambda r: r.record)],
+    }
+    if rule_format == 'rules':
+        return {'groups': [group]}
+    if rule_format == 'vmrule':
+        api_version, kind = 'operator.victoriametrics.com/v1beta1', 'VMRule'
+    else:
+        api_version, kind = 'monitoring.coreos.com/v1', 'PrometheusRule'
+    return {
+        'apiVersion': api_version,
+        'kind': kind,
+        'metadata': {'name': f"{name}-recording-rules"},
+        'spec': {'groups': [group]},
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Recording Rule Generator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--output-dir', default='build/recording-rules',
+                        help='Directory for rewritten dashboards and the rules file')
+    parser.add_argument('--format', choices=RULE_FORMATS, default='vmrule',
+                        help='Format of the generated rules file')
+    parser.add_argument('--min-uses', type=int, default=1,
+                        help='Only record expressions used at least this many times')
+    parser.add_argument('--interval', default='30s',
+                        help='Rule group evaluation interval')
+    parser.add_argument('--name', default='pulsar-dashboards',
+                        help='Name of the rule object and rule group prefix')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    file_paths = args.files or default_dashboard_files()
+
+    if not re.fullmatch(r'[a-z0-9]([-a-z0-9]*[a-z0-9])?', args.name):
+        print(f"Error: '{args.name}' is not a valid Kubernetes object name")
+        sys.exit(1)
+
+    # First pass: collect candidate rules and their uses
+    dashboards = {}
+    rules = {}
+    for file_path in file_paths:
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+        dashboards[file_path] = dashboard
+        variables = template_variables_by_name(dashboard)
+        for panel, target in iter_targets(dashboard):
+            _, used = rewrite_query(target['expr'], variables, rules)
+            for record in used:
+                rules[record].uses.append((file_path, panel.get('title'), target.get('refId')))
+
+    selected = {record: rule for record, rule in rules.items() if len(rule.uses) >= args.min_uses}
+
+    # Second pass: rewrite dashboards to query the selected recorded series
+    os.makedirs(args.output_dir, exist_ok=True)
+    rewritten_targets = 0
+    rewritten_files = 0
+    for file_path, dashboard in dashboards.items():
+        variant = copy.deepcopy(dashboard)
+        variables = template_variables_by_name(variant)
+        modified = False
+        for _, target in iter_targets(variant):
+            new_expr, used = rewrite_query(target['expr'], variables, rules, allowed=selected.keys())
+            if used:
+                target['expr'] = new_expr
+                rewritten_targets += 1
+                modified = True
+        if modified:
+            rel_dir = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+            output_path = os.path.join(args.output_dir, rel_dir, f"{dashboard_name(file_path)}.json")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            write_dashboard(output_path, variant)
+            rewritten_files += 1
+            print(f"- Wrote '{output_path}'")
+
+    rules_path = os.path.join(args.output_dir, 'recording-rules.yaml')
+    document = build_rules_document(selected.values(), args.format, args.name, args.interval)
+    with open(rules_path, 'w', encoding='utf-8') as f:
+        yaml.dump(document, f, default_flow_style=False, sort_keys=False)
+    print(f"- Wrote {len(selected)} recording rules to '{rules_path}'")
+
+    # Print report
+    print("\n" + "="*60)
+    print("Recorded expressions by number of uses:")
+    for rule in sorted(selected.values(), key=lambda r: (-len(r.uses), r.record)):
+        files = sorted({dashboard_name(use[0]) for use in rule.uses})
+        print(f"  {len(rule.uses):>3}  {rule.record}")
+        print(f"       {rule.expr}")
+        print(f"       used in: {', '.join(files)}")
+    print(f"\nSummary:")
+    print(f"  Candidate expressions found: {len(rules)}")
+    print(f"  Recording rules generated: {len(selected)}")
+    print(f"  Targets rewritten: {rewritten_targets}")
+    print(f"  Dashboards rewritten: {rewritten_files}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "pyyaml",
+# ]
+# ///
+"""
+Dashboard Stream Aggregation Generator
+--------------------------------------
+
+This script derives VictoriaMetrics stream aggregation rules from the
+namespace, broker and cluster level aggregations of per-topic metrics in
+Grafana dashboard queries, e.g.
+
+    sum(pulsar_throughput_in{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, namespace)
+    sum(increase(pulsar_in_bytes_total[1d])) by (cluster)
+
+vmagent aggregates the matching samples while ingesting them and writes one
+output series per group, so the dashboards only read a few aggregated series
+instead of every per-topic series at query time:
+
+    - match: pulsar_throughput_in
+      interval: 30s
+      by: [cluster, namespace]
+      outputs: [sum_samples]
+    - match: pulsar_in_bytes_total
+      interval: 30s
+      by: [cluster]
+      outputs: [total]
+
+Like generate-recording-rules.py, labels bound to template variables (and
+labels of fixed matchers such as job=~"broker") are added to `by`, so the
+dashboards keep filtering on them. It then writes rewritten dashboard variants
+that query the output series, named by vmagent
+`<metric>:<interval>_by_<labels>_<output>`:
+
+    sum(pulsar_throughput_in:30s_by_cluster_namespace_sum_samples{cluster=~"$cluster", namespace="$tenant/$namespace"}) by (cluster, namespace)
+    sum(increase(pulsar_in_bytes_total:30s_by_cluster_total[1d])) by (cluster)
+
+Aggregations are mapped to outputs that give the same result:
+- sum, min, max, count and avg of a gauge to sum_samples, min, max,
+  count_series and avg, re-aggregated by the dashboard with sum, min, max,
+  sum and avg (avg only when all matched labels are single-valued)
+- sum of rate() or increase() of a counter to total, a counter of the summed
+  increases that the dashboard applies the same function to
+
+Per-sample outputs (sum_samples, avg) see one sample per series and interval
+only when the interval is the scrape interval, which is the default. The
+rate windows of the rewritten queries must cover at least two intervals.
+Only aggregations that reduce the number of series are rewritten, i.e. whose
+`by` does not keep the topic (or subscription) label.
+
+The default dashboards are those that only show aggregates of per-topic
+metrics. Other dashboards (e.g. topic.json) still read the raw series, so
+vmagent has to keep its input (-streamAggr.keepInput, or keepInput in the
+VMAgent streamAggrConfig) unless their raw series are dropped on purpose.
+
+Usage:
+    python generate-stream-aggregation.py [options] [file1.json ...]
+
+    Without file arguments, pulsar/overview.json, pulsar/messaging.json and
+    pulsar/namespace.json are processed.
+
+Options:
+    --output-dir DIR      Directory for rewritten dashboards and the config (default: build/stream-aggregation)
+    --format FORMAT       Config format: 'config' (file for -streamAggr.config) or 'vmagent'
+                          (victoria-metrics-k8s-stack values for vmagent.spec.streamAggrConfig) (default: config)
+    --interval DURATION   Aggregation interval, the scrape interval of the aggregated metrics (default: 30s)
+
+Output:
+    - <output-dir>/stream-aggregation.yaml with the stream aggregation rules
+    - <output-dir>/<dir>/<dashboard>.json rewritten dashboards querying the output series
+    - Report of the aggregation rules and their uses, and of the targets still
+      reading raw per-topic series
+"""
+
+import argparse
+import copy
+import os
+import sys
+from typing import Optional
+
+import yaml
+
+from dashboards import (REPO_ROOT, dashboard_name, iter_targets, load_dashboard, matches_single_value,
+                        template_variables_by_name, write_dashboard)
+from metric_catalog import REFERENCE_FLEET, TOPIC_LEVEL_KEYS, metric_level
+from promql import (Aggregation, Call, MatrixSelector, ParseError, VectorSelector, apply_edits, duration_seconds,
+                    parse, walk)
+
+DEFAULT_DASHBOARDS = ['pulsar/overview.json', 'pulsar/messaging.json', 'pulsar/namespace.json']
+
+# Output of the aggregation of a gauge, and the aggregation applied to the output series by the dashboard
+GAUGE_OUTPUTS = {
+    'sum': ('sum_samples', 'sum'),
+    'min': ('min', 'min'),
+    'max': ('max', 'max'),
+    'count': ('count_series', 'sum'),
+    'avg': ('avg', 'avg'),
+}
+
+# Functions over counters whose sum is computed from the total output
+COUNTER_FUNCTIONS = {'rate', 'increase'}
+COUNTER_OUTPUT = 'total'
+
+CONFIG_FORMATS = ['config', 'vmagent']
+
+
+class AggregationRule:
+    """A stream aggregation rule, its outputs and the dashboard targets that use them."""
+
+    def __init__(self, metric, by):
+        self.metric = metric
+        self.by = by
+        self.outputs = set()
+        self.uses = []
+
+    def to_dict(self, interval):
+        rule = {'match': self.metric, 'interval': interval}
+        if self.by:
+            rule['by'] = list(self.by)
+        rule['outputs'] = sorted(self.outputs)
+        return rule
+
+
+def output_name(metric, interval, by, output):
+    """Return the name vmagent gives the output series of a rule, e.g. `pulsar_rate_in:30s_by_cluster_sum_samples`."""
+    by_text = f"_by_{'_'.join(by)}" if by else ''
+    return f"{metric}:{interval}{by_text}_{output}"
+
+
+def find_candidate(query, node, variables, interval) -> Optional[tuple]:
+    """
+    Check if an aggregation node can read the output series of a stream aggregation rule.
+
+    Returns:
+        tuple: (metric, by, output, replacement_edits) or None
+    """
+    if not isinstance(node, Aggregation) or node.without or node.param is not None or node.extra_args:
+        return None
+    op = node.op
+
+    inner = node.expr
+    if isinstance(inner, Call) and inner.func in COUNTER_FUNCTIONS and len(inner.args) == 1:
+        if op != 'sum':
+            return None
+        matrix = inner.args[0]
+        if not isinstance(matrix, MatrixSelector):
+            return None
+        window = duration_seconds(matrix.range)
+        # Template variable windows like $__rate_interval span at least four scrape intervals
+        if window is not None and window < 2 * duration_seconds(interval):
+            return None
+        selector = matrix.vector
+        output, dashboard_op = COUNTER_OUTPUT, op
+    elif isinstance(inner, VectorSelector) and op in GAUGE_OUTPUTS:
+        selector = inner
+        # sum_samples would give the same sum of a raw counter, but counters are
+        # aggregated with the total output, which handles counter resets and
+        # restarts and starts at zero, so it cannot stand in for raw counter values
+        if (selector.metric or '').endswith('_total'):
+            return None
+        output, dashboard_op = GAUGE_OUTPUTS[op]
+    else:
+        return None
+    if selector.offset or selector.at or not selector.metric:
+        return None
+
+    metric = selector.metric
+    level = metric_level(metric)
+    if level not in TOPIC_LEVEL_KEYS:
+        return None
+
+    matchers = [m for m in selector.matchers if m.name != '__name__']
+    if op == 'avg' and not all(matches_single_value(m, variables) for m in matchers if m.name not in node.grouping):
+        # avg of averages is only exact if every matched label selects a single group
+        return None
+
+    # Matched labels stay on the output series, so the dashboard keeps filtering on them
+    by = tuple(sorted(set(node.grouping) | {m.name for m in matchers}))
+    if set(TOPIC_LEVEL_KEYS[level]) & set(by):
+        return None
+
+    edits = [(selector.start, selector.start + len(metric), output_name(metric, interval, by, output))]
+    if dashboard_op != op:
+        edits.append((node.start, node.start + len(op), dashboard_op))
+    return metric, by, output, edits
+
+
+def rewrite_query(query, variables, rules, interval):
+    """
+    Rewrite all aggregations of a query that can read stream aggregation output series.
+
+    Args:
+        query (str): The PromQL expression
+        variables (dict): Template variables of the dashboard by name
+        rules (dict): Aggregation rules by (metric, by), updated in place
+        interval (str): Aggregation interval
+
+    Returns:
+        tuple: (rewritten query, list of (rule key, output) used)
+    """
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return query, []
+
+    edits, used = [], []
+    for node in walk(root):
+        candidate = find_candidate(query, node, variables, interval)
+        if candidate is None:
+            continue
+        metric, by, output, node_edits = candidate
+        rule = rules.get((metric, by))
+        if rule is None:
+            rule = rules[(metric, by)] = AggregationRule(metric, by)
+        rule.outputs.add(output)
+        edits.extend(node_edits)
+        used.append(((metric, by), output))
+    return apply_edits(query, edits), used
+
+
+def raw_topic_metrics(query):
+    """Return the per-topic metrics a query still reads raw series of, skipping output series (`metric:...`)."""
+    try:
+        root = parse(query)
+    except ParseError:
+        return []
+    return sorted({node.metric_name for node in walk(root)
+                   if isinstance(node, VectorSelector) and node.metric_name and ':' not in node.metric_name
+                   and metric_level(node.metric_name) in TOPIC_LEVEL_KEYS})
+
+
+def build_config_document(rules, config_format, interval):
+    config = [rule.to_dict(interval) for rule in sorted(rules, key=lambda r: (r.metric, r.by))]
+    if config_format == 'config':
+        return config
+    return {'vmagent': {'spec': {'streamAggrConfig': {'keepInput': True, 'rules': config}}}}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Stream Aggregation Generator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: overview, messaging and namespace)')
+    parser.add_argument('--output-dir', default='build/stream-aggregation',
+                        help='Directory for rewritten dashboards and the config')
+    parser.add_argument('--format', choices=CONFIG_FORMATS, default='config',
+                        help='Format of the generated config')
+    parser.add_argument('--interval', default=f"{REFERENCE_FLEET['scrape_interval']}s",
+                        help='Aggregation interval, the scrape interval of the aggregated metrics')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    file_paths = args.files or [os.path.relpath(os.path.join(REPO_ROOT, path)) for path in DEFAULT_DASHBOARDS]
+
+    if not duration_seconds(args.interval):
+        print(f"Error: '{args.interval}' is not a valid interval")
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    rules = {}
+    rewritten_targets = 0
+    rewritten_files = 0
+    raw_targets = {}
+    for file_path in file_paths:
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        variant = copy.deepcopy(dashboard)
+        variables = template_variables_by_name(variant)
+        modified = False
+        for panel, target in iter_targets(variant):
+            new_expr, used = rewrite_query(target['expr'], variables, rules, args.interval)
+            for key, output in used:
+                rules[key].uses.append((file_path, panel.get('title'), target.get('refId'), output))
+            if used:
+                target['expr'] = new_expr
+                rewritten_targets += 1
+                modified = True
+            raw = raw_topic_metrics(target['expr'])
+            if raw:
+                raw_targets.setdefault(file_path, []).append((panel.get('title'), target.get('refId'), raw))
+        if modified:
+            rel_dir = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+            output_path = os.path.join(args.output_dir, rel_dir, f"{dashboard_name(file_path)}.json")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            write_dashboard(output_path, variant)
+            rewritten_files += 1
+            print(f"- Wrote '{output_path}'")
+
+    config_path = os.path.join(args.output_dir, 'stream-aggregation.yaml')
+    document = build_config_document(rules.values(), args.format, args.interval)
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.dump(document, f, default_flow_style=False, sort_keys=False)
+    print(f"- Wrote {len(rules)} stream aggregation rules to '{config_path}'")
+
+    # Print report
+    print("\n" + "="*60)
+    print("Aggregation rules by number of uses:")
+    for rule in sorted(rules.values(), key=lambda r: (-len(r.uses), r.metric, r.by)):
+        files = sorted({dashboard_name(use[0]) for use in rule.uses})
+        print(f"  {len(rule.uses):>3}  {rule.metric} by ({', '.join(rule.by)})")
+        for output in sorted(rule.outputs):
+            print(f"       {output_name(rule.metric, args.interval, rule.by, output)}")
+        print(f"       used in: {', '.join(files)}")
+    if raw_targets:
+        print("\nTargets still reading raw per-topic series:")
+        for file_path, targets in raw_targets.items():
+            print(f"  {file_path}:")
+            for title, ref_id, metrics in targets:
+                print(f"    {title} ({ref_id or '?'}): {', '.join(metrics)}")
+    print(f"\nSummary:")
+    print(f"  Stream aggregation rules generated: {len(rules)}")
+    print(f"  Output series names: {sum(len(rule.outputs) for rule in rules.values())}")
+    print(f"  Targets rewritten: {rewritten_targets}")
+    print(f"  Targets still reading raw per-topic series: {sum(len(t) for t in raw_targets.values())}")
+    print(f"  Dashboards rewritten: {rewritten_files}")
+
+
+if __name__ == "__main__":
+    main()
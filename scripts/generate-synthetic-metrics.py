@@ -0,0 +1,153 @@
+#!/usr/bin/env -S uv run
+"""
+Synthetic Metrics Generator
+---------------------------
+
+This script writes Prometheus exposition text for a synthetic Pulsar and Oxia
+deployment of a given size, as an offline test fixture for the dashboards in
+this repository.
+
+The generated metrics are the ones the dashboards query today, with the label
+sets they are queried with:
+1. Metric names and labels are collected from the panel targets and template
+   variable queries of the dashboards. Labels only used in `by` clauses are
+   left out unless synthetic_fleet.py knows their values (e.g. 'le', 'mode'),
+   as a metric grouped by a label may not have it
+2. The series of each metric are modelled by synthetic_fleet.py: exposed by the
+   pods of a component and split per namespace, topic, subscription, function
+   or Oxia shard depending on the metric family
+3. Histogram buckets (metrics ending in _bucket) get the 'le' label
+
+Usage:
+    python generate-synthetic-metrics.py [options] [file1.json ...]
+
+    Without file arguments, the metrics of all dashboards in pulsar/ and oxia/
+    are generated.
+
+Options:
+    --output FILE                  Write the exposition text to FILE (default: stdout)
+    --scale SCALE                  Size the fleet for 10k, 100k, 1M or a number of topics
+    --brokers N, --bookies N, ...  Override single fleet dimensions, see --help
+    --seed N                       Seed of the random sample values (default: 0)
+
+Output:
+    - Prometheus exposition text, one block per metric with a # TYPE line
+    - Summary of metrics and series written, on stderr
+"""
+
+import argparse
+import json
+import random
+import sys
+from dataclasses import fields
+
+from dashboards import collect_label_usage, default_dashboard_files, labels_by_metric, load_dashboard
+from synthetic_fleet import EXTRA_LABEL_VALUES, SCALES, Fleet, SeriesModel, fleets_for_scales
+
+LE_VALUES = EXTRA_LABEL_VALUES['le']
+
+
+def metric_type(metric):
+    """Return the exposition type of a metric from its name."""
+    if metric.endswith('_total'):
+        return 'counter'
+    if metric.endswith(('_bucket', '_sum', '_count')):
+        # The histogram or summary may only be partially queried, so the
+        # series are written as independent untyped series
+        return 'untyped'
+    return 'gauge'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_series(metric, labels, value):
+    label_text = ','.join(f'{name}="{_escape(labels[name])}"' for name in sorted(labels))
+    return f"{metric}{{{label_text}}} {value}\n"
+
+
+def write_exposition(output, fleet, metric_labels, seed=0):
+    """
+    Write the exposition text of all metrics.
+
+    Args:
+        output: Text stream to write to
+        fleet (Fleet): The fleet to generate series for
+        metric_labels (dict): Queried labels by metric name
+        seed (int): Seed of the random sample values
+
+    Returns:
+        tuple: (metrics, series) written
+    """
+    rng = random.Random(seed)
+    series_count = 0
+    for metric in sorted(metric_labels):
+        kind = metric_type(metric)
+        output.write(f"# TYPE {metric} {kind}\n")
+        for labels in SeriesModel(fleet, metric, metric_labels[metric]).iter_series():
+            if 'le' in labels and metric.endswith('_bucket'):
+                # Bucket counts are cumulative, so they grow with the upper bound
+                value = (LE_VALUES.index(labels['le']) + 1) * 100
+            elif kind == 'counter':
+                value = rng.randint(0, 1_000_000)
+            else:
+                value = round(rng.uniform(0, 1000), 3)
+            output.write(format_series(metric, labels, value))
+            series_count += 1
+    return len(metric_labels), series_count
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Synthetic Metrics Generator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to take the metrics from (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='Write the exposition text to FILE instead of stdout')
+    parser.add_argument('--scale', default='10k',
+                        help=f"Size the fleet for a number of topics: {', '.join(SCALES)} or a number")
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random sample values')
+    for field in fields(Fleet):
+        if field.type is int:
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, metavar='N',
+                                help=f"Override the number of {field.name.replace('_', ' ')}")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    try:
+        fleet = fleets_for_scales([args.scale])[args.scale]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    overrides = {f.name: getattr(args, f.name) for f in fields(Fleet)
+                 if getattr(args, f.name, None) is not None}
+    if overrides:
+        fleet = Fleet(**{**fleet.as_dict(), **overrides})
+
+    dashboards = []
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboards.append(load_dashboard(file_path))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error processing '{file_path}': {e}. Skipping.", file=sys.stderr)
+    metric_labels = labels_by_metric(collect_label_usage(dashboards), EXTRA_LABEL_VALUES)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            metrics, series = write_exposition(output, fleet, metric_labels, args.seed)
+    else:
+        metrics, series = write_exposition(sys.stdout, fleet, metric_labels, args.seed)
+
+    print(f"Wrote {series:,} series of {metrics} metrics for {fleet.topics:,} topics, "
+          f"{fleet.namespaces:,} namespaces, {fleet.brokers} brokers"
+          + (f" to {args.output}" if args.output else ''), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
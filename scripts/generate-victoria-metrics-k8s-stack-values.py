@@ -17,7 +17,41 @@ and uses a capitalized version as the folder. The URL for each dashboard
 points to the lhotari/pulsar-grafana-dashboards GitHub project.
 
 Usage:
-    python generate-dashboard-yaml.py dashboard1.json [dashboard2.json ...]
+    python generate-dashboard-yaml.py [options] dashboard1.json [dashboard2.json ...]
+
+Options:
+    --recording-rules FILE   Add the recording rules generated by generate-recording-rules.py
+                             (any of its formats) to additionalVictoriaMetricsMap
+    --artifacts-manifest FILE
+                             Point the dashboard URLs at the minified artifacts built by
+                             build-dashboard-artifacts.py, using the manifest it wrote
+    --artifacts-url URL      Base URL the artifacts directory is published at, required
+                             with --artifacts-manifest
+    --bundle-configmaps      Pack the dashboards into ConfigMaps instead of downloading them
+                             from URLs, see below
+    --configmap-max-bytes N  Maximum data size of a bundle ConfigMap (default: 1000000)
+    --unpack-image IMAGE     Image of the init container unpacking the bundles (default: busybox)
+    --scrape-allowlist       Only ingest the metric families the dashboards query, see below
+
+ConfigMap bundles:
+    With --bundle-configmaps, the minified dashboards of each provider are
+    gzipped into the binaryData of ConfigMaps, split so that every ConfigMap
+    stays under the 1 MiB Kubernetes object size limit. The ConfigMaps are added
+    to extraObjects with a content-hash annotation, so an upgrade only changes
+    the ConfigMaps whose dashboards changed. The Grafana values mount the
+    ConfigMaps, unpack them with an init container into an emptyDir that the
+    dashboard providers read from, and roll the Grafana pods through a checksum
+    pod annotation when any dashboard changed. Grafana starts without network
+    access to GitHub.
+
+Scrape allowlist:
+    With --scrape-allowlist, the podMonitor of every Pulsar component in the
+    chart values gets a metricRelabelings keep rule allowing only the metric
+    families the given dashboards query (see scrape_relabeling.py), so that the
+    thousands of unused broker metric families are dropped at scrape time.
+    Function workers run in the broker pods, so the broker rule also keeps
+    the function metrics. Metrics used by alerts or other dashboards are
+    dropped too, so the option is off by default.
 
 Output:
     YAML configuration printed to stdout that can be copied into values.yaml
@@ -25,25 +59,238 @@ Output:
 
 import sys
 import os
+import argparse
+import base64
+import hashlib
+import json
 import yaml
 
+from dashboard_artifacts import compress, load_manifest, manifest_entry, minify_dashboard
+from dashboards import load_dashboard
+from scrape_relabeling import component_metric_families, dashboard_metric_names, keep_relabel_configs
+
 # GitHub repository URL where dashboards will be hosted
 GITHUB_REPO = "lhotari/pulsar-grafana-dashboards"
 GITHUB_BRANCH = "master"  # or change to your branch name
 GITHUB_RAW_URL = f"https://raw.githubusercontent.com/{GITHUB_REPO}/{GITHUB_BRANCH}"
 
-def generate_yaml_config(file_paths):
+# ConfigMap bundles: prefix of the ConfigMap names, annotation of the content hash,
+# data size limit with headroom for the metadata under the 1 MiB object size limit
+CONFIGMAP_PREFIX = "pulsar-grafana-dashboards"
+CONTENT_HASH_ANNOTATION = "pulsar-grafana-dashboards/content-hash"
+MAX_CONFIGMAP_BYTES = 1_000_000
+UNPACK_IMAGE = "docker.io/library/busybox:1.36"
+# Where the bundle ConfigMaps are mounted and the unpacked dashboards are read from
+BUNDLES_PATH = "/var/lib/grafana/dashboard-bundles"
+BUNDLED_DASHBOARDS_PATH = "/var/lib/grafana/dashboards-bundled"
+# Pulsar Helm chart component values with a podMonitor, and the scraped components running in their pods
+CHART_SCRAPE_COMPONENTS = {
+    'zookeeper': ['zookeeper'],
+    'bookkeeper': ['bookie'],
+    'broker': ['broker', 'function'],
+    'proxy': ['proxy'],
+    'oxia': ['oxia'],
+}
+# Unpacks /bundles/<provider>/<configmap>/<name>.json.gz to /dashboards/<provider>/<name>.json
+UNPACK_SCRIPT = """set -e
+for f in /bundles/*/*/*.json.gz; do
+  [ -e "$f" ] || continue
+  provider=$(basename "$(dirname "$(dirname "$f")")")
+  mkdir -p "/dashboards/$provider"
+  gunzip -c "$f" > "/dashboards/$provider/$(basename "$f" .gz)"
+done
+"""
+
+def load_recording_rule_groups(rules_path):
+    """
+    Load the rule groups of a recording rules file.
+    
+    Accepts a plain rule file ({groups: [...]}) as well as a VMRule or
+    PrometheusRule object ({spec: {groups: [...]}}).
+    
+    Args:
+        rules_path (str): Path to the rules YAML file
+    
+    Returns:
+        tuple: (name, list of rule groups)
+    """
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        document = yaml.safe_load(f)
+    
+    if 'spec' in document:
+        name = document.get('metadata', {}).get('name', 'pulsar-dashboards-recording-rules')
+        return name, document['spec']['groups']
+    return 'pulsar-dashboards-recording-rules', document['groups']
+
+def dashboard_url(file_path, artifacts_manifest=None, artifacts_url=None):
+    """
+    Return the URL Grafana downloads a dashboard from.
+    
+    Args:
+        file_path (str): Path to the dashboard JSON file
+        artifacts_manifest (dict, optional): Manifest written by build-dashboard-artifacts.py
+        artifacts_url (str, optional): Base URL the artifacts directory is published at
+    
+    Returns:
+        str: The URL of the minified artifact when a manifest is given, otherwise
+             the raw GitHub URL of the file
+    """
+    if artifacts_manifest is not None:
+        entry = manifest_entry(artifacts_manifest, file_path)
+        if entry is None:
+            raise ValueError(f"No artifact for '{file_path}' in the artifacts manifest, run build-dashboard-artifacts.py")
+        return f"{artifacts_url.rstrip('/')}/{entry['path']}"
+    rel_path = os.path.normpath(file_path)  # Normalize path for URL
+    return f"{GITHUB_RAW_URL}/{rel_path}"
+
+def bundle_dashboards(provider_files, max_bytes=MAX_CONFIGMAP_BYTES):
+    """
+    Pack the gzipped dashboards of each provider into ConfigMaps.
+    
+    Dashboards are packed in file name order, starting a new ConfigMap when the
+    next one does not fit, so that a change of one dashboard only changes the
+    ConfigMap it is in unless it grows past the limit.
+    
+    Args:
+        provider_files (dict): Dashboard file paths by provider name
+        max_bytes (int): Maximum size of the keys and base64 data of a ConfigMap
+    
+    Returns:
+        list: Bundles as dicts with 'provider', 'name', 'binaryData' and 'hash'
+    """
+    bundles = []
+    for provider_name, file_paths in provider_files.items():
+        provider_bundles = []
+        current = {}
+        current_size = 0
+        for file_path in sorted(file_paths, key=os.path.basename):
+            key = f"{os.path.splitext(os.path.basename(file_path))[0]}.json.gz"
+            data = base64.b64encode(compress(minify_dashboard(load_dashboard(file_path)), 'gz')).decode('ascii')
+            size = len(key) + len(data)
+            if size > max_bytes:
+                raise ValueError(f"'{file_path}' is {size} bytes gzipped and base64 encoded, "
+                                 f"more than the ConfigMap limit of {max_bytes} bytes")
+            if current and current_size + size > max_bytes:
+                provider_bundles.append(current)
+                current, current_size = {}, 0
+            current[key] = data
+            current_size += size
+        if current:
+            provider_bundles.append(current)
+        
+        for index, binary_data in enumerate(provider_bundles):
+            content_hash = hashlib.sha256(json.dumps(binary_data, sort_keys=True).encode('utf-8')).hexdigest()
+            bundles.append({
+                'provider': provider_name,
+                'name': f"{CONFIGMAP_PREFIX}-{provider_name}-{index}",
+                'binaryData': binary_data,
+                'hash': content_hash,
+            })
+    return bundles
+
+def bundle_values(bundles, unpack_image=UNPACK_IMAGE):
+    """
+    Build the ConfigMaps of the bundles and the Grafana values that unpack them.
+    
+    Args:
+        bundles (list): Bundles returned by bundle_dashboards
+        unpack_image (str): Image of the init container unpacking the bundles
+    
+    Returns:
+        tuple: (ConfigMap objects, Grafana values)
+    """
+    config_maps = []
+    configmap_mounts = []
+    init_mounts = []
+    for bundle in bundles:
+        config_maps.append({
+            'apiVersion': 'v1',
+            'kind': 'ConfigMap',
+            'metadata': {
+                'name': bundle['name'],
+                'labels': {'app.kubernetes.io/name': CONFIGMAP_PREFIX},
+                'annotations': {CONTENT_HASH_ANNOTATION: bundle['hash']},
+            },
+            'binaryData': bundle['binaryData'],
+        })
+        mount_path = f"{BUNDLES_PATH}/{bundle['provider']}/{bundle['name']}"
+        configmap_mounts.append({
+            'name': bundle['name'],
+            'configMap': bundle['name'],
+            'mountPath': mount_path,
+            'readOnly': True,
+        })
+        init_mounts.append({
+            'name': bundle['name'],
+            'mountPath': f"/bundles/{bundle['provider']}/{bundle['name']}",
+            'readOnly': True,
+        })
+    
+    # Roll the Grafana pods when any bundle changed
+    combined_hash = hashlib.sha256(''.join(bundle['hash'] for bundle in bundles).encode('utf-8')).hexdigest()
+    grafana_values = {
+        'podAnnotations': {f"checksum/{CONFIGMAP_PREFIX}": combined_hash},
+        'extraConfigmapMounts': configmap_mounts,
+        'extraEmptyDirMounts': [{
+            'name': f"{CONFIGMAP_PREFIX}-unpacked",
+            'mountPath': BUNDLED_DASHBOARDS_PATH,
+        }],
+        'extraInitContainers': [{
+            'name': 'unpack-dashboards',
+            'image': unpack_image,
+            'command': ['sh', '-c', UNPACK_SCRIPT],
+            'volumeMounts': init_mounts + [{
+                'name': f"{CONFIGMAP_PREFIX}-unpacked",
+                'mountPath': '/dashboards',
+            }],
+        }],
+    }
+    return config_maps, grafana_values
+
+def scrape_allowlist_values(file_paths):
+    """
+    Create the chart values adding a keep rule for the metric families the
+    dashboards query to the podMonitor of every Pulsar component.
+    
+    Args:
+        file_paths (list): Dashboard JSON file paths
+    
+    Returns:
+        dict: Component values with podMonitor.metricRelabelings
+    """
+    families = component_metric_families(*dashboard_metric_names([load_dashboard(f) for f in file_paths]))
+    values = {}
+    for chart_component, components in CHART_SCRAPE_COMPONENTS.items():
+        chart_families = {}
+        for component in components:
+            for family, histogram in families[component].items():
+                chart_families[family] = chart_families.get(family, False) or histogram
+        if chart_families:
+            values[chart_component] = {'podMonitor': {'metricRelabelings': keep_relabel_configs(chart_families)}}
+    return values
+
+def generate_yaml_config(file_paths, recording_rules_path=None, artifacts_manifest=None, artifacts_url=None,
+                         bundle_configmaps=False, max_configmap_bytes=MAX_CONFIGMAP_BYTES, unpack_image=UNPACK_IMAGE,
+                         scrape_allowlist=False):
     """
     Generate YAML configuration for Pulsar Helm chart's values.yaml.
     
     Args:
         file_paths (list): List of dashboard JSON file paths
+        recording_rules_path (str, optional): Recording rules file to include
+        artifacts_manifest (dict, optional): Manifest of the minified dashboard artifacts
+        artifacts_url (str, optional): Base URL the artifacts directory is published at
+        bundle_configmaps (bool): Whether to pack the dashboards into ConfigMaps instead of URLs
+        max_configmap_bytes (int): Maximum data size of a bundle ConfigMap
+        unpack_image (str): Image of the init container unpacking the bundles
+        scrape_allowlist (bool): Whether to only ingest the metric families the dashboards query
     
     Returns:
         str: YAML configuration
     """
     # Group files by directory
     providers = {}
+    provider_files = {}
     for file_path in file_paths:
         # Extract directory and filename
         dir_path, filename = os.path.split(file_path)
@@ -63,10 +310,11 @@ def generate_yaml_config(file_paths):
         
         # Create dashboard entry
         dashboard_name = os.path.splitext(filename)[0]  # Remove extension
-        rel_path = os.path.normpath(file_path)  # Normalize path for URL
-        providers[provider_name]['dashboards'][dashboard_name] = {
-            'url': f"{GITHUB_RAW_URL}/{rel_path}",
-        }
+        provider_files.setdefault(provider_name, []).append(file_path)
+        if not bundle_configmaps:
+            providers[provider_name]['dashboards'][dashboard_name] = {
+                'url': dashboard_url(file_path, artifacts_manifest, artifacts_url),
+            }
     
     # Build configuration dictionary with victoria-metrics-k8s-stack as the root key
     config = {
@@ -95,27 +343,71 @@ def generate_yaml_config(file_paths):
             'editable': True,
             'allowUiUpdates': True,
             'options': {
-                'path': f"/var/lib/grafana/dashboards/{provider_name}"
+                'path': f"{BUNDLED_DASHBOARDS_PATH if bundle_configmaps else '/var/lib/grafana/dashboards'}/{provider_name}"
             }
         })
         
         # Add dashboards to configuration
-        config['victoria-metrics-k8s-stack']['grafana']['dashboards'][provider_name] = provider_data['dashboards']
+        if not bundle_configmaps:
+            config['victoria-metrics-k8s-stack']['grafana']['dashboards'][provider_name] = provider_data['dashboards']
+    
+    # Add the dashboard ConfigMaps, deployed by the chart as extra objects, and the Grafana values unpacking them
+    if bundle_configmaps:
+        config_maps, grafana_values = bundle_values(bundle_dashboards(provider_files, max_configmap_bytes), unpack_image)
+        del config['victoria-metrics-k8s-stack']['grafana']['dashboards']
+        config['victoria-metrics-k8s-stack']['grafana'].update(grafana_values)
+        config['victoria-metrics-k8s-stack']['extraObjects'] = config_maps
+    
+    # Add recording rules, deployed by the chart as a VMRule
+    if recording_rules_path:
+        rules_name, groups = load_recording_rule_groups(recording_rules_path)
+        config['victoria-metrics-k8s-stack']['additionalVictoriaMetricsMap'] = {
+            rules_name: {
+                'groups': groups
+            }
+        }
+    
+    # Add the scrape allowlist to the podMonitor of the Pulsar components
+    if scrape_allowlist:
+        config.update(scrape_allowlist_values(file_paths))
     
     # Convert to YAML
     return yaml.dump(config, default_flow_style=False, sort_keys=False)
 
 def main():
-    # Check command line arguments
-    if len(sys.argv) < 2:
-        print("Error: No files specified.")
-        print(f"Usage: {sys.argv[0]} dashboard1.json [dashboard2.json ...]")
-        sys.exit(1)
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Pulsar Grafana Dashboard YAML Generator")
+    parser.add_argument("files", nargs='+', help="Dashboard JSON files")
+    parser.add_argument("--recording-rules", metavar="FILE",
+                        help="Recording rules file generated by generate-recording-rules.py")
+    parser.add_argument("--artifacts-manifest", metavar="FILE",
+                        help="Manifest written by build-dashboard-artifacts.py, to download the minified artifacts")
+    parser.add_argument("--artifacts-url", metavar="URL",
+                        help="Base URL the artifacts directory is published at")
+    parser.add_argument("--bundle-configmaps", action="store_true",
+                        help="Pack the dashboards into gzipped ConfigMaps instead of downloading them from URLs")
+    parser.add_argument("--configmap-max-bytes", type=int, default=MAX_CONFIGMAP_BYTES, metavar="N",
+                        help=f"Maximum data size of a bundle ConfigMap (default: {MAX_CONFIGMAP_BYTES})")
+    parser.add_argument("--unpack-image", default=UNPACK_IMAGE, metavar="IMAGE",
+                        help=f"Image of the init container unpacking the bundles (default: {UNPACK_IMAGE})")
+    parser.add_argument("--scrape-allowlist", action="store_true",
+                        help="Keep only the metric families the dashboards query when scraping the Pulsar components")
+    args = parser.parse_args()
     
-    file_paths = sys.argv[1:]
+    if args.artifacts_manifest and not args.artifacts_url:
+        parser.error("--artifacts-url is required with --artifacts-manifest")
+    if args.bundle_configmaps and args.artifacts_manifest:
+        parser.error("--artifacts-manifest cannot be used with --bundle-configmaps")
     
     # Generate and print YAML configuration
-    yaml_config = generate_yaml_config(file_paths)
+    try:
+        artifacts_manifest = load_manifest(args.artifacts_manifest) if args.artifacts_manifest else None
+        yaml_config = generate_yaml_config(args.files, args.recording_rules, artifacts_manifest, args.artifacts_url,
+                                           args.bundle_configmaps, args.configmap_max_bytes, args.unpack_image,
+                                           args.scrape_allowlist)
+    except (OSError, json.JSONDecodeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     print(yaml_config)
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+"""
+Grafana Stub
+------------
+
+A local stand-in for the parts of the Grafana HTTP API that
+update-dashboards-from-grafana.py uses, serving dashboards from memory:
+- /api/search with the type, folderUIDs, limit and page parameters, returning
+  at most `limit` hits per page like Grafana does
+- /api/dashboards/uid/<uid> with the dashboard and its meta (version, updated)
+- /api/dashboards/uid/<uid>/versions with the latest versions of a dashboard
+
+`StubGrafanaServer` serves a `StubGrafana` over HTTP on localhost and records
+request counts and concurrency:
+
+    grafana = StubGrafana()
+    grafana.add_dashboard(load_dashboard('pulsar/topic.json'), folder_uid='pulsar')
+    with StubGrafanaServer(grafana) as server:
+        requests.get(f"{server.url}/api/search", params={'type': 'dash-db'})
+        print(server.stats())
+
+It can also be run standalone to sync against:
+
+    python grafana_stub.py --port 3000 pulsar/*.json oxia/*.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from dashboards import load_dashboard
+
+# Default and maximum number of /api/search hits per page
+DEFAULT_SEARCH_LIMIT = 1000
+MAX_SEARCH_LIMIT = 5000
+
+
+class StubGrafana:
+    """In-memory dashboards answering Grafana API calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dashboards = {}
+
+    def add_dashboard(self, dashboard: Dict[str, Any], folder_uid: str = '') -> Dict[str, Any]:
+        """
+        Save a dashboard, incrementing its version if it already exists.
+
+        Returns:
+            dict: The meta of the saved dashboard
+        """
+        uid = dashboard['uid']
+        with self._lock:
+            previous = self._dashboards.get(uid)
+            version = previous['meta']['version'] + 1 if previous else 1
+            saved = copy.deepcopy(dashboard)
+            saved['id'] = previous['dashboard']['id'] if previous else len(self._dashboards) + 1
+            saved['version'] = version
+            meta = {
+                'version': version,
+                'updated': datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+                'folderUid': folder_uid,
+                'slug': (dashboard.get('title') or uid).lower().replace(' ', '-'),
+            }
+            self._dashboards[uid] = {'dashboard': saved, 'meta': meta}
+            return dict(meta)
+
+    def search(self, params: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        limit = min(int(params.get('limit', [DEFAULT_SEARCH_LIMIT])[0]), MAX_SEARCH_LIMIT)
+        page = max(int(params.get('page', ['1'])[0]), 1)
+        folder_uids = set(params.get('folderUIDs', []))
+        types = params.get('type', [])
+        with self._lock:
+            entries = sorted(self._dashboards.items(), key=lambda item: (item[1]['dashboard'].get('title') or '', item[0]))
+        hits = []
+        for uid, entry in entries:
+            if types and 'dash-db' not in types:
+                continue
+            if folder_uids and entry['meta']['folderUid'] not in folder_uids:
+                continue
+            hits.append({
+                'id': entry['dashboard']['id'],
+                'uid': uid,
+                'title': entry['dashboard'].get('title'),
+                'url': f"/d/{uid}/{entry['meta']['slug']}",
+                'type': 'dash-db',
+                'tags': entry['dashboard'].get('tags', []),
+                'folderUid': entry['meta']['folderUid'],
+            })
+        return hits[(page - 1) * limit:page * limit]
+
+    def handle(self, path: str, params: Dict[str, List[str]]) -> Tuple[int, Any]:
+        """
+        Answer an API request.
+
+        Returns:
+            tuple: (HTTP status, JSON response)
+        """
+        if path == '/api/search':
+            try:
+                return 200, self.search(params)
+            except ValueError as e:
+                return 400, {'message': str(e)}
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts[:3] == ['api', 'dashboards', 'uid'] and len(parts) in (4, 5):
+            with self._lock:
+                entry = self._dashboards.get(parts[3])
+                entry = copy.deepcopy(entry) if entry else None
+            if entry is None:
+                return 404, {'message': 'Dashboard not found'}
+            if len(parts) == 4:
+                return 200, entry
+            if parts[4] == 'versions':
+                meta = entry['meta']
+                return 200, [{'id': meta['version'], 'uid': parts[3], 'version': meta['version'],
+                              'created': meta['updated'], 'message': ''}]
+        return 404, {'message': 'Not found'}
+
+
+class StubGrafanaServer:
+    """
+    Serves a StubGrafana over HTTP on localhost, recording every request.
+
+    Args:
+        backend: The StubGrafana answering the requests
+        port: Port to listen on, 0 picks a free port
+        latency: Seconds every response is delayed by, to make concurrency observable
+    """
+
+    def __init__(self, backend: StubGrafana, port: int = 0, latency: float = 0.0):
+        self.backend = backend
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.reset_stats()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubGrafanaServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self._requests = []
+            self._max_in_flight = 0
+            self._connections = set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the request count, maximum concurrency, client connections and bytes since the last reset."""
+        with self._lock:
+            requests = list(self._requests)
+            max_in_flight = self._max_in_flight
+            connections = len(self._connections)
+        by_endpoint = {}
+        for request in requests:
+            by_endpoint[request['endpoint']] = by_endpoint.get(request['endpoint'], 0) + 1
+        return {
+            'requests': len(requests),
+            'max_in_flight': max_in_flight,
+            'connections': connections,
+            'bytes': sum(r['bytes'] for r in requests),
+            'errors': sum(1 for r in requests if r['status'] != 200),
+            'by_endpoint': by_endpoint,
+        }
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        url = urlsplit(handler.path)
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            self._connections.add(handler.client_address)
+        status, payload = 500, b''
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            status, data = self.backend.handle(url.path, parse_qs(url.query))
+            payload = json.dumps(data).encode('utf-8')
+            with self._lock:
+                self._in_flight -= 1
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        finally:
+            with self._lock:
+                if not payload:
+                    self._in_flight -= 1
+                self._requests.append({'endpoint': _endpoint(url.path), 'status': status, 'bytes': len(payload)})
+
+
+def _endpoint(path: str) -> str:
+    """Return the endpoint of a request path with the dashboard UID replaced, for the stats."""
+    parts = path.strip('/').split('/')
+    if parts[:3] == ['api', 'dashboards', 'uid'] and len(parts) > 3:
+        parts[3] = '<uid>'
+    return '/' + '/'.join(parts)
+
+
+def load_stub(file_paths: List[str], folder_uid: Optional[str] = None) -> StubGrafana:
+    """Return a StubGrafana with dashboard files, in a folder named after their directory by default."""
+    grafana = StubGrafana()
+    for file_path in file_paths:
+        folder = folder_uid if folder_uid is not None else os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+        grafana.add_dashboard(load_dashboard(file_path), folder_uid=folder)
+    return grafana
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grafana Stub")
+    parser.add_argument('files', metavar='file', nargs='+', help='Dashboard JSON files to serve')
+    parser.add_argument('--port', type=int, default=3000, help='Port to listen on (default: 3000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Response delay in milliseconds')
+    args = parser.parse_args()
+
+    with StubGrafanaServer(load_stub(args.files), port=args.port, latency=args.latency / 1000) as server:
+        print(f"Serving {len(args.files)} dashboards at {server.url}, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Metric Catalog
+--------------
+
+Knowledge about the metric families queried by the dashboards in this
+repository: which component exposes them and at which cardinality level
+their series are split (per pod, per namespace, per topic, per subscription,
+per Oxia shard, ...).
+
+The analysis and rewriting tools use this catalog to estimate how many series
+a selector touches. Estimates are made against a reference fleet (see
+`REFERENCE_FLEET`) and narrowed by the exact-match label matchers of a
+selector, e.g. `topic="$topic"` narrows a topic-level metric to one series.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+# The fleet the LEVELS series counts below are modelled on
+REFERENCE_FLEET = {
+    'clusters': 1,
+    'brokers': 10,
+    'bookies': 10,
+    'zookeepers': 3,
+    'proxies': 3,
+    'function_workers': 3,
+    'oxia_nodes': 3,
+    'oxia_shards': 32,
+    'tenants': 10,
+    'namespaces': 100,
+    'topics': 10_000,
+    'subscriptions_per_topic': 2,
+    'consumers_per_subscription': 2,
+    'scrape_interval': 30,
+}
+
+# Cardinality levels, from cheapest to most expensive. Each level lists the
+# number of series one metric of that level has in the reference fleet, and
+# the labels which, when matched exactly, narrow the selector down to the
+# given number of series.
+LEVELS = {
+    'cluster': {
+        'series': 1,
+        'narrowing': {},
+    },
+    'zookeeper': {
+        'series': REFERENCE_FLEET['zookeepers'],
+        'narrowing': {'kubernetes_pod_name': 1, 'instance': 1, 'pod': 1},
+    },
+    'instance': {
+        'series': 20,
+        'narrowing': {'kubernetes_pod_name': 1, 'instance': 1, 'pod': 1, 'job': 5},
+    },
+    'container': {
+        'series': 500,
+        'narrowing': {'pod': 2, 'container': 20, 'namespace': 50},
+    },
+    'function': {
+        'series': 50,
+        'narrowing': {'name': 2, 'exported_name': 2, 'exported_namespace': 10, 'kubernetes_pod_name': 10},
+    },
+    'shard': {
+        'series': 96,
+        'narrowing': {'shard': 3, 'kubernetes_pod_name': 32, 'oxia_namespace': 24},
+    },
+    'namespace': {
+        'series': 1_000,
+        'narrowing': {'namespace': 10, 'kubernetes_pod_name': 100},
+    },
+    'topic': {
+        'series': 10_000,
+        'narrowing': {'topic': 1, 'namespace': 100, 'kubernetes_pod_name': 1_000},
+    },
+    'subscription': {
+        'series': 20_000,
+        'narrowing': {'subscription': 10_000, 'topic': 2, 'namespace': 200, 'kubernetes_pod_name': 2_000},
+    },
+    'consumer': {
+        'series': 40_000,
+        'narrowing': {'topic': 4, 'subscription': 20_000, 'namespace': 400, 'kubernetes_pod_name': 4_000},
+    },
+}
+
+# Levels whose series count grows with the number of topics
+TOPIC_LEVELS = {'topic', 'subscription', 'consumer'}
+
+# Labels identifying the series of a topic level, from the outermost entity
+TOPIC_LEVEL_KEYS = {
+    'topic': ('topic',),
+    'subscription': ('topic', 'subscription'),
+    'consumer': ('topic', 'subscription', 'consumer_name', 'consumer_id'),
+}
+
+# Number of distinct values of labels that series of every level have, for
+# estimating the number of groups of e.g. `sum by (cluster)`
+FLEET_LABEL_VALUES = {
+    'cluster': REFERENCE_FLEET['clusters'],
+    'remote_cluster': REFERENCE_FLEET['clusters'],
+}
+
+
+@dataclass(frozen=True)
+class MetricFamily:
+    pattern: str
+    component: str
+    level: str
+
+
+# Ordered list of metric families, first match wins
+FAMILIES = [
+    # Pulsar broker: consumer, subscription and topic level stats
+    MetricFamily(r'pulsar_consumer_.*', 'broker', 'consumer'),
+    MetricFamily(r'pulsar_subscription_.*', 'broker', 'subscription'),
+    MetricFamily(r'pulsar_topics_count', 'broker', 'namespace'),
+    MetricFamily(r'pulsar_(rate_in|rate_out|throughput_in|throughput_out|producers_count|consumers_count'
+                 r'|subscriptions_count|msg_backlog|in_bytes_total|in_messages_total|out_bytes_total'
+                 r'|out_messages_total|publish_rate_limit_times|delayed_message_index_.*)', 'broker', 'topic'),
+    MetricFamily(r'pulsar_(storage|entry_size|replication|compaction|ledgeroffloader)_.*', 'broker', 'topic'),
+    MetricFamily(r'pulsar_(ml|lb|broker|bundle|authentication|connection|web)_.*', 'broker', 'instance'),
+    MetricFamily(r'pulsar_version_info', 'broker', 'instance'),
+    # Pulsar proxy
+    MetricFamily(r'pulsar_proxy_.*', 'proxy', 'instance'),
+    # Pulsar functions and connectors
+    MetricFamily(r'pulsar_(function|sink|source)_.*', 'function', 'function'),
+    # BookKeeper
+    MetricFamily(r'(bookie|bookkeeper_server)_.*', 'bookie', 'instance'),
+    # ZooKeeper, whose metrics have no common prefix: one series per server, summaries with _sum and _count
+    MetricFamily(r'((zookeeper|znode)_.*'
+                 r'|(ack|avg|min|max|read|update|propagation|commit_propagation|proposal|quorum_ack'
+                 r'|proposal_ack_creation|dead_watchers_cleaner)_?latency'
+                 r'|add_dead_watcher_stall_time|dead_watchers_(cleared|queued)'
+                 r'|approximate_data_size|ephemerals_count|watch_count'
+                 r'|node_(changed|children|created|deleted)_watch_count'
+                 r'|(commit|diff|snap|proposal|looking|revalidate)_count'
+                 r'|commit_commit_proc_req_queued|commit_process_time|concurrent_request_processing_in_commit_processor'
+                 r'|time_waiting_empty_pool_in_commit_processor_read_ms|write_batch_time_in_commit_processor'
+                 r'|(read|write)_(commit_proc_issued|commit_proc_req_queued|commitproc_time_ms|final_proc_time_ms'
+                 r'|per_namespace)'
+                 r'|(local|server)_write_committed_time_ms|om_(commit|proposal)_process_time_ms'
+                 r'|(prep|sync)_process_time|(prep|sync)_processor_.*|close_session_prep_time'
+                 r'|connection_(drop_count|drop_probability|rejected|request_count|token_deficit)'
+                 r'|bytes_received_count|num_alive_connections|packets_(received|sent)|tls_handshake_exceeded'
+                 r'|outstanding_(changes_queued|changes_removed|requests|tls_handshake)'
+                 r'|(global|local)_sessions|(sessionless_connections|stale_sessions)_expired|pending_session_queue_size'
+                 r'|session_queues_drained|requests_in_session_queue|reads_(after_write_in|issued_from)_session_queue'
+                 r'|request_commit_queued|(last|min|max)_(client_response|proposal)_size'
+                 r'|response_packet_(get_children_)?cache_(hits|misses)'
+                 r'|election_time|leader_uptime|uptime|learners|learner_commit_received_count|learner_handler_qp_size'
+                 r'|follower_sync_time|synced_(non_voting_followers|observers)|quorum_size'
+                 r'|quit_leading_due_to_disloyal_voter|ensemble_auth_(fail|skip|success)|digest_mismatches_count'
+                 r'|unrecoverable_error_count|dbinittime|fsynctime|snapshottime|startup_(snap_load_time|txns_loaded)'
+                 r'|open_file_descriptor_count)(_sum|_count)?', 'zookeeper', 'zookeeper'),
+    # Oxia
+    MetricFamily(r'oxia_server_(wal|kv|db|leader|follower)_.*', 'oxia', 'shard'),
+    MetricFamily(r'oxia_.*', 'oxia', 'instance'),
+    MetricFamily(r'grpc_.*', 'oxia', 'instance'),
+    # Kubernetes and host level
+    MetricFamily(r'container_.*', 'kubernetes', 'container'),
+    MetricFamily(r'node_(boot_time_seconds|time_seconds|load\d+|memory_.*|cpu_.*|disk_.*|filefd_.*|forks_total'
+                 r'|intr_total|context_switches_total|procs_.*|sockstat_.*|vmstat_.*|network_.*)', 'node', 'instance'),
+    # Runtime metrics shared by all JVM and Go processes
+    MetricFamily(r'(jvm|jetty|process|go)_.*', 'runtime', 'instance'),
+    MetricFamily(r'up', 'runtime', 'instance'),
+]
+
+_COMPILED_FAMILIES = [(re.compile(family.pattern), family) for family in FAMILIES]
+
+# Metrics missing from the catalog, costed as instance-level metrics and reported by the analysis tools
+DEFAULT_FAMILY = MetricFamily(r'.*', 'unknown', 'instance')
+
+# Dashboard file name to the component it monitors
+DASHBOARD_COMPONENTS = {
+    'bookkeeper': 'bookie',
+    'bookkeeper-compaction': 'bookie',
+    'broker-cache': 'broker',
+    'broker-cache-by-broker': 'broker',
+    'connector-sink': 'function',
+    'connector-source': 'function',
+    'functions': 'function',
+    'load-balancing': 'broker',
+    'messaging': 'broker',
+    'namespace': 'broker',
+    'offloader': 'broker',
+    'overview': 'broker',
+    'overview-by-broker': 'broker',
+    'proxy': 'proxy',
+    'topic': 'broker',
+    'zookeeper': 'zookeeper',
+    'node': 'node',
+    'sockets': 'node',
+}
+
+
+def family_for_metric(metric_name: str) -> MetricFamily:
+    """Return the catalog entry matching a metric name."""
+    for pattern, family in _COMPILED_FAMILIES:
+        if pattern.fullmatch(metric_name):
+            return family
+    return DEFAULT_FAMILY
+
+
+def is_known_metric(metric_name: str) -> bool:
+    """Whether a metric name matches a family of the catalog."""
+    return family_for_metric(metric_name) is not DEFAULT_FAMILY
+
+
+def metric_level(metric_name: Optional[str]) -> str:
+    """Return the cardinality level of a metric, 'instance' when unknown."""
+    if not metric_name:
+        return 'instance'
+    return family_for_metric(metric_name).level
+
+
+def is_topic_level(metric_name: Optional[str]) -> bool:
+    """Whether the series count of a metric grows with the number of topics."""
+    return metric_level(metric_name) in TOPIC_LEVELS
+
+
+def estimate_series(metric_name: Optional[str], exact_labels) -> int:
+    """
+    Estimate the number of series a selector matches in the reference fleet.
+
+    Args:
+        metric_name: The metric name of the selector
+        exact_labels: Labels that the selector matches to a single value
+
+    Returns:
+        int: Estimated number of series
+    """
+    level = LEVELS[metric_level(metric_name)]
+    series = level['series']
+    for label in exact_labels:
+        if label in level['narrowing']:
+            series = min(series, level['narrowing'][label])
+    return series
+
+
+# Labels added to every series by the scrape configuration
+TARGET_LABELS = {'job', 'instance', 'kubernetes_pod_name', 'kubernetes_namespace'}
+
+# Cheap metrics to look up label values from, by component. Each entry lists
+# the labels (besides TARGET_LABELS) the metric carries and whether only this
+# component exposes it. Ordered cheapest first.
+LABEL_SOURCES = {
+    'broker': [
+        ('pulsar_version_info', {'cluster'}, False),
+        ('pulsar_topics_count', {'cluster', 'namespace'}, True),
+    ],
+}
+
+
+def label_source(component: str, label: str, matcher_labels) -> Optional[str]:
+    """
+    Return the cheapest metric of a component that carries a label and all
+    labels used in matchers, or None if there is none.
+
+    Metrics exposed by several components are only used when no scrape target
+    label (e.g. job) is involved, since those would then select other components.
+    """
+    used = {label} | set(matcher_labels)
+    needed = used - TARGET_LABELS
+    for metric, labels, component_specific in LABEL_SOURCES.get(component, []):
+        if needed <= labels and (component_specific or not used & TARGET_LABELS):
+            return metric
+    return None
+
+
+# Components scraped from their own pods, each with its own scrape configuration
+# (a VMPodScrape/VMServiceScrape or vmagent scrape job)
+SCRAPE_COMPONENTS = ['broker', 'bookie', 'zookeeper', 'proxy', 'function', 'oxia']
+
+# Metric family components exposed by every scraped component (JVM, process and Go metrics)
+SHARED_COMPONENTS = {'runtime'}
+
+# Labels that Kubernetes service discovery and the scrape relabeling (e.g. a
+# labelmap of the pod labels) attach to every series of a scrape target. They
+# have a single value per target, which instance and job already identify, so
+# dropping them never merges the series of a target. Label names that the
+# components expose themselves (e.g. the Pulsar namespace label) are not listed.
+SERVICE_DISCOVERY_LABELS = [
+    'kubernetes_namespace', 'kubernetes_pod_name', 'pod', 'container', 'endpoint', 'service', 'node',
+    'app', 'component', 'release', 'heritage', 'controller_revision_hash', 'pod_template_hash',
+    'statefulset_kubernetes_io_pod_name', 'apps_kubernetes_io_pod_index',
+    'app_kubernetes_io_name', 'app_kubernetes_io_instance', 'app_kubernetes_io_component',
+    'app_kubernetes_io_part_of', 'app_kubernetes_io_managed_by', 'app_kubernetes_io_version', 'helm_sh_chart',
+]
+
+
+def scrape_components(metric_name: str) -> List[str]:
+    """Return the scraped components exposing a metric, empty for metrics of other exporters (e.g. cAdvisor)."""
+    component = family_for_metric(metric_name).component
+    if component in SHARED_COMPONENTS:
+        return list(SCRAPE_COMPONENTS)
+    return [component] if component in SCRAPE_COMPONENTS else []
@@ -0,0 +1,274 @@
+#!/usr/bin/env -S uv run
+"""
+Rate Window Normalizer
+----------------------
+
+This script rewrites the fixed range windows of rate(), irate(), increase()
+and *_over_time() calls in Grafana dashboard queries to Grafana's
+$__rate_interval, e.g.
+
+    sum(rate(pulsar_in_bytes_total{cluster=~"$cluster"}[1m])) by (topic)
+
+becomes
+
+    sum(rate(pulsar_in_bytes_total{cluster=~"$cluster"}[$__rate_interval])) by (topic)
+
+A fixed window is either too short for the step of long time ranges, so that
+samples between the windows are never read and spikes are missed, or longer
+than needed for short ones. $__rate_interval follows the query step and is
+never shorter than four scrape intervals (the scrape interval configured on
+the Prometheus datasource), so it always covers enough samples.
+
+The value of increase() is the increase over its window, so changing the
+window would change what a panel shows. increase(v[w]) is therefore rewritten
+to rate(v[$__rate_interval]) * <w in seconds>, which keeps the unit of the
+panel (e.g. "per minute") while following the step:
+
+    sum(increase(jvm_gc_collection_seconds_sum[1m]))
+    sum(rate(jvm_gc_collection_seconds_sum[$__rate_interval]) * 60)
+
+Windows that are semantically intentional are kept as they are, based on an
+explicit allowlist. The built-in allowlist keeps the hourly and daily totals
+(increase over [1h] and [1d]); more entries can be added with --allowlist.
+Windows that already use a template variable (e.g. [$interval]) and subquery
+ranges are never rewritten.
+
+Queries are parsed with promql.py and only the rewritten windows and function
+calls are edited, so the rest of every query stays byte for byte identical.
+
+Usage:
+    python normalize-rate-intervals.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --allowlist FILE   JSON file with additional allowlist entries (see below)
+    --dry-run          Only print the diff report, do not modify any files
+    --check            Like --dry-run, but exit with status 1 if any query would be rewritten
+
+Allowlist entries are objects matching a window when all their keys match:
+    function    Function name, e.g. "increase"
+    window      Window as written in the query, e.g. "1d"
+    file        Dashboard file name glob, e.g. "pulsar/node.json" or "*/node.json"
+    panel       Regular expression searched in the panel title
+    reason      Why the window is intentional, shown in the report
+
+Output:
+    - Diff report of the rewritten queries by dashboard and panel
+    - Summary of the windows rewritten and kept, by function and window
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+from dashboards import (REPO_ROOT, default_dashboard_files, iter_targets, load_dashboard,
+                        panel_label, write_dashboard)
+from promql import BinaryExpr, Call, MatrixSelector, ParseError, UnaryExpr, apply_edits, parse, walk_with_parents
+
+RATE_INTERVAL = '$__rate_interval'
+
+# Functions whose range window is rewritten, besides the *_over_time functions
+WINDOW_FUNCTIONS = {'rate', 'irate', 'increase'}
+
+# Windows that are semantically intentional and kept as they are
+DEFAULT_ALLOWLIST = [
+    {'function': 'increase', 'window': '1h', 'reason': 'hourly totals'},
+    {'function': 'increase', 'window': '1d', 'reason': 'daily totals'},
+]
+
+ALLOWLIST_KEYS = {'function', 'window', 'file', 'panel', 'reason'}
+
+
+def is_window_function(name):
+    return name in WINDOW_FUNCTIONS or name.endswith('_over_time')
+
+
+def load_allowlist(file_path):
+    """
+    Load allowlist entries from a JSON file containing a list of objects.
+
+    Raises:
+        ValueError: If an entry is not an object or has unknown keys
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{file_path}: expected a list of allowlist entries")
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError(f"{file_path}: allowlist entry {entry!r} is not an object")
+        unknown = set(entry) - ALLOWLIST_KEYS
+        if unknown:
+            raise ValueError(f"{file_path}: unknown allowlist keys {', '.join(sorted(unknown))}")
+    return entries
+
+
+def allowlist_reason(allowlist, file_path, panel, function, window):
+    """Return the reason of the first allowlist entry matching a window, or None if the window is not allowlisted."""
+    rel_path = os.path.relpath(os.path.abspath(file_path), REPO_ROOT)
+    for entry in allowlist:
+        if 'function' in entry and entry['function'] != function:
+            continue
+        if 'window' in entry and entry['window'] != window:
+            continue
+        if 'file' in entry and not (fnmatch.fnmatch(rel_path, entry['file'])
+                                    or fnmatch.fnmatch(os.path.basename(file_path), entry['file'])):
+            continue
+        if 'panel' in entry and not re.search(entry['panel'], panel.get('title') or ''):
+            continue
+        return entry.get('reason', 'allowlisted')
+    return None
+
+
+def _seconds_text(seconds):
+    return str(int(seconds)) if float(seconds).is_integer() else repr(seconds)
+
+
+def normalize_query(query, file_path, panel, allowlist, stats):
+    """
+    Rewrite the fixed rate windows of a query to $__rate_interval.
+
+    Args:
+        query (str): The PromQL expression
+        file_path (str): Dashboard file, for matching the allowlist
+        panel (dict): Panel of the query, for matching the allowlist
+        allowlist (list): Allowlist entries
+        stats (Counter): Counts by (function, window, outcome), updated in place
+
+    Returns:
+        tuple: (rewritten query, list of (window, reason) of the allowlisted windows)
+    """
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {file_path}: {panel_label(panel)}: {e}", file=sys.stderr)
+        return query, []
+
+    edits, kept = [], []
+    for node, parents in walk_with_parents(root):
+        if not (isinstance(node, Call) and is_window_function(node.func) and node.args):
+            continue
+        # The range vector is the last argument, e.g. quantile_over_time(0.99, v[5m])
+        matrix = node.args[-1]
+        if not isinstance(matrix, MatrixSelector):
+            continue
+        window = matrix.range
+        seconds = matrix.range_seconds
+        if seconds is None:
+            # Already a template variable, e.g. $interval or $__rate_interval
+            stats[(node.func, window, 'variable')] += 1
+            continue
+        reason = allowlist_reason(allowlist, file_path, panel, node.func, window)
+        if reason is not None:
+            stats[(node.func, window, 'allowlisted')] += 1
+            kept.append((f"{node.func}[{window}]", reason))
+            continue
+
+        stats[(node.func, window, 'rewritten')] += 1
+        if node.func != 'increase':
+            edits.append((matrix.range_span[0], matrix.range_span[1], RATE_INTERVAL))
+            continue
+
+        # increase(v[w]) == rate(v[w]) * w, keep the unit of the panel while following the step
+        call_text = apply_edits(query[node.start:node.end], [
+            (0, len('increase'), 'rate'),
+            (matrix.range_span[0] - node.start, matrix.range_span[1] - node.start, RATE_INTERVAL),
+        ])
+        replacement = f"{call_text} * {_seconds_text(seconds)}"
+        if parents and isinstance(parents[-1], (BinaryExpr, UnaryExpr)):
+            replacement = f"({replacement})"
+        edits.append((node.start, node.end, replacement))
+
+    # Nested window functions (e.g. rate over a subquery of increase) would produce overlapping edits
+    edits.sort()
+    for (_, previous_end, _), (start, _, _) in zip(edits, edits[1:]):
+        if start < previous_end:
+            print(f"Warning: {file_path}: {panel_label(panel)}: nested rate windows, query left unchanged",
+                  file=sys.stderr)
+            return query, kept
+    return apply_edits(query, edits), kept
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Rate Window Normalizer",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--allowlist', metavar='FILE',
+                        help='JSON file with additional allowlist entries')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the diff report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any query would be rewritten, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    file_paths = args.files or default_dashboard_files()
+    write = not (args.dry_run or args.check)
+
+    allowlist = list(DEFAULT_ALLOWLIST)
+    if args.allowlist:
+        try:
+            allowlist.extend(load_allowlist(args.allowlist))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    stats = Counter()
+    rewritten_targets = 0
+    rewritten_files = 0
+    for file_path in file_paths:
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        header_printed = False
+        for panel, target in iter_targets(dashboard):
+            new_expr, kept = normalize_query(target['expr'], file_path, panel, allowlist, stats)
+            if new_expr == target['expr']:
+                continue
+            if not header_printed:
+                print(f"--- {file_path}")
+                header_printed = True
+            print(f"  {panel_label(panel)} (refId {target.get('refId', '?')})")
+            print(f"  - {target['expr']}")
+            print(f"  + {new_expr}")
+            for window, reason in kept:
+                print(f"    kept {window}: {reason}")
+            target['expr'] = new_expr
+            rewritten_targets += 1
+
+        if header_printed:
+            rewritten_files += 1
+            if write:
+                write_dashboard(file_path, dashboard)
+
+    print("\n" + "="*60)
+    print("Windows by function:")
+    print(f"  {'function':<22} {'window':<18} {'rewritten':>9} {'allowlisted':>11} {'variable':>8}")
+    for function, window in sorted({(function, window) for function, window, _ in stats}):
+        counts = [stats[(function, window, outcome)] for outcome in ('rewritten', 'allowlisted', 'variable')]
+        print(f"  {function:<22} {window:<18} {counts[0]:>9} {counts[1]:>11} {counts[2]:>8}")
+    print(f"\nSummary:")
+    print(f"  Windows rewritten: {sum(n for key, n in stats.items() if key[2] == 'rewritten')}")
+    print(f"  Windows kept (allowlisted): {sum(n for key, n in stats.items() if key[2] == 'allowlisted')}")
+    print(f"  Targets {'rewritten' if write else 'to rewrite'}: {rewritten_targets}")
+    print(f"  Dashboards {'rewritten' if write else 'to rewrite'}: {rewritten_files}")
+
+    if args.check and rewritten_targets:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
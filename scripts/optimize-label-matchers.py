@@ -0,0 +1,341 @@
+#!/usr/bin/env -S uv run
+"""
+Label Matcher Optimizer
+-----------------------
+
+This script rewrites the label matchers of Grafana dashboard queries so that
+the TSDB can look series up in its inverted index instead of scanning label
+values with a regex:
+
+1. Regex matchers fed only by single-valued template variables are rewritten
+   to equality matchers. A variable that is neither multi-valued nor
+   includeAll always expands to exactly one value, so with a `cluster` query
+   variable
+
+       pulsar_rate_in{cluster=~"$cluster", topic="$topic"}
+
+   becomes
+
+       pulsar_rate_in{cluster="$cluster", topic="$topic"}
+
+   Negative regex matchers are rewritten to `!=` the same way. Textbox
+   variables, which users may fill in with a regex, custom and constant
+   variables with regex operators in their values, and variables with a
+   format (e.g. ${topic:regex}) are never rewritten.
+
+2. Regex matchers implied by a stricter matcher of the same selector are
+   dropped:
+   - a matcher on the same label whose value the regex matches, e.g.
+     `namespace=~"$tenant.+"` next to `namespace="$tenant/$namespace"`
+   - a namespace matcher next to a single-valued `topic="$topic"` matcher,
+     when the `topic` variable only offers topics of namespaces the regex
+     matches (a topic name contains its namespace), e.g. `namespace=~"$tenant.+"`
+     where `topic` is label_values(...{namespace="$tenant/$namespace"}, topic)
+   - matchers that match any value, `=~".*"`
+
+   Template variables are compared by name, assuming that variable values
+   contain no regex operators other than '.'.
+
+Panel targets and the queries of query variables are rewritten. Queries are
+parsed with promql.py and only the rewritten matchers are edited, so the rest
+of every query stays byte for byte identical.
+
+Usage:
+    python optimize-label-matchers.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --dry-run       Only print the change report, do not modify any files
+    --check         Like --dry-run, but exit with status 1 if any query would be rewritten
+
+Output:
+    - Change report of the rewritten queries by dashboard, with the matchers
+      made equality matchers and the matchers dropped
+    - Summary of the matchers rewritten and dropped
+"""
+
+import argparse
+import re
+import sys
+from collections import Counter
+
+from dashboards import (default_dashboard_files, is_literal, is_multi_valued, iter_targets, load_dashboard,
+                        panel_label, template_variables_by_name, variable_query_text, write_dashboard)
+from promql import (Call, ParseError, VectorSelector, apply_edits, parse, replace_template_variables,
+                    strip_template_variables, template_variables, walk)
+
+# Variable types whose value is one of a known list of values
+LISTED_VARIABLE_TYPES = {'query', 'custom', 'constant'}
+
+# Labels whose value is determined by the value of another label: a topic name
+# (persistent://tenant/namespace/topic) contains its namespace
+DETERMINING_LABELS = {'namespace': ('topic',)}
+
+MATCH_ANY = {'.*', '(.*)', '.*?'}
+
+EQUALITY_OPS = {'=~': '=', '!~': '!='}
+
+# ${var:format} and [[var:format]] references, whose expanded value depends on the format
+_FORMATTED_VARIABLE_RE = re.compile(r'\$\{[^}]*:[^}]*\}|\[\[[^\]]*:[^\]]*\]\]')
+
+
+def variable_values_literal(variable):
+    """Whether the values a single-valued variable can take are plain strings, not regexes."""
+    if variable.get('type') not in LISTED_VARIABLE_TYPES:
+        return False
+    if variable.get('type') == 'query':
+        return True
+    values = [option.get('value') for option in variable.get('options') or []]
+    values.append((variable.get('current') or {}).get('value'))
+    if variable.get('type') == 'constant':
+        values.append(variable.get('query'))
+    return all(isinstance(value, str) and is_literal(value) for value in values if value is not None)
+
+
+def is_equality_safe(matcher, variables):
+    """
+    Whether a regex matcher only made of single-valued variables and literal
+    text matches exactly one value, so that it can be an equality matcher.
+    """
+    if matcher.op not in EQUALITY_OPS or not matcher.variables:
+        return False
+    if _FORMATTED_VARIABLE_RE.search(matcher.value) or not is_literal(strip_template_variables(matcher.value)):
+        return False
+    for name in matcher.variables:
+        variable = variables.get(name)
+        if is_multi_valued(variable) or not variable_values_literal(variable):
+            return False
+    return True
+
+
+def regex_implies(value, regex):
+    """
+    Whether the regex fully matches the value, both possibly containing
+    template variables. Each variable is replaced by the same placeholder in
+    both, so `$tenant.+` matches `$tenant/$namespace` whatever the tenant.
+    """
+    if not set(template_variables(regex)) <= set(template_variables(value)):
+        return False
+    placeholders = {name: f"VAR{i}VAR" for i, name in enumerate(dict.fromkeys(template_variables(value)))}
+    try:
+        pattern = re.compile(replace_template_variables(regex, lambda name: placeholders[name]))
+    except re.error:
+        return False
+    return pattern.fullmatch(replace_template_variables(value, lambda name: placeholders[name])) is not None
+
+
+def exact_value(matcher, variables):
+    """Return the value a positive matcher selects, or None if it can select several values."""
+    if matcher.op == '=' or (matcher.op == '=~' and is_equality_safe(matcher, variables)):
+        return matcher.value
+    return None
+
+
+def variable_selector(variable, label):
+    """Return the selector of a label_values(selector, label) query variable, or None."""
+    query_text = variable_query_text(variable) if variable else None
+    if query_text is None or variable.get('regex'):
+        return None
+    try:
+        root = parse(query_text)
+    except ParseError:
+        return None
+    if not (isinstance(root, Call) and root.func == 'label_values' and len(root.args) == 2):
+        return None
+    selector, label_arg = root.args
+    if not isinstance(selector, VectorSelector) or not isinstance(label_arg, VectorSelector):
+        return None
+    return selector if label_arg.metric == label else None
+
+
+def redundancy_reason(matcher, selector, variables, dropped):
+    """
+    Return why a positive regex matcher is implied by the other matchers of
+    its selector that are not dropped, or None if it is not.
+    """
+    if matcher.op != '=~' or matcher.name == '__name__':
+        return None
+    if matcher.value in MATCH_ANY:
+        return 'matches any value'
+    for other in selector.matchers:
+        if other is matcher or other in dropped or other.name != matcher.name:
+            continue
+        value = exact_value(other, variables)
+        if value is not None and regex_implies(value, matcher.value):
+            return f"implied by {other.name}{other.op}\"{other.value}\""
+    for label in DETERMINING_LABELS.get(matcher.name, ()):
+        for other in selector.matchers_for(label):
+            value = exact_value(other, variables)
+            names = template_variables(value) if value is not None else []
+            if len(names) != 1 or strip_template_variables(value):
+                continue
+            variable = variables.get(names[0])
+            variable_query = variable_selector(variable, label)
+            if variable_query is None:
+                continue
+            for source in variable_query.matchers_for(matcher.name):
+                source_value = exact_value(source, variables)
+                if source_value is not None and regex_implies(source_value, matcher.value):
+                    return f"implied by {other.name}{other.op}\"{other.value}\", whose values all have {source.name}{source.op}\"{source.value}\""
+    return None
+
+
+def _op_edit(query, matcher, op):
+    """Return the edit replacing the operator of a matcher."""
+    offset = query.index(matcher.op, matcher.start + len(matcher.name), matcher.end)
+    return offset, offset + len(matcher.op), op
+
+
+def _drop_edits(selector, dropped):
+    """Return the edits removing matchers from a selector, with their separating commas."""
+    matchers = selector.matchers
+    kept = [i for i, m in enumerate(matchers) if m not in dropped]
+    if not kept:
+        return [selector.matchers_span + ('',)]
+    edits = []
+    for i, m in enumerate(matchers):
+        if m not in dropped:
+            continue
+        if any(k > i for k in kept):
+            edits.append((m.start, matchers[i + 1].start, ''))
+        else:
+            edits.append((matchers[i - 1].end, m.end, ''))
+    return edits
+
+
+def optimize_query(query, variables, stats):
+    """
+    Rewrite the label matchers of a query.
+
+    Args:
+        query (str): The PromQL expression
+        variables (dict): Template variables of the dashboard by name
+        stats (Counter): Counts of the rewritten and dropped matchers, updated in place
+
+    Returns:
+        tuple: (rewritten query, list of change descriptions)
+    """
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return query, []
+
+    edits, changes = [], []
+    for selector in walk(root):
+        if not isinstance(selector, VectorSelector):
+            continue
+        dropped = {}
+        for matcher in selector.matchers:
+            reason = redundancy_reason(matcher, selector, variables, dropped)
+            if reason:
+                dropped[matcher] = reason
+        # A selector needs a metric name or at least one matcher
+        if len(dropped) == len(selector.matchers) and not selector.metric:
+            dropped = {}
+        if dropped:
+            edits.extend(_drop_edits(selector, dropped))
+            for matcher, reason in dropped.items():
+                changes.append(f"dropped {matcher.name}{matcher.op}\"{matcher.value}\": {reason}")
+                stats['dropped'] += 1
+        for matcher in selector.matchers:
+            if matcher not in dropped and is_equality_safe(matcher, variables):
+                edits.append(_op_edit(query, matcher, EQUALITY_OPS[matcher.op]))
+                changes.append(f"{matcher.name}{matcher.op}\"{matcher.value}\" -> {EQUALITY_OPS[matcher.op]}")
+                stats['equality'] += 1
+    return apply_edits(query, edits), changes
+
+
+def set_variable_query(variable, query_text):
+    """Replace the query of a query variable, and its definition shown in the editor."""
+    query = variable.get('query')
+    if variable.get('definition') == variable_query_text(variable):
+        variable['definition'] = query_text
+    if isinstance(query, dict):
+        query['query'] = query_text
+    else:
+        variable['query'] = query_text
+
+
+def optimize_dashboard(dashboard, stats):
+    """
+    Rewrite the label matchers of the panel targets and query variables of a dashboard.
+
+    Returns:
+        list: (target or variable label, old query, new query, changes) of the rewritten queries
+    """
+    variables = template_variables_by_name(dashboard)
+    rewritten = []
+    for name, variable in variables.items():
+        query_text = variable_query_text(variable)
+        if query_text is None:
+            continue
+        new_text, changes = optimize_query(query_text, variables, stats)
+        if new_text != query_text:
+            rewritten.append((f"variable ${name}", query_text, new_text, changes))
+            set_variable_query(variable, new_text)
+    for panel, target in iter_targets(dashboard):
+        new_expr, changes = optimize_query(target['expr'], variables, stats)
+        if new_expr != target['expr']:
+            rewritten.append((f"{panel_label(panel)} (refId {target.get('refId', '?')})",
+                              target['expr'], new_expr, changes))
+            target['expr'] = new_expr
+    return rewritten
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Label Matcher Optimizer",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the change report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any query would be rewritten, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    write = not (args.dry_run or args.check)
+
+    stats = Counter()
+    rewritten_queries = 0
+    rewritten_files = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        rewritten = optimize_dashboard(dashboard, stats)
+        if not rewritten:
+            continue
+        print(f"--- {file_path}")
+        for label, old, new, changes in rewritten:
+            print(f"  {label}")
+            print(f"  - {old}")
+            print(f"  + {new}")
+            for change in changes:
+                print(f"    {change}")
+        rewritten_queries += len(rewritten)
+        rewritten_files += 1
+        if write:
+            write_dashboard(file_path, dashboard)
+
+    print(f"\nSummary:")
+    print(f"  Regex matchers rewritten to equality: {stats['equality']}")
+    print(f"  Redundant matchers dropped: {stats['dropped']}")
+    print(f"  Queries {'rewritten' if write else 'to rewrite'}: {rewritten_queries}")
+    print(f"  Dashboards {'rewritten' if write else 'to rewrite'}: {rewritten_files}")
+
+    if args.check and rewritten_queries:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
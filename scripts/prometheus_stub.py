@@ -0,0 +1,449 @@
+"""
+Prometheus Stub
+---------------
+
+A local stand-in for the Prometheus HTTP API, answering the requests Grafana
+issues for the dashboards in this repository from the synthetic fleet of
+synthetic_fleet.py instead of a TSDB.
+
+`SyntheticPrometheus` answers the API calls in-process:
+- /api/v1/series, /api/v1/labels and /api/v1/label/<name>/values return the
+  series and label values of the synthetic fleet
+- /api/v1/query and /api/v1/query_range return results with the estimated
+  number of result series of the expression, e.g. one series per group of
+  `sum by (...)`, and one sample per step. Label values and sample values
+  are placeholders, the size of the response is what matters.
+
+Selectors matching more series than the series limit are rejected with HTTP
+422, as VictoriaMetrics does with -search.maxUniqueTimeseries.
+
+`StubPrometheusServer` serves a `SyntheticPrometheus` over HTTP on localhost
+and records request counts, concurrency and bytes returned:
+
+    with StubPrometheusServer(SyntheticPrometheus(Fleet())) as server:
+        requests.get(f"{server.url}/api/v1/query", params={'query': 'up'})
+        print(server.stats())
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from promql import (Aggregation, BinaryExpr, Call, MatrixSelector, NumberLiteral, ParenExpr, ParseError,
+                    StringLiteral, SubqueryExpr, UnaryExpr, VectorSelector, parse, walk)
+from synthetic_fleet import EXTRA_LABEL_VALUES, Fleet, SeriesModel, matcher_matches
+
+# VictoriaMetrics -search.maxUniqueTimeseries default
+DEFAULT_SERIES_LIMIT = 300_000
+
+# Functions returning a single series regardless of their arguments
+SINGLE_SERIES_FUNCTIONS = {'vector', 'time', 'pi', 'scalar', 'day_of_month', 'day_of_week', 'days_in_month',
+                           'hour', 'minute', 'month', 'year'}
+
+# Functions that add a label to their input series
+LABEL_FUNCTIONS = {'label_replace', 'label_join'}
+
+
+class QueryError(Exception):
+    """An API error, rendered as a Prometheus error response."""
+
+    def __init__(self, status: int, error_type: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+class SyntheticPrometheus:
+    """
+    Answers Prometheus HTTP API calls from a synthetic fleet.
+
+    Args:
+        fleet: The fleet to answer from
+        metric_labels: Labels each metric has, see
+                       dashboards.labels_by_metric
+        series_limit: Maximum number of series a single selector may match
+    """
+
+    def __init__(self, fleet: Fleet, metric_labels: Optional[Dict[str, Set[str]]] = None,
+                 series_limit: int = DEFAULT_SERIES_LIMIT):
+        self.fleet = fleet
+        self.metric_labels = metric_labels or {}
+        self.series_limit = series_limit
+        self._models: Dict[str, SeriesModel] = {}
+        self._lock = threading.Lock()
+
+    def model(self, metric: str) -> SeriesModel:
+        with self._lock:
+            if metric not in self._models:
+                self._models[metric] = SeriesModel(self.fleet, metric, self.metric_labels.get(metric, ()))
+            return self._models[metric]
+
+    # Selectors
+
+    def _selector_models(self, selector: VectorSelector) -> List[Tuple[SeriesModel, list]]:
+        """Return (model, matchers) for every metric a selector can match."""
+        matchers = [(m.name, m.op, m.value) for m in selector.matchers if m.name != '__name__']
+        if selector.metric_name:
+            return [(self.model(selector.metric_name), matchers)]
+        name_matchers = [(m.op, m.value) for m in selector.matchers if m.name == '__name__']
+        return [(self.model(metric), matchers) for metric in sorted(self.metric_labels)
+                if all(matcher_matches(op, value, metric) for op, value in name_matchers)]
+
+    def _check_limit(self, selector: VectorSelector, series: int):
+        if series > self.series_limit:
+            raise QueryError(422, 'execution', f"the number of matching timeseries exceeds {self.series_limit}; "
+                                               f"selector {selector.metric_name or '{...}'} matches {series} series")
+
+    def count_series(self, selector: VectorSelector) -> int:
+        series = sum(model.count(matchers) for model, matchers in self._selector_models(selector))
+        self._check_limit(selector, series)
+        return series
+
+    def _parse_selectors(self, match: List[str]) -> List[VectorSelector]:
+        selectors = []
+        for text in match:
+            try:
+                node = parse(text)
+            except ParseError as e:
+                raise QueryError(400, 'bad_data', str(e))
+            if not isinstance(node, VectorSelector):
+                raise QueryError(400, 'bad_data', f"match[] must be a series selector: {text}")
+            selectors.append(node)
+        return selectors
+
+    # Metadata endpoints
+
+    def series(self, match: List[str]) -> List[Dict[str, str]]:
+        result = []
+        for selector in self._parse_selectors(match):
+            self.count_series(selector)
+            for model, matchers in self._selector_models(selector):
+                result.extend({'__name__': model.metric, **labels} for labels in model.iter_matching(matchers))
+        return result
+
+    def label_values(self, label: str, match: Optional[List[str]] = None) -> List[str]:
+        if label == '__name__':
+            selectors = self._parse_selectors(match) if match else None
+            if not selectors:
+                return sorted(self.metric_labels)
+            return sorted({model.metric for selector in selectors
+                           for model, matchers in self._selector_models(selector) if model.count(matchers)})
+        values = set()
+        if match:
+            for selector in self._parse_selectors(match):
+                for model, matchers in self._selector_models(selector):
+                    values |= model.label_values(matchers, label)
+        else:
+            for metric in self.metric_labels:
+                values |= self.model(metric).label_values([], label)
+        return sorted(values)
+
+    def label_names(self, match: Optional[List[str]] = None) -> List[str]:
+        names = set()
+        if match:
+            for selector in self._parse_selectors(match):
+                for model, matchers in self._selector_models(selector):
+                    if model.count(matchers):
+                        names |= model.labels
+        else:
+            for metric in self.metric_labels:
+                names |= self.model(metric).labels
+        return sorted(names | {'__name__'})
+
+    # Queries
+
+    def estimate(self, node) -> Tuple[int, Set[str], bool]:
+        """
+        Estimate the result of an expression.
+
+        Returns:
+            tuple: (number of result series, result labels, whether the result is a scalar)
+        """
+        if isinstance(node, (NumberLiteral, StringLiteral)):
+            return 1, set(), True
+        if isinstance(node, VectorSelector):
+            series = self.count_series(node)
+            labels = set().union(*(model.labels for model, _ in self._selector_models(node)))
+            return series, labels | {'__name__'}, False
+        if isinstance(node, (MatrixSelector, SubqueryExpr)):
+            return self.estimate(node.vector if isinstance(node, MatrixSelector) else node.expr)
+        if isinstance(node, ParenExpr):
+            return self.estimate(node.expr)
+        if isinstance(node, UnaryExpr):
+            series, labels, scalar = self.estimate(node.expr)
+            return series, labels - {'__name__'}, scalar
+        if isinstance(node, Call):
+            return self._estimate_call(node)
+        if isinstance(node, Aggregation):
+            return self._estimate_aggregation(node)
+        if isinstance(node, BinaryExpr):
+            return self._estimate_binary(node)
+        return 1, set(), True
+
+    def _estimate_call(self, node: Call):
+        if node.func in SINGLE_SERIES_FUNCTIONS and not any(isinstance(n, VectorSelector) for n in walk(node)):
+            return 1, set(), node.func != 'vector'
+        vector_args = [arg for arg in node.args if not isinstance(arg, (NumberLiteral, StringLiteral))]
+        if not vector_args:
+            return 1, set(), True
+        if node.func == 'histogram_quantile':
+            vector_args = vector_args[-1:]
+        series, labels, scalar = self.estimate(vector_args[0])
+        if node.func in ('absent', 'absent_over_time'):
+            return (0 if series else 1), set(), False
+        if node.func in ('scalar',):
+            return 1, set(), True
+        if node.func == 'histogram_quantile' and 'le' in labels:
+            series = max(1, math.ceil(series / len(EXTRA_LABEL_VALUES['le'])))
+            labels = labels - {'le'}
+        if node.func in LABEL_FUNCTIONS and len(node.args) > 1 and isinstance(node.args[1], StringLiteral):
+            labels = labels | {node.args[1].value}
+        return series, labels - {'__name__'}, scalar
+
+    def _distinct(self, node, labels) -> int:
+        """Estimate the number of distinct label combinations over the selectors of an expression."""
+        groups = 0
+        for selector in (n for n in walk(node) if isinstance(n, VectorSelector)):
+            for model, matchers in self._selector_models(selector):
+                groups += model.distinct_count(matchers, labels)
+        return groups
+
+    def _estimate_aggregation(self, node: Aggregation):
+        series, labels, _ = self.estimate(node.expr)
+        if not series:
+            return 0, set(), False
+        if node.without:
+            out_labels = labels - set(node.grouping) - {'__name__'}
+            groups = series
+        else:
+            out_labels = set(node.grouping)
+            groups = min(series, max(1, self._distinct(node.expr, node.grouping))) if node.grouping else 1
+        if node.op in ('topk', 'bottomk', 'limitk'):
+            k = int(node.param.value) if isinstance(node.param, NumberLiteral) else 10
+            return min(series, k * groups), labels, False
+        if node.op == 'count_values':
+            return groups, out_labels | {'value'}, False
+        return groups, out_labels, False
+
+    def _estimate_binary(self, node: BinaryExpr):
+        lhs, lhs_labels, lhs_scalar = self.estimate(node.lhs)
+        rhs, rhs_labels, rhs_scalar = self.estimate(node.rhs)
+        if lhs_scalar and rhs_scalar:
+            return 1, set(), True
+        if lhs_scalar:
+            return rhs, rhs_labels - {'__name__'}, False
+        if rhs_scalar:
+            return lhs, lhs_labels - {'__name__'}, False
+        if node.op == 'or':
+            return lhs + rhs, lhs_labels | rhs_labels, False
+        if node.op in ('and', 'unless'):
+            return lhs, lhs_labels, False
+        card = node.matching.card if node.matching else None
+        if card == 'group_left':
+            return lhs, lhs_labels - {'__name__'}, False
+        if card == 'group_right':
+            return rhs, rhs_labels - {'__name__'}, False
+        return min(lhs, rhs), lhs_labels - {'__name__'}, False
+
+    def _parse_query(self, query: str):
+        try:
+            return parse(query)
+        except ParseError as e:
+            raise QueryError(400, 'bad_data', str(e))
+
+    def query_range(self, query: str, start: float, end: float, step: float) -> Tuple[str, int, int]:
+        """
+        Answer a range query.
+
+        Returns:
+            tuple: (JSON data, result series, points)
+        """
+        if step <= 0:
+            raise QueryError(400, 'bad_data', 'zero or negative query resolution step widths are not accepted')
+        points = int((end - start) // step) + 1
+        if points > 11_000:
+            raise QueryError(400, 'bad_data', 'exceeded maximum resolution of 11,000 points per timeseries')
+        series, labels, _ = self.estimate(self._parse_query(query))
+        values = json.dumps([[start + i * step, '1'] for i in range(points)], separators=(',', ':'))
+        result = ','.join(f'{{"metric":{_placeholder_labels(labels, i)},"values":{values}}}' for i in range(series))
+        return f'{{"resultType":"matrix","result":[{result}]}}', series, series * points
+
+    def query(self, query: str, at: float) -> Tuple[str, int, int]:
+        """
+        Answer an instant query.
+
+        Returns:
+            tuple: (JSON data, result series, points)
+        """
+        series, labels, scalar = self.estimate(self._parse_query(query))
+        if scalar:
+            return f'{{"resultType":"scalar","result":[{at},"1"]}}', 1, 1
+        result = ','.join(f'{{"metric":{_placeholder_labels(labels, i)},"value":[{at},"1"]}}' for i in range(series))
+        return f'{{"resultType":"vector","result":[{result}]}}', series, series
+
+    # Dispatch
+
+    def handle(self, path: str, params: Dict[str, List[str]]) -> Tuple[str, int]:
+        """
+        Answer an API call.
+
+        Returns:
+            tuple: (JSON data, points) where points is the number of samples returned by queries
+        """
+        def param(name, default=None):
+            values = params.get(name)
+            return values[-1] if values else default
+
+        def number(name, default=None):
+            value = param(name, default)
+            if value is None:
+                raise QueryError(400, 'bad_data', f"missing parameter '{name}'")
+            try:
+                return float(value)
+            except ValueError:
+                raise QueryError(400, 'bad_data', f"invalid parameter '{name}': {value}")
+
+        if path == '/api/v1/query_range':
+            data, _, points = self.query_range(param('query', ''), number('start'), number('end'), number('step'))
+            return data, points
+        if path == '/api/v1/query':
+            data, _, points = self.query(param('query', ''), number('time', time.time()))
+            return data, points
+        if path == '/api/v1/query_exemplars':
+            return '[]', 0
+        if path == '/api/v1/series':
+            if not params.get('match[]'):
+                raise QueryError(400, 'bad_data', 'no match[] parameter provided')
+            return json.dumps(self.series(params['match[]']), separators=(',', ':')), 0
+        if path == '/api/v1/labels':
+            return json.dumps(self.label_names(params.get('match[]'))), 0
+        label_match = re.fullmatch(r'/api/v1/label/([^/]+)/values', path)
+        if label_match:
+            return json.dumps(self.label_values(label_match.group(1), params.get('match[]'))), 0
+        if path == '/api/v1/status/buildinfo':
+            return json.dumps({'version': '2.45.0'}), 0
+        raise QueryError(404, 'not_found', f"unknown endpoint {path}")
+
+
+def _placeholder_labels(labels, index: int) -> str:
+    return json.dumps({label: f"{label}-{index}" for label in sorted(labels)}, separators=(',', ':'))
+
+
+class StubPrometheusServer:
+    """
+    Serves a SyntheticPrometheus over HTTP on localhost, recording every request.
+
+    Args:
+        backend: The SyntheticPrometheus answering the requests
+        port: Port to listen on, 0 picks a free port
+        latency: Seconds every response is delayed by, to make request waves observable
+    """
+
+    def __init__(self, backend: SyntheticPrometheus, port: int = 0, latency: float = 0.0):
+        self.backend = backend
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.reset_stats()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub._handle(self, parse_qs(urlsplit(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = parse_qs(urlsplit(self.path).query)
+                for name, values in parse_qs(self.rfile.read(length).decode('utf-8')).items():
+                    params.setdefault(name, []).extend(values)
+                stub._handle(self, params)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubPrometheusServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self._requests = []
+            self._max_in_flight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the request count, maximum concurrency, bytes and points returned since the last reset."""
+        with self._lock:
+            requests = list(self._requests)
+            max_in_flight = self._max_in_flight
+        by_endpoint = {}
+        for request in requests:
+            by_endpoint[request['path']] = by_endpoint.get(request['path'], 0) + 1
+        return {
+            'requests': len(requests),
+            'max_in_flight': max_in_flight,
+            'bytes': sum(r['bytes'] for r in requests),
+            'points': sum(r['points'] for r in requests),
+            'errors': sum(1 for r in requests if r['status'] != 200),
+            'by_endpoint': by_endpoint,
+        }
+
+    def _handle(self, handler: BaseHTTPRequestHandler, params: Dict[str, List[str]]):
+        path = urlsplit(handler.path).path
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        started = time.monotonic()
+        status, payload, points = 500, b'', 0
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            try:
+                data, points = self.backend.handle(path, params)
+                status = 200
+                body = f'{{"status":"success","data":{data}}}'
+            except QueryError as e:
+                status = e.status
+                body = json.dumps({'status': 'error', 'errorType': e.error_type, 'error': str(e)})
+            payload = body.encode('utf-8')
+            # The request is answered, sending the response does not count as in flight
+            with self._lock:
+                self._in_flight -= 1
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        finally:
+            with self._lock:
+                if not payload:
+                    self._in_flight -= 1
+                self._requests.append({'path': path, 'status': status, 'bytes': len(payload), 'points': points,
+                                       'seconds': time.monotonic() - started})
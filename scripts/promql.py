@@ -0,0 +1,822 @@
+"""
+PromQL / MetricsQL Parser
+-------------------------
+
+A small, dependency-free tokenizer and recursive descent parser for the
+PromQL (and the MetricsQL subset) used in the dashboard queries of this
+repository. It turns a `targets[].expr` string into an AST whose nodes are
+first-class objects: metric selectors, label matchers, range windows,
+subqueries, aggregations, function calls and binary operations.
+
+Grafana template variables are understood where they can appear in a query:
+- inside label matcher values (`cluster=~"$cluster"`), kept as plain strings
+- as range windows (`[$__rate_interval]`, `[$interval]`)
+- as scalar arguments (`topk($limit, ...)`)
+
+Every node records the `start` and `end` offsets of its source text, so
+rewriting tools can apply minimal text edits (see `apply_edits`) instead of
+re-rendering whole queries. `format_expr` renders a canonical form of any
+node when a full re-render is wanted.
+
+Parsed ASTs are cached by query string (see `parse`), so callers must treat
+the returned nodes as read-only.
+
+Usage:
+    from promql import parse, walk, VectorSelector
+
+    expr = parse('sum(rate(pulsar_in_bytes_total{cluster=~"$cluster"}[1m])) by (topic)')
+    for node in walk(expr):
+        if isinstance(node, VectorSelector):
+            print(node.metric, [str(m) for m in node.matchers])
+"""
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Iterator, Optional
+
+# Aggregation operators (PromQL and MetricsQL)
+AGGREGATION_OPERATORS = {
+    'sum', 'min', 'max', 'avg', 'group', 'stddev', 'stdvar', 'count', 'count_values',
+    'bottomk', 'topk', 'quantile', 'limitk', 'quantiles', 'any', 'distinct', 'geomean',
+    'histogram', 'mad', 'median', 'mode', 'share', 'zscore', 'sum2', 'outliersk',
+    'topk_avg', 'topk_max', 'topk_min', 'topk_last', 'topk_median',
+    'bottomk_avg', 'bottomk_max', 'bottomk_min', 'bottomk_last', 'bottomk_median',
+}
+
+# Aggregation operators that take a leading parameter, e.g. topk(10, ...)
+PARAMETRIZED_AGGREGATIONS = {
+    'count_values', 'bottomk', 'topk', 'quantile', 'limitk', 'outliersk',
+    'topk_avg', 'topk_max', 'topk_min', 'topk_last', 'topk_median',
+    'bottomk_avg', 'bottomk_max', 'bottomk_min', 'bottomk_last', 'bottomk_median',
+}
+
+# Functions that take a range vector and evaluate over a time window
+RANGE_FUNCTIONS = {
+    'rate', 'irate', 'increase', 'delta', 'idelta', 'deriv', 'predict_linear',
+    'resets', 'changes', 'holt_winters', 'double_exponential_smoothing',
+    'avg_over_time', 'min_over_time', 'max_over_time', 'sum_over_time',
+    'count_over_time', 'quantile_over_time', 'stddev_over_time', 'stdvar_over_time',
+    'last_over_time', 'present_over_time', 'absent_over_time', 'mad_over_time',
+    'increase_pure', 'rate_over_sum', 'rollup', 'rollup_rate', 'rollup_increase',
+}
+
+# Binary operators by precedence, lowest first
+BINARY_PRECEDENCE = {
+    'or': 1,
+    'and': 2, 'unless': 2,
+    '==': 3, '!=': 3, '<=': 3, '<': 3, '>=': 3, '>': 3,
+    '+': 4, '-': 4,
+    '*': 5, '/': 5, '%': 5, 'atan2': 5,
+    '^': 6,
+}
+COMPARISON_OPERATORS = {'==', '!=', '<=', '<', '>=', '>'}
+SET_OPERATORS = {'and', 'or', 'unless'}
+
+KEYWORDS = {
+    'and', 'or', 'unless', 'atan2', 'by', 'without', 'on', 'ignoring',
+    'group_left', 'group_right', 'offset', 'bool',
+}
+
+DURATION_UNITS = {
+    'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000,
+}
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?(?:ms|[smhdwy]))+')
+_DURATION_PART_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|[smhdwy])')
+
+_TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<duration>(?:\d+(?:\.\d+)?(?:ms|[smhdwy]))+(?![a-zA-Z0-9_]))
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<variable>\$\{[^}]+\}|\$[a-zA-Z_][a-zA-Z0-9_]*|\[\[[a-zA-Z_][a-zA-Z0-9_:]*\]\])
+  | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`[^`]*`)
+  | (?P<op>=~|!~|==|!=|<=|>=|[-+*/%^<>=,(){}\[\]:@])
+''', re.VERBOSE)
+
+
+class ParseError(ValueError):
+    """Raised when a query cannot be tokenized or parsed."""
+
+    def __init__(self, message: str, query: str, pos: int):
+        super().__init__(f"{message} at position {pos} in {query!r}")
+        self.query = query
+        self.pos = pos
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+def tokenize(query: str) -> list[Token]:
+    """
+    Split a query string into tokens.
+
+    Args:
+        query: A PromQL/MetricsQL query string
+
+    Returns:
+        A list of tokens, terminated by an 'eof' token
+    """
+    tokens = []
+    pos = 0
+    length = len(query)
+    in_brackets = False
+    while pos < length:
+        if in_brackets and query[pos] == ':':
+            # Subquery separator, e.g. [5m:1m], not the start of a metric name
+            tokens.append(Token('op', ':', pos, pos + 1))
+            pos += 1
+            continue
+        match = _TOKEN_RE.match(query, pos)
+        if not match:
+            raise ParseError(f"Unexpected character {query[pos]!r}", query, pos)
+        kind = match.lastgroup
+        if kind != 'ws':
+            text = match.group()
+            tokens.append(Token(kind, text, pos, match.end()))
+            if kind == 'op' and text in ('[', ']'):
+                in_brackets = text == '['
+        pos = match.end()
+    tokens.append(Token('eof', '', length, length))
+    return tokens
+
+
+# --- AST nodes ---------------------------------------------------------------
+
+@dataclass(eq=False)
+class Node:
+    start: int = field(default=0, repr=False, kw_only=True)
+    end: int = field(default=0, repr=False, kw_only=True)
+
+    def children(self) -> list['Node']:
+        return []
+
+    def __str__(self) -> str:
+        return format_expr(self)
+
+
+@dataclass(eq=False)
+class NumberLiteral(Node):
+    value: str
+
+
+@dataclass(eq=False)
+class StringLiteral(Node):
+    value: str
+    quote: str = '"'
+
+
+@dataclass(eq=False)
+class TemplateVariable(Node):
+    """A Grafana template variable used as a scalar, e.g. topk($limit, ...)."""
+    text: str
+
+    @property
+    def name(self) -> str:
+        return variable_name(self.text)
+
+
+@dataclass(eq=False)
+class LabelMatcher(Node):
+    name: str
+    op: str
+    value: str
+
+    @property
+    def is_regex(self) -> bool:
+        return self.op in ('=~', '!~')
+
+    @property
+    def is_negative(self) -> bool:
+        return self.op in ('!=', '!~')
+
+    @property
+    def variables(self) -> list[str]:
+        """Names of the template variables referenced in the matcher value."""
+        return template_variables(self.value)
+
+
+@dataclass(eq=False)
+class VectorSelector(Node):
+    metric: Optional[str]
+    matchers: list[LabelMatcher] = field(default_factory=list)
+    offset: Optional[str] = None
+    at: Optional[str] = None
+    # Span of the `{...}` block, or None when the selector has no braces
+    matchers_span: Optional[tuple[int, int]] = field(default=None, repr=False)
+
+    def children(self):
+        return list(self.matchers)
+
+    @property
+    def metric_name(self) -> Optional[str]:
+        """The metric name, also when given as a __name__="..." matcher."""
+        if self.metric:
+            return self.metric
+        for matcher in self.matchers:
+            if matcher.name == '__name__' and matcher.op == '=':
+                return matcher.value
+        return None
+
+    def matchers_for(self, label: str) -> list[LabelMatcher]:
+        return [m for m in self.matchers if m.name == label]
+
+
+@dataclass(eq=False)
+class MatrixSelector(Node):
+    vector: VectorSelector
+    range: str
+    range_span: tuple[int, int] = field(default=(0, 0), repr=False)
+
+    def children(self):
+        return [self.vector]
+
+    @property
+    def range_seconds(self) -> Optional[float]:
+        return duration_seconds(self.range)
+
+
+@dataclass(eq=False)
+class SubqueryExpr(Node):
+    expr: Node
+    range: str
+    step: Optional[str] = None
+    offset: Optional[str] = None
+    at: Optional[str] = None
+    range_span: tuple[int, int] = field(default=(0, 0), repr=False)
+
+    def children(self):
+        return [self.expr]
+
+    @property
+    def range_seconds(self) -> Optional[float]:
+        return duration_seconds(self.range)
+
+
+@dataclass(eq=False)
+class Call(Node):
+    func: str
+    args: list[Node] = field(default_factory=list)
+
+    def children(self):
+        return list(self.args)
+
+
+@dataclass(eq=False)
+class Aggregation(Node):
+    op: str
+    expr: Node
+    param: Optional[Node] = None
+    grouping: list[str] = field(default_factory=list)
+    without: bool = False
+    # Whether the by/without clause is written before or after the arguments
+    grouping_first: bool = False
+    has_grouping: bool = False
+    # Extra MetricsQL arguments, e.g. histogram_quantiles-style multi-arg aggregates
+    extra_args: list[Node] = field(default_factory=list)
+    modifier_limit: Optional[str] = None
+    # Span of the `by (...)` or `without (...)` clause, or None when there is none
+    grouping_span: Optional[tuple[int, int]] = field(default=None, repr=False)
+
+    def children(self):
+        nodes = []
+        if self.param is not None:
+            nodes.append(self.param)
+        nodes.append(self.expr)
+        nodes.extend(self.extra_args)
+        return nodes
+
+    @property
+    def grouping_labels(self) -> list[str]:
+        return [] if self.without else list(self.grouping)
+
+
+@dataclass(eq=False)
+class VectorMatching(Node):
+    on: bool = False
+    labels: list[str] = field(default_factory=list)
+    card: Optional[str] = None  # 'group_left' or 'group_right'
+    include: list[str] = field(default_factory=list)
+
+
+@dataclass(eq=False)
+class BinaryExpr(Node):
+    op: str
+    lhs: Node
+    rhs: Node
+    return_bool: bool = False
+    matching: Optional[VectorMatching] = None
+
+    def children(self):
+        return [self.lhs, self.rhs]
+
+
+@dataclass(eq=False)
+class UnaryExpr(Node):
+    op: str
+    expr: Node
+
+    def children(self):
+        return [self.expr]
+
+
+@dataclass(eq=False)
+class ParenExpr(Node):
+    expr: Node
+
+    def children(self):
+        return [self.expr]
+
+
+# --- Parser ------------------------------------------------------------------
+
+class _Parser:
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.index = 0
+
+    # Token helpers
+
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Token:
+        token = self.tokens[self.index]
+        if token.kind != 'eof':
+            self.index += 1
+        return token
+
+    def at(self, text: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind in ('op', 'ident') and token.text == text
+
+    def expect(self, text: str) -> Token:
+        token = self.next()
+        if token.text != text or token.kind not in ('op', 'ident'):
+            self.error(f"Expected {text!r} but found {token.text or 'end of query'!r}", token)
+        return token
+
+    def error(self, message: str, token: Optional[Token] = None):
+        token = token or self.peek()
+        raise ParseError(message, self.query, token.start)
+
+    def binary_operator(self) -> Optional[str]:
+        token = self.peek()
+        if token.kind == 'op' and token.text in BINARY_PRECEDENCE:
+            return token.text
+        if token.kind == 'ident' and token.text.lower() in ('and', 'or', 'unless', 'atan2'):
+            return token.text.lower()
+        return None
+
+    # Grammar
+
+    def parse(self) -> Node:
+        expr = self.parse_expr(0)
+        if self.peek().kind != 'eof':
+            self.error(f"Unexpected {self.peek().text!r}")
+        return expr
+
+    def parse_expr(self, min_precedence: int) -> Node:
+        lhs = self.parse_unary()
+        while True:
+            op = self.binary_operator()
+            if op is None:
+                return lhs
+            precedence = BINARY_PRECEDENCE[op]
+            if precedence < min_precedence:
+                return lhs
+            self.next()
+            return_bool = False
+            if self.at('bool'):
+                self.next()
+                return_bool = True
+            matching = self.parse_vector_matching()
+            # '^' is right associative, everything else is left associative
+            next_min = precedence if op == '^' else precedence + 1
+            rhs = self.parse_expr(next_min)
+            lhs = BinaryExpr(op, lhs, rhs, return_bool, matching, start=lhs.start, end=rhs.end)
+
+    def parse_vector_matching(self) -> Optional[VectorMatching]:
+        if not (self.at('on') or self.at('ignoring')):
+            return None
+        start = self.peek().start
+        on = self.next().text == 'on'
+        labels = self.parse_label_list()
+        matching = VectorMatching(on, labels, start=start, end=self.tokens[self.index - 1].end)
+        if self.at('group_left') or self.at('group_right'):
+            matching.card = self.next().text
+            if self.at('('):
+                matching.include = self.parse_label_list()
+            matching.end = self.tokens[self.index - 1].end
+        return matching
+
+    def parse_unary(self) -> Node:
+        token = self.peek()
+        if token.kind == 'op' and token.text in ('-', '+'):
+            self.next()
+            # Unary operators bind weaker than '^': -a ^ b == -(a ^ b)
+            expr = self.parse_expr(BINARY_PRECEDENCE['^'])
+            if token.text == '-' and isinstance(expr, NumberLiteral) and expr.start == token.end:
+                return NumberLiteral('-' + expr.value, start=token.start, end=expr.end)
+            return UnaryExpr(token.text, expr, start=token.start, end=expr.end)
+        return self.parse_postfix(self.parse_primary())
+
+    def parse_postfix(self, expr: Node) -> Node:
+        while True:
+            if self.at('['):
+                expr = self.parse_range(expr)
+            elif self.at('offset'):
+                self.next()
+                offset = self.parse_duration_text(allow_negative=True)
+                self._set_modifier(expr, 'offset', offset)
+            elif self.at('@'):
+                self.next()
+                token = self.next()
+                text = token.text
+                if token.kind == 'ident' and self.at('('):
+                    # start() / end()
+                    self.expect('(')
+                    self.expect(')')
+                    text += '()'
+                self._set_modifier(expr, 'at', text)
+            else:
+                return expr
+
+    def _set_modifier(self, expr: Node, name: str, value: str):
+        target = expr.vector if isinstance(expr, MatrixSelector) else expr
+        if not isinstance(target, (VectorSelector, SubqueryExpr)):
+            self.error(f"'{name}' modifier must follow a selector or subquery")
+        setattr(target, name, value)
+        expr.end = self.tokens[self.index - 1].end
+
+    def parse_range(self, expr: Node) -> Node:
+        open_token = self.expect('[')
+        range_start = self.peek().start
+        range_text = self.parse_duration_text()
+        range_span = (range_start, self.tokens[self.index - 1].end)
+        if self.at(':'):
+            self.next()
+            step = None
+            if not self.at(']'):
+                step = self.parse_duration_text()
+            close = self.expect(']')
+            return SubqueryExpr(expr, range_text, step, range_span=range_span, start=expr.start, end=close.end)
+        close = self.expect(']')
+        if not isinstance(expr, VectorSelector) or expr.offset or expr.at:
+            self.error("Range window must follow a plain vector selector", open_token)
+        return MatrixSelector(expr, range_text, range_span=range_span, start=expr.start, end=close.end)
+
+    def parse_duration_text(self, allow_negative: bool = False) -> str:
+        token = self.next()
+        text = token.text
+        if allow_negative and token.kind == 'op' and text == '-':
+            token = self.next()
+            text = '-' + token.text
+        if token.kind in ('duration', 'variable', 'number'):
+            return text
+        self.error(f"Expected duration but found {token.text or 'end of query'!r}", token)
+
+    def parse_primary(self) -> Node:
+        token = self.peek()
+        if token.kind == 'number':
+            self.next()
+            return NumberLiteral(token.text, start=token.start, end=token.end)
+        if token.kind == 'duration':
+            # MetricsQL accepts durations as numeric literals, e.g. `x > 5m`
+            self.next()
+            return NumberLiteral(token.text, start=token.start, end=token.end)
+        if token.kind == 'string':
+            self.next()
+            return StringLiteral(unquote(token.text), token.text[0], start=token.start, end=token.end)
+        if token.kind == 'variable':
+            self.next()
+            return TemplateVariable(token.text, start=token.start, end=token.end)
+        if token.kind == 'op' and token.text == '(':
+            self.next()
+            expr = self.parse_expr(0)
+            close = self.expect(')')
+            return ParenExpr(expr, start=token.start, end=close.end)
+        if token.kind == 'op' and token.text == '{':
+            return self.parse_selector(None, token.start)
+        if token.kind == 'ident':
+            name = token.text
+            lowered = name.lower()
+            if lowered in ('inf', 'nan') and not self.at('(', 1) and not self.at('{', 1):
+                self.next()
+                return NumberLiteral(name, start=token.start, end=token.end)
+            if lowered in AGGREGATION_OPERATORS and (self.at('(', 1) or self.at('by', 1) or self.at('without', 1)):
+                return self.parse_aggregation()
+            if self.at('(', 1):
+                return self.parse_call()
+            if name in KEYWORDS:
+                self.error(f"Unexpected keyword {name!r}", token)
+            self.next()
+            return self.parse_selector(name, token.start, token.end)
+        self.error(f"Unexpected {token.text or 'end of query'!r}", token)
+
+    def parse_selector(self, metric: Optional[str], start: int, end: int = 0) -> VectorSelector:
+        selector = VectorSelector(metric, start=start, end=end)
+        if self.at('{'):
+            open_token = self.next()
+            while not self.at('}'):
+                selector.matchers.append(self.parse_matcher())
+                if not self.at('}'):
+                    self.expect(',')
+            close = self.expect('}')
+            selector.matchers_span = (open_token.start, close.end)
+            selector.end = close.end
+        return selector
+
+    def parse_matcher(self) -> LabelMatcher:
+        name_token = self.next()
+        if name_token.kind not in ('ident', 'string'):
+            self.error(f"Expected label name but found {name_token.text!r}", name_token)
+        name = unquote(name_token.text) if name_token.kind == 'string' else name_token.text
+        op_token = self.next()
+        if op_token.kind != 'op' or op_token.text not in ('=', '!=', '=~', '!~'):
+            self.error(f"Expected label matching operator but found {op_token.text!r}", op_token)
+        value_token = self.next()
+        if value_token.kind != 'string':
+            self.error(f"Expected label value string but found {value_token.text!r}", value_token)
+        return LabelMatcher(name, op_token.text, unquote(value_token.text),
+                            start=name_token.start, end=value_token.end)
+
+    def parse_label_list(self) -> list[str]:
+        self.expect('(')
+        labels = []
+        while not self.at(')'):
+            token = self.next()
+            if token.kind == 'string':
+                labels.append(unquote(token.text))
+            elif token.kind == 'ident':
+                labels.append(token.text)
+            else:
+                self.error(f"Expected label name but found {token.text!r}", token)
+            if not self.at(')'):
+                self.expect(',')
+        self.expect(')')
+        return labels
+
+    def parse_args(self) -> list[Node]:
+        self.expect('(')
+        args = []
+        while not self.at(')'):
+            args.append(self.parse_expr(0))
+            if not self.at(')'):
+                self.expect(',')
+        self.expect(')')
+        return args
+
+    def parse_call(self) -> Call:
+        name_token = self.next()
+        args = self.parse_args()
+        return Call(name_token.text, args, start=name_token.start, end=self.tokens[self.index - 1].end)
+
+    def parse_aggregation(self) -> Aggregation:
+        op_token = self.next()
+        grouping, without, has_grouping, grouping_first, grouping_span = [], False, False, False, None
+        if self.at('by') or self.at('without'):
+            clause_token = self.next()
+            without = clause_token.text == 'without'
+            grouping = self.parse_label_list()
+            has_grouping = grouping_first = True
+            grouping_span = (clause_token.start, self.tokens[self.index - 1].end)
+        args = self.parse_args()
+        if not args:
+            self.error(f"Aggregation {op_token.text!r} requires an argument", op_token)
+        if not has_grouping and (self.at('by') or self.at('without')):
+            clause_token = self.next()
+            without = clause_token.text == 'without'
+            grouping = self.parse_label_list()
+            has_grouping = True
+            grouping_span = (clause_token.start, self.tokens[self.index - 1].end)
+        modifier_limit = None
+        if self.at('limit') and self.peek(1).kind == 'number':
+            # MetricsQL: sum(...) by (x) limit 10
+            self.next()
+            modifier_limit = self.next().text
+        op = op_token.text.lower()
+        param = None
+        if op in PARAMETRIZED_AGGREGATIONS and len(args) >= 2:
+            param, expr, extra = args[0], args[1], args[2:]
+        else:
+            expr, extra = args[0], args[1:]
+        return Aggregation(op, expr, param, grouping, without, grouping_first, has_grouping, extra,
+                           modifier_limit, grouping_span, start=op_token.start, end=self.tokens[self.index - 1].end)
+
+
+# --- Public API --------------------------------------------------------------
+
+@lru_cache(maxsize=8192)
+def parse(query: str) -> Node:
+    """
+    Parse a PromQL/MetricsQL query into an AST.
+
+    Results are cached by query string, so the returned nodes are shared
+    between callers and must not be mutated.
+
+    Args:
+        query: A PromQL/MetricsQL query string
+
+    Returns:
+        The root node of the AST
+
+    Raises:
+        ParseError: If the query is not valid
+    """
+    return _Parser(query).parse()
+
+
+def walk(node: Node) -> Iterator[Node]:
+    """Yield a node and all of its descendants in pre-order."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.children()))
+
+
+def walk_with_parents(node: Node, parents: tuple = ()) -> Iterator[tuple[Node, tuple]]:
+    """Yield (node, ancestors) pairs in pre-order, ancestors ordered root first."""
+    yield node, parents
+    for child in node.children():
+        yield from walk_with_parents(child, parents + (node,))
+
+
+def selectors(node: Node) -> list[VectorSelector]:
+    """Return all vector selectors of an expression in source order."""
+    return [n for n in walk(node) if isinstance(n, VectorSelector)]
+
+
+def metric_names(node: Node) -> set[str]:
+    """Return the metric names referenced by an expression."""
+    return {s.metric_name for s in selectors(node) if s.metric_name}
+
+
+def unwrap_parens(node: Node) -> Node:
+    while isinstance(node, ParenExpr):
+        node = node.expr
+    return node
+
+
+def unquote(text: str) -> str:
+    """Strip the quotes of a string token and resolve escape sequences."""
+    quote, body = text[0], text[1:-1]
+    if quote == '`':
+        return body
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 't': '\t', 'r': '\r'}.get(m.group(1), m.group(1)), body)
+
+
+def quote(value: str) -> str:
+    """Render a string as a double quoted PromQL string literal."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+_VARIABLE_RE = re.compile(r'\$\{([a-zA-Z_][a-zA-Z0-9_]*)(?::[^}]*)?\}|\$([a-zA-Z_][a-zA-Z0-9_]*)|\[\[([a-zA-Z_][a-zA-Z0-9_]*)(?::[^\]]*)?\]\]')
+
+
+def template_variables(text: str) -> list[str]:
+    """Return the names of the Grafana template variables referenced in a string."""
+    return [next(g for g in m.groups() if g) for m in _VARIABLE_RE.finditer(text)]
+
+
+def strip_template_variables(text: str) -> str:
+    """Remove all template variable references from a string."""
+    return _VARIABLE_RE.sub('', text)
+
+
+def replace_template_variables(text: str, replacement: Callable[[str], str]) -> str:
+    """Replace every template variable reference with replacement(variable name)."""
+    return _VARIABLE_RE.sub(lambda m: replacement(next(g for g in m.groups() if g)), text)
+
+
+def variable_name(text: str) -> str:
+    names = template_variables(text)
+    return names[0] if names else text
+
+
+def is_template_variable(text: str) -> bool:
+    """Whether the whole text is a single template variable reference."""
+    match = _VARIABLE_RE.fullmatch(text)
+    return match is not None
+
+
+def duration_seconds(text: Optional[str]) -> Optional[float]:
+    """
+    Convert a duration like '1m' or '1h30m' to seconds.
+
+    Returns None for template variables and other non-literal durations.
+    """
+    if not text:
+        return None
+    if _DURATION_RE.fullmatch(text):
+        return sum(float(value) * DURATION_UNITS[unit] for value, unit in _DURATION_PART_RE.findall(text))
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def apply_edits(query: str, edits: list[tuple[int, int, str]]) -> str:
+    """
+    Apply non-overlapping (start, end, replacement) text edits to a query.
+
+    Using the node spans recorded by the parser, this allows rewriting a
+    query while leaving all untouched parts byte for byte identical.
+    """
+    result = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        if start < pos:
+            raise ValueError(f"Overlapping edit at position {start}")
+        result.append(query[pos:start])
+        result.append(replacement)
+        pos = end
+    result.append(query[pos:])
+    return ''.join(result)
+
+
+def format_matchers(matchers: list[LabelMatcher]) -> str:
+    return '{' + ', '.join(format_expr(m) for m in matchers) + '}'
+
+
+def _format_labels(labels: list[str]) -> str:
+    return '(' + ', '.join(labels) + ')'
+
+
+def format_expr(node: Node) -> str:
+    """Render an AST node as a canonical query string."""
+    if isinstance(node, NumberLiteral):
+        return node.value
+    if isinstance(node, StringLiteral):
+        return quote(node.value)
+    if isinstance(node, TemplateVariable):
+        return node.text
+    if isinstance(node, LabelMatcher):
+        return f"{node.name}{node.op}{quote(node.value)}"
+    if isinstance(node, VectorSelector):
+        text = node.metric or ''
+        if node.matchers or not node.metric:
+            text += format_matchers(node.matchers)
+        if node.offset:
+            text += f" offset {node.offset}"
+        if node.at:
+            text += f" @ {node.at}"
+        return text
+    if isinstance(node, MatrixSelector):
+        vector = node.vector
+        text = (vector.metric or '')
+        if vector.matchers or not vector.metric:
+            text += format_matchers(vector.matchers)
+        text += f"[{node.range}]"
+        if vector.offset:
+            text += f" offset {vector.offset}"
+        if vector.at:
+            text += f" @ {vector.at}"
+        return text
+    if isinstance(node, SubqueryExpr):
+        text = f"{format_expr(node.expr)}[{node.range}:{node.step or ''}]"
+        if node.offset:
+            text += f" offset {node.offset}"
+        if node.at:
+            text += f" @ {node.at}"
+        return text
+    if isinstance(node, Call):
+        return f"{node.func}({', '.join(format_expr(a) for a in node.args)})"
+    if isinstance(node, Aggregation):
+        args = ([node.param] if node.param is not None else []) + [node.expr] + node.extra_args
+        text = node.op
+        grouping = ''
+        if node.has_grouping:
+            grouping = f"{'without' if node.without else 'by'} {_format_labels(node.grouping)}"
+        if grouping and node.grouping_first:
+            text += f" {grouping} "
+        text += f"({', '.join(format_expr(a) for a in args)})"
+        if grouping and not node.grouping_first:
+            text += f" {grouping}"
+        if node.modifier_limit:
+            text += f" limit {node.modifier_limit}"
+        return text
+    if isinstance(node, BinaryExpr):
+        op = node.op
+        if node.return_bool:
+            op += ' bool'
+        if node.matching:
+            op += f" {'on' if node.matching.on else 'ignoring'}{_format_labels(node.matching.labels)}"
+            if node.matching.card:
+                op += f" {node.matching.card}"
+                if node.matching.include:
+                    op += _format_labels(node.matching.include)
+        return f"{format_expr(node.lhs)} {op} {format_expr(node.rhs)}"
+    if isinstance(node, UnaryExpr):
+        return f"{node.op}{format_expr(node.expr)}"
+    if isinstance(node, ParenExpr):
+        return f"({format_expr(node.expr)})"
+    raise TypeError(f"Cannot format {type(node).__name__}")
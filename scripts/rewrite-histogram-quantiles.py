@@ -0,0 +1,356 @@
+#!/usr/bin/env -S uv run
+"""
+Histogram Quantile Rewriter
+---------------------------
+
+This script normalizes the histogram_quantile() queries of Grafana dashboards,
+and optionally merges panels showing different quantiles of the same
+histogram into one panel that scans the buckets once.
+
+Bucket pre-aggregation is normalized to `sum by (le, ...)` over `rate(...)`:
+- Raw bucket selectors are wrapped in rate(...[$__rate_interval]). Bucket
+  series are counters, so without rate() the quantile is computed over
+  everything observed since the process started instead of over recent
+  observations:
+
+      histogram_quantile(0.99, sum by (le) (oxia_coordinator_metadata_get_latency_milliseconds_bucket{oxia_cluster=~"$cluster"}))
+      histogram_quantile(0.99, sum by (le) (rate(oxia_coordinator_metadata_get_latency_milliseconds_bucket{oxia_cluster=~"$cluster"}[$__rate_interval])))
+
+- `le` is added to the grouping of sum(), which otherwise aggregates the
+  buckets away and makes histogram_quantile() return nothing
+- Aggregations removing `le` with without(), and buckets that are not
+  aggregated, are reported and left as they are
+
+With --merge quantiles, panels of the same dashboard section that show
+different quantiles of the same bucket query (e.g. the 50pct, 99pct and 99.9pct
+leader election latency panels of oxia-coordinator.json) are merged into the
+first of them, which computes all quantiles from a single bucket query with
+the MetricsQL histogram_quantiles() function:
+
+    histogram_quantiles("quantile", 0.50, 0.99, 0.999, sum(rate(..._bucket{...}[$__rate_interval])) by (le, shard, oxia_namespace))
+
+The quantile is added to the legend, and the merged panel takes the width of
+the panels it replaces when they are on the same line. With --merge heatmap
+the panels are instead replaced by a heatmap panel of the bucket rates summed
+by `le`, which shows the whole distribution. Panels are merged when they have
+a single target, the same type and unit, and are not repeated or library
+panels. Merging requires VictoriaMetrics (quantiles) or Grafana 9+ (heatmap).
+
+Queries are parsed with promql.py and only the normalized parts are edited,
+so the rest of every query stays byte for byte identical.
+
+Usage:
+    python rewrite-histogram-quantiles.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are processed.
+
+Options:
+    --merge MODE    Merge multi-quantile panels: 'quantiles' (histogram_quantiles()) or 'heatmap'
+    --dry-run       Only print the report, do not modify any files
+    --check         Like --dry-run, but exit with status 1 if any dashboard would be modified
+
+Output:
+    - Diff report of the normalized queries and the merged panels by dashboard
+    - Summary of the calls normalized and the bucket queries saved per load
+"""
+
+import argparse
+import sys
+from collections import Counter
+
+from dashboards import (default_dashboard_files, iter_panels, load_dashboard, panel_label, panel_query_targets,
+                        write_dashboard)
+from promql import (Aggregation, Call, MatrixSelector, NumberLiteral, ParseError, VectorSelector, apply_edits,
+                    format_expr, parse, unwrap_parens, walk)
+
+RATE_INTERVAL = '$__rate_interval'
+BUCKET_FUNCTIONS = {'rate', 'irate', 'increase'}
+
+MERGE_MODES = ('quantiles', 'heatmap')
+QUANTILE_LABEL = 'quantile'
+MERGEABLE_PANEL_TYPES = {'timeseries', 'graph'}
+
+# Trailing title words separating the name of a panel from its quantile, e.g. 'Write Latency - 99pct'
+_TITLE_SEPARATORS = {'-', '|', ':', '('}
+
+
+def normalize_buckets(query, stats):
+    """
+    Normalize the bucket pre-aggregation of the histogram_quantile() calls of a query.
+
+    Args:
+        query (str): The PromQL expression
+        stats (Counter): Counts of the normalizations and the calls left as they are, updated in place
+
+    Returns:
+        tuple: (normalized query, list of notes on the calls left as they are)
+    """
+    try:
+        root = parse(query)
+    except ParseError as e:
+        print(f"Warning: {e}", file=sys.stderr)
+        return query, []
+
+    edits, notes = [], []
+    for node in walk(root):
+        if not (isinstance(node, Call) and node.func == 'histogram_quantile' and len(node.args) == 2):
+            continue
+        stats['calls'] += 1
+        buckets = unwrap_parens(node.args[1])
+        if not isinstance(buckets, Aggregation):
+            stats['not aggregated'] += 1
+            notes.append('buckets are not aggregated')
+            if isinstance(buckets, VectorSelector):
+                edits.append((buckets.start, buckets.end, f"rate({query[buckets.start:buckets.end]}[{RATE_INTERVAL}])"))
+                stats['rate added'] += 1
+            continue
+        if buckets.op != 'sum':
+            notes.append(f"buckets are aggregated with {buckets.op}()")
+            continue
+        if buckets.without:
+            if 'le' in buckets.grouping:
+                stats['le aggregated away'] += 1
+                notes.append('without() removes le')
+                continue
+        elif 'le' not in buckets.grouping:
+            if buckets.grouping_span:
+                open_paren = query.index('(', buckets.grouping_span[0])
+                edits.append((open_paren + 1, open_paren + 1, 'le, ' if buckets.grouping else 'le'))
+            else:
+                op_end = buckets.start + len(buckets.op)
+                edits.append((op_end, op_end, ' by (le) '))
+            stats['le added'] += 1
+
+        inner = unwrap_parens(buckets.expr)
+        if isinstance(inner, VectorSelector):
+            edits.append((inner.start, inner.end, f"rate({query[inner.start:inner.end]}[{RATE_INTERVAL}])"))
+            stats['rate added'] += 1
+        elif not (isinstance(inner, Call) and inner.func in BUCKET_FUNCTIONS
+                  and isinstance(inner.args[-1], MatrixSelector)):
+            notes.append('buckets are not a rate()')
+    return apply_edits(query, edits), notes
+
+
+def quantile_panel(panel):
+    """
+    Return (quantile text, bucket aggregation, target) of a panel showing a
+    single histogram_quantile(<number>, sum by (le, ...) (...)) target, or None.
+    """
+    if panel.get('type') not in MERGEABLE_PANEL_TYPES or panel.get('repeat') or 'repeatPanelId' in panel:
+        return None
+    if panel.get('libraryPanel') or len(panel.get('targets') or []) != 1:
+        return None
+    targets = panel_query_targets(panel)
+    if len(targets) != 1:
+        return None
+    target = targets[0]
+    try:
+        root = unwrap_parens(parse(target['expr']))
+    except ParseError:
+        return None
+    if not (isinstance(root, Call) and root.func == 'histogram_quantile' and len(root.args) == 2):
+        return None
+    quantile, buckets = root.args[0], unwrap_parens(root.args[1])
+    if not isinstance(quantile, NumberLiteral) or not isinstance(buckets, Aggregation) or buckets.without:
+        return None
+    if 'le' not in buckets.grouping:
+        return None
+    return quantile.value, buckets, target
+
+
+def panel_sections(dashboard):
+    """
+    Yield (panel, section, container) for the panels of a dashboard: the row
+    the panel is shown under (None before the first row) and the list holding it.
+    """
+    section = None
+    for panel, row in iter_panels(dashboard):
+        if panel.get('type') == 'row':
+            section = panel
+            continue
+        container = row['panels'] if row is not None else dashboard['panels']
+        yield panel, row if row is not None else section, container
+
+
+def common_title(titles):
+    """Return the words the titles start with, without a trailing separator, e.g. 'Write Latency' for '... 50pct' and '... 99pct'."""
+    words = [title.split() for title in titles]
+    common = []
+    for column in zip(*words):
+        if len(set(column)) != 1:
+            break
+        common.append(column[0])
+    while common and common[-1] in _TITLE_SEPARATORS:
+        common.pop()
+    return ' '.join(common) or titles[0]
+
+
+def merged_width(panels):
+    """Return the gridPos covering panels on the same line, or the gridPos of the first panel."""
+    positions = [panel.get('gridPos') or {} for panel in panels]
+    first = dict(positions[0])
+    if len({(pos.get('y'), pos.get('h')) for pos in positions}) == 1 and all('x' in pos for pos in positions):
+        first['x'] = min(pos['x'] for pos in positions)
+        first['w'] = min(24, max(pos['x'] + pos.get('w', 0) for pos in positions) - first['x'])
+    return first
+
+
+def heatmap_expr(expr, buckets):
+    """Return the bucket aggregation of a histogram_quantile() target summed by le only."""
+    start, end = buckets.grouping_span
+    return expr[buckets.start:start] + 'by (le)' + expr[end:buckets.end]
+
+
+def merge_panels(panels, mode):
+    """
+    Merge panels showing quantiles of the same buckets into the first of them.
+
+    Args:
+        panels (list): (panel, (quantile, buckets, target)) in dashboard order
+        mode (str): One of MERGE_MODES
+
+    Returns:
+        dict: The merged panel
+    """
+    panel, (_, buckets, target) = panels[0]
+    expr = target['expr']
+    quantiles = sorted((info[0] for _, info in panels), key=float)
+    panel['title'] = common_title([p.get('title') or '' for p, _ in panels])
+    panel['gridPos'] = merged_width([p for p, _ in panels])
+    if mode == 'quantiles':
+        buckets_text = expr[buckets.start:buckets.end]
+        target['expr'] = f"histogram_quantiles(\"{QUANTILE_LABEL}\", {', '.join(quantiles)}, {buckets_text})"
+        legend = target.get('legendFormat') or ''
+        if legend and legend != '__auto':
+            target['legendFormat'] = f"{legend} ({{{{{QUANTILE_LABEL}}}}})"
+        return panel
+
+    unit = ((panel.get('fieldConfig') or {}).get('defaults') or {}).get('unit')
+    target['expr'] = heatmap_expr(expr, buckets)
+    target['format'] = 'heatmap'
+    target['legendFormat'] = '{{le}}'
+    panel['type'] = 'heatmap'
+    panel['fieldConfig'] = {'defaults': {}, 'overrides': []}
+    panel['options'] = {
+        'calculate': False,
+        'cellGap': 1,
+        'color': {'mode': 'scheme', 'scheme': 'Spectral', 'steps': 64},
+        'legend': {'show': True},
+        'tooltip': {'show': True, 'yHistogram': False},
+        'yAxis': {'unit': unit} if unit else {},
+    }
+    return panel
+
+
+def merge_quantile_panels(dashboard, mode):
+    """
+    Merge the multi-quantile panels of a dashboard.
+
+    Returns:
+        list: (merged panel label, quantiles, number of panels removed)
+    """
+    groups = {}
+    for panel, section, container in panel_sections(dashboard):
+        info = quantile_panel(panel)
+        if info is None:
+            continue
+        _, buckets, target = info
+        unit = ((panel.get('fieldConfig') or {}).get('defaults') or {}).get('unit')
+        key = (id(section), panel.get('type'), unit, buckets.op, frozenset(buckets.grouping),
+               format_expr(buckets.expr), target.get('instant', False))
+        groups.setdefault(key, []).append((panel, info, container))
+
+    merged = []
+    for members in groups.values():
+        if len(members) < 2 or len({info[0] for _, info, _ in members}) != len(members):
+            continue
+        merged_panel = merge_panels([(panel, info) for panel, info, _ in members], mode)
+        for panel, _, container in members[1:]:
+            container.remove(panel)
+        merged.append((panel_label(merged_panel), sorted((info[0] for _, info, _ in members), key=float),
+                       len(members) - 1))
+    return merged
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Histogram Quantile Rewriter",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to process (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--merge', choices=MERGE_MODES,
+                        help='Merge multi-quantile panels with histogram_quantiles() or into a heatmap')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the report, do not modify any files')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if any dashboard would be modified, implies --dry-run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    write = not (args.dry_run or args.check)
+
+    stats = Counter()
+    modified_files = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboard = load_dashboard(file_path)
+        except Exception as e:
+            print(f"Error reading '{file_path}': {e}. Skipping.")
+            continue
+
+        header_printed = False
+        normalized = 0
+        for panel, _ in iter_panels(dashboard):
+            for target in panel_query_targets(panel):
+                if 'histogram_quantile' not in target['expr']:
+                    continue
+                new_expr, notes = normalize_buckets(target['expr'], stats)
+                if new_expr == target['expr'] and not notes:
+                    continue
+                if not header_printed:
+                    print(f"--- {file_path}")
+                    header_printed = True
+                print(f"  {panel_label(panel)} (refId {target.get('refId', '?')})")
+                if new_expr != target['expr']:
+                    print(f"  - {target['expr']}")
+                    print(f"  + {new_expr}")
+                    target['expr'] = new_expr
+                    normalized += 1
+                for note in notes:
+                    print(f"    left as is: {note}")
+
+        merged = merge_quantile_panels(dashboard, args.merge) if args.merge else []
+        for label, quantiles, removed in merged:
+            if not header_printed:
+                print(f"--- {file_path}")
+                header_printed = True
+            print(f"  merged {removed + 1} panels into {label}: quantiles {', '.join(quantiles)}")
+            stats['panels merged'] += removed + 1
+            stats['queries saved'] += removed
+
+        stats['targets normalized'] += normalized
+        if normalized or merged:
+            modified_files += 1
+            if write:
+                write_dashboard(file_path, dashboard)
+
+    print(f"\nSummary:")
+    print(f"  histogram_quantile() calls: {stats['calls']}")
+    print(f"  Buckets wrapped in rate(): {stats['rate added']}")
+    print(f"  le added to the grouping: {stats['le added']}")
+    print(f"  Left as is (le aggregated away, not aggregated): {stats['le aggregated away']}, {stats['not aggregated']}")
+    print(f"  Targets {'normalized' if write else 'to normalize'}: {stats['targets normalized']}")
+    if args.merge:
+        print(f"  Panels merged ({args.merge}): {stats['panels merged']}")
+        print(f"  Bucket queries saved per load: {stats['queries saved']}")
+    print(f"  Dashboards {'modified' if write else 'to modify'}: {modified_files}")
+
+    if args.check and modified_files:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Scrape Relabeling
+-----------------
+
+Metric relabel configs derived from what the dashboards in this repository
+query, applied at scrape time so that series no dashboard uses are never
+ingested, per scraped component (see SCRAPE_COMPONENTS in metric_catalog.py):
+- keep rules allowing only the metric families the dashboards query
+- labeldrop rules dropping the service discovery labels no dashboard uses
+
+Relabel configs are rendered in the style of the Kubernetes operators
+(VMPodScrape/VMServiceScrape and PodMonitor metricRelabelConfigs, camelCase
+keys) or of a plain Prometheus or vmagent scrape config
+(metric_relabel_configs, snake_case keys).
+
+Used by extract-metric-names.py and generate-victoria-metrics-k8s-stack-values.py.
+"""
+
+import sys
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from dashboards import iter_targets, template_variables_by_name, variable_query_text
+from metric_catalog import SCRAPE_COMPONENTS, scrape_components
+from promql import Call, ParseError, VectorSelector, is_template_variable, parse, walk
+
+# Labels identifying a scrape target, never dropped
+PROTECTED_LABELS = {'__name__', 'instance', 'job'}
+
+# Series suffixes of histograms and summaries, which belong to the family of the name without the suffix
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+RELABEL_STYLES = ('operator', 'prometheus')
+
+
+def dashboard_metric_names(dashboards: List[Dict[str, Any]]) -> Tuple[Set[str], Set[str]]:
+    """
+    Return the metric names queried by panel targets and template variable
+    queries, including the metrics of label_values(metric, label) lookups.
+
+    Selectors without a metric name cannot be allowlisted and are reported
+    on stderr, except for `__name__=~"..."` regex matchers which are returned
+    as patterns.
+
+    Returns:
+        tuple: (metric names, metric name patterns)
+    """
+    names = set()
+    patterns = set()
+    expressions = []
+    for dashboard in dashboards:
+        expressions.extend(target['expr'] for _, target in iter_targets(dashboard))
+        expressions.extend(filter(None, map(variable_query_text, template_variables_by_name(dashboard).values())))
+    for expr in expressions:
+        try:
+            root = parse(expr)
+        except ParseError as e:
+            print(f"Warning: {e}", file=sys.stderr)
+            continue
+        # The label argument of label_values(metric, label) parses as a selector
+        label_arguments = {id(arg) for node in walk(root) if isinstance(node, Call) and node.func == 'label_values'
+                           for arg in node.args[1:]}
+        for node in walk(root):
+            if not isinstance(node, VectorSelector) or id(node) in label_arguments:
+                continue
+            if node.metric_name:
+                names.add(node.metric_name)
+                continue
+            name_patterns = [m.value for m in node.matchers if m.name == '__name__' and m.op == '=~'
+                             and not is_template_variable(m.value)]
+            if name_patterns:
+                patterns.update(name_patterns)
+            else:
+                print(f"Warning: selector without a metric name only matches allowlisted metrics: {expr}", file=sys.stderr)
+    return names, patterns
+
+
+def metric_family(metric_name: str) -> str:
+    """Return the family of a metric name: the name without a histogram or summary suffix."""
+    for suffix in HISTOGRAM_SUFFIXES:
+        if metric_name.endswith(suffix) and len(metric_name) > len(suffix):
+            return metric_name[:-len(suffix)]
+    return metric_name
+
+
+def component_metric_families(metric_names: Iterable[str], patterns: Iterable[str] = ()) -> Dict[str, Dict[str, bool]]:
+    """
+    Group metric names into families per scraped component. A histogram or
+    summary queried by any of its series (e.g. only the _bucket series in
+    histogram_quantile()) keeps all its series, the quantiles of a summary
+    having the plain family name.
+
+    Args:
+        metric_names: Metric names queried by the dashboards
+        patterns: Metric name patterns queried by the dashboards, kept for all components
+
+    Returns:
+        {component: {family: whether it has histogram or summary series}} for all SCRAPE_COMPONENTS
+    """
+    families = {component: {} for component in SCRAPE_COMPONENTS}
+    for name in metric_names:
+        family = metric_family(name)
+        for component in scrape_components(name):
+            component_families = families[component]
+            component_families[family] = component_families.get(family, False) or family != name
+    for pattern in patterns:
+        for component_families in families.values():
+            component_families.setdefault(pattern, False)
+    return families
+
+
+def keep_regex(families: Dict[str, bool]) -> str:
+    """Return the regex matching the metric names of the families, e.g. `up|jvm_gc_collection_seconds(?:_bucket|_sum|_count)?`."""
+    suffixes = f"(?:{'|'.join(HISTOGRAM_SUFFIXES)})?"
+    return '|'.join(f"{family}{suffixes}" if histogram else family for family, histogram in sorted(families.items()))
+
+
+def keep_relabel_configs(families: Dict[str, bool], style: str = 'operator') -> List[Dict[str, Any]]:
+    """Return the metric relabel configs keeping only the metric names of the families."""
+    if not families:
+        return []
+    source_labels = 'sourceLabels' if style == 'operator' else 'source_labels'
+    return [{'action': 'keep', source_labels: ['__name__'], 'regex': keep_regex(families)}]
+
+
+def component_label_usage(label_index: Dict[str, Dict[str, Set[str]]]) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    Group the label index by the scraped components exposing each metric.
+
+    Args:
+        label_index: Labels referenced per metric, see collect_label_usage() in dashboards.py
+
+    Returns:
+        {component: {label: metrics referencing the label}} for all SCRAPE_COMPONENTS
+    """
+    usage = {component: {} for component in SCRAPE_COMPONENTS}
+    for metric, labels in label_index.items():
+        for component in scrape_components(metric):
+            for label in labels:
+                usage[component].setdefault(label, set()).add(metric)
+    return usage
+
+
+def unused_labels(label_index: Dict[str, Dict[str, Set[str]]], candidates: List[str]) -> Dict[str, List[str]]:
+    """
+    Return the candidate labels to drop per scraped component: those that no
+    dashboard references on any metric the component exposes.
+
+    Args:
+        label_index: Labels referenced per metric, see collect_label_usage() in dashboards.py
+        candidates: Labels that may be dropped
+
+    Returns:
+        {component: sorted labels to drop} for all SCRAPE_COMPONENTS
+    """
+    usage = component_label_usage(label_index)
+    return {component: sorted(set(candidates) - set(usage[component]) - PROTECTED_LABELS)
+            for component in SCRAPE_COMPONENTS}
+
+
+def labeldrop_relabel_configs(labels: List[str]) -> List[Dict[str, str]]:
+    """Return the metric relabel configs dropping the given labels, the same in both styles."""
+    return [{'action': 'labeldrop', 'regex': '|'.join(labels)}] if labels else []
@@ -0,0 +1,676 @@
+#!/usr/bin/env -S uv run
+"""
+Dashboard Load Simulator
+------------------------
+
+This script computes the HTTP queries Grafana issues against Prometheus when a
+dashboard is opened and on every auto-refresh, and replays them against a local
+stub Prometheus API (see prometheus_stub.py) serving a synthetic fleet (see
+synthetic_fleet.py).
+
+The plan follows how Grafana loads a dashboard:
+1. Template variables are resolved first, in waves: a variable whose query
+   references another query variable waits for it. Variables with
+   refresh=1 (on load) are queried on open, variables with refresh=2
+   (on time range change) on open and on every auto-refresh
+2. Multi-valued and includeAll variables select 'All' and other variables
+   their first value, which is the worst case for the number of queries
+3. Panels of expanded rows are queried once all variables are resolved.
+   Panels of collapsed rows are only queried when the row is expanded and are
+   reported as deferred. Rows and panels with `repeat` are repeated for every
+   selected value of the variable; repeated copies saved in the JSON
+   (repeatPanelId) are replaced, as Grafana does on load
+4. The step of range queries is derived from the time range, maxDataPoints
+   (default: panel width in pixels), the panel min interval and the target
+   interval and intervalFactor, like the Grafana Prometheus data source does
+5. Panels using the '-- Dashboard --' data source reuse the results of another
+   panel and issue no queries
+
+Each request is estimated against the synthetic fleet: the number of result
+series and the number of points (samples) returned. With --replay, the
+requests are sent to a stub Prometheus server, stage by stage, with the
+browser's concurrency limit, recording request count, concurrency, bytes and
+errors returned.
+
+Usage:
+    python simulate-dashboard-load.py [options] [file1.json ...]
+
+    Without file arguments, all dashboards in pulsar/ and oxia/ are simulated.
+
+Options:
+    --scale SCALE             Fleet size: 10k, 100k, 1M or a number of topics (default: 10k)
+    --time-range DURATION     Override the dashboard time range, e.g. 6h (default: dashboard 'time')
+    --screen-width PIXELS     Dashboard width used for the default maxDataPoints (default: 1920)
+    --scrape-interval SECONDS Data source scrape interval, the default min interval (default: 30)
+    --concurrency N           Concurrent requests per wave (default: 6, the browser limit per host)
+    --replay                  Replay the requests against a local stub Prometheus server
+    --latency MS              Latency of every stub response in milliseconds (default: 0)
+    --json FILE               Write the full report including all requests to FILE ('-' for stdout)
+    --budget FILE             Fail if a dashboard exceeds its budget in FILE
+    --write-budget FILE       Write the current numbers as the budget to FILE
+
+Output:
+    - Queries and points per load and per refresh, waves and deferred panels per dashboard
+    - With --budget, the budget violations; the script exits with 1 if there are any
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from dashboards import (DASHBOARD_DATASOURCE, NO_QUERY_PANEL_TYPES, NON_PROMETHEUS_DATASOURCES, REPO_ROOT,
+                        collect_label_usage, datasource_uid, default_dashboard_files, labels_by_metric, load_dashboard,
+                        panel_label, template_variables_by_name, variable_query_text)
+from metric_catalog import REFERENCE_FLEET
+from prometheus_stub import QueryError, StubPrometheusServer, SyntheticPrometheus
+from promql import ParseError, duration_seconds, parse, replace_template_variables, template_variables
+from synthetic_fleet import EXTRA_LABEL_VALUES, SCALES, fleets_for_scales
+
+# Fixed evaluation time, so that plans are reproducible
+NOW = 1_700_000_000
+
+GRID_COLUMNS = 24
+DEFAULT_SCREEN_WIDTH = 1920
+# Browsers open at most 6 HTTP/1.1 connections per host
+DEFAULT_CONCURRENCY = 6
+# Prometheus rejects range queries returning more points per series
+MAX_POINTS_PER_SERIES = 11_000
+
+BUDGET_KEYS = ('queries_per_load', 'points_per_load', 'queries_per_refresh', 'points_per_refresh')
+
+_LABEL_NAMES_RE = re.compile(r'^label_names\(\)\s*$')
+_LABEL_VALUES_RE = re.compile(r'^label_values\((?:(.+),\s*)?([a-zA-Z_][a-zA-Z0-9_]*)\)\s*$', re.DOTALL)
+_METRIC_NAMES_RE = re.compile(r'^metrics\((.+)\)\s*$', re.DOTALL)
+_QUERY_RESULT_RE = re.compile(r'^query_result\((.+)\)\s*$', re.DOTALL)
+_REGEX_SPECIAL_RE = re.compile(r'([\\^$*+?.()|\[\]{}])')
+
+
+@dataclass
+class Request:
+    phase: str            # 'variable', 'panel' or 'annotation'
+    stage: int            # Requests of a stage are issued after the previous stage completed
+    source: str           # Variable name or panel label
+    path: str
+    params: Dict[str, Any]
+    series: int = 0
+    points: int = 0
+    error: Optional[str] = None
+
+
+def round_interval(interval_ms: float) -> int:
+    """Round an interval to the next 'nice' interval, as Grafana's rangeutil.roundInterval."""
+    for limit, rounded in ((15, 10), (35, 20), (75, 50), (150, 100), (350, 200), (750, 500),
+                           (1500, 1000), (3500, 2000), (7500, 5000), (12500, 10000), (17500, 15000),
+                           (25000, 20000), (45000, 30000), (90000, 60000), (210000, 120000),
+                           (450000, 300000), (750000, 600000), (1050000, 900000), (1500000, 1200000),
+                           (2700000, 1800000), (5400000, 3600000), (9000000, 7200000), (16200000, 10800000),
+                           (32400000, 21600000), (86400000, 43200000), (604800000, 86400000),
+                           (1814400000, 604800000), (3628800000, 2592000000)):
+        if interval_ms < limit:
+            return rounded
+    return 31536000000
+
+
+def format_interval(seconds: float) -> str:
+    """Format an interval the way Grafana renders $__interval, e.g. '30s' or '2m'."""
+    ms = int(round(seconds * 1000))
+    for unit, size in (('d', 86_400_000), ('h', 3_600_000), ('m', 60_000), ('s', 1000)):
+        if ms >= size and ms % size == 0:
+            return f"{ms // size}{unit}"
+    return f"{ms}ms"
+
+
+def relative_time_seconds(text: str) -> Optional[float]:
+    """Return the length of a 'now-15m' style time range in seconds."""
+    match = re.fullmatch(r'now-([0-9a-z.]+?)(?:/[smhdwMy])?', text or '')
+    return duration_seconds(match.group(1)) if match else None
+
+
+def regex_escape(value: str) -> str:
+    """Escape a value for a regex matcher, as Grafana's prometheusSpecialRegexEscape."""
+    return _REGEX_SPECIAL_RE.sub(r'\\\\\1', value)
+
+
+def apply_variable_regex(regex: str, texts: List[str]) -> List[str]:
+    """Filter and extract variable values with the variable regex, as Grafana does."""
+    if not regex:
+        return list(dict.fromkeys(texts))
+    match = re.fullmatch(r'/(.*)/([gimsuy]*)', regex, re.DOTALL)
+    pattern = re.compile(match.group(1) if match else regex, re.IGNORECASE if match and 'i' in match.group(2) else 0)
+    values = []
+    for text in texts:
+        m = pattern.search(text)
+        if not m:
+            continue
+        value = m.group(1) if m.groups() else m.group(0)
+        if value:
+            values.append(value)
+    return list(dict.fromkeys(values))
+
+
+def sort_values(values: List[str], sort: Optional[int]) -> List[str]:
+    if sort in (1, 5):
+        return sorted(values, key=str.lower if sort == 5 else None)
+    if sort in (2, 6):
+        return sorted(values, key=str.lower if sort == 6 else None, reverse=True)
+    if sort in (3, 4):
+        def number(value):
+            match = re.search(r'\d+', value)
+            return int(match.group(0)) if match else 0
+        return sorted(values, key=number, reverse=sort == 4)
+    return values
+
+
+class DashboardSimulator:
+    """
+    Plans the requests Grafana issues for one dashboard.
+
+    Args:
+        dashboard: The dashboard JSON object
+        backend: SyntheticPrometheus used to resolve variables and to estimate results
+        range_seconds: Length of the time range
+        screen_width: Dashboard width in pixels
+        scrape_interval: Data source scrape interval in seconds
+    """
+
+    def __init__(self, dashboard, backend, range_seconds, screen_width, scrape_interval):
+        self.dashboard = dashboard
+        self.backend = backend
+        self.range_seconds = range_seconds
+        self.screen_width = screen_width
+        self.scrape_interval = scrape_interval
+        self.start = int(NOW - range_seconds)
+        self.end = NOW
+        self.variables = template_variables_by_name(dashboard)
+        # Variable name -> (all values, selected values, whether 'All' is selected)
+        self.values: Dict[str, tuple] = {}
+        self.load: List[Request] = []
+        self.refresh: List[Request] = []
+        self.panels_queried = 0
+        self.panels_deferred = 0
+        self.panels_shared = 0
+        self.repeated_copies = 0
+
+    # Interpolation
+
+    def interpolate(self, text: str, scoped: Optional[Dict[str, str]] = None, builtins=None) -> str:
+        """Replace template variables the way the Grafana Prometheus data source does."""
+        def replacement(name):
+            if builtins and name in builtins:
+                return builtins[name]
+            if scoped and name in scoped:
+                variable = self.variables.get(name) or {}
+                value = scoped[name]
+                multi = variable.get('multi') or variable.get('includeAll')
+                return regex_escape(value) if multi else value
+            if name not in self.values:
+                return f"${name}"
+            variable = self.variables[name]
+            _, selected, all_selected = self.values[name]
+            if all_selected and variable.get('allValue'):
+                return variable['allValue']
+            if not (variable.get('multi') or variable.get('includeAll')):
+                return selected[0] if selected else ''
+            escaped = [regex_escape(value) for value in selected]
+            return escaped[0] if len(escaped) == 1 else f"({'|'.join(escaped)})"
+        return replace_template_variables(text, replacement)
+
+    # Requests
+
+    def _estimate(self, request: Request):
+        """Estimate the result of a request against the synthetic fleet."""
+        try:
+            if request.path == '/api/v1/query_range':
+                params = request.params
+                points_per_series = int((params['end'] - params['start']) // params['step']) + 1
+                series, _, _ = self.backend.estimate(parse(params['query']))
+                request.series, request.points = series, series * points_per_series
+            elif request.path == '/api/v1/query':
+                series, _, _ = self.backend.estimate(parse(request.params['query']))
+                request.series, request.points = series, series
+        except (QueryError, ParseError) as e:
+            request.error = str(e)
+        return request
+
+    def _fetch(self, request: Request):
+        """Answer a request in-process, used to resolve variable values."""
+        try:
+            params = {name: value if isinstance(value, list) else [str(value)]
+                      for name, value in request.params.items()}
+            data, _ = self.backend.handle(request.path, params)
+            return json.loads(data)
+        except QueryError as e:
+            request.error = str(e)
+            return None
+
+    def variable_request(self, query: str, name: str, stage: int) -> Request:
+        """Return the request the Grafana Prometheus data source issues for a variable query."""
+        window = {'start': self.start, 'end': self.end}
+        if _LABEL_NAMES_RE.match(query):
+            return Request('variable', stage, name, '/api/v1/labels', dict(window))
+        match = _LABEL_VALUES_RE.match(query)
+        if match:
+            params = dict(window)
+            if match.group(1):
+                params['match[]'] = match.group(1).strip()
+            return Request('variable', stage, name, f"/api/v1/label/{match.group(2)}/values", params)
+        if _METRIC_NAMES_RE.match(query):
+            return Request('variable', stage, name, '/api/v1/label/__name__/values', dict(window))
+        match = _QUERY_RESULT_RE.match(query)
+        if match:
+            return Request('variable', stage, name, '/api/v1/query', {'query': match.group(1), 'time': self.end})
+        return Request('variable', stage, name, '/api/v1/series', {'match[]': query.strip(), **window})
+
+    def variable_texts(self, request: Request, query: str) -> List[str]:
+        """Return the texts the variable regex is applied to."""
+        data = self._fetch(request)
+        if data is None:
+            return []
+        if request.path == '/api/v1/series':
+            # Grafana matches the regex against 'name{label="value",...}'
+            return [f"{series.get('__name__', '')}{{"
+                    + ','.join(f'{k}="{v}"' for k, v in series.items() if k != '__name__') + '}'
+                    for series in data]
+        if request.path == '/api/v1/query':
+            return [json.dumps(r.get('metric', {})) for r in data.get('result', [])]
+        match = _METRIC_NAMES_RE.match(query)
+        if match:
+            return [value for value in data if re.search(match.group(1), value)]
+        return list(data)
+
+    def resolve_variables(self):
+        """Resolve all template variables in order, recording the requests of query variables."""
+        stages = {}
+        for name, variable in self.variables.items():
+            var_type = variable.get('type')
+            query = variable_query_text(variable) if var_type == 'query' else variable.get('query')
+            values = []
+            if var_type == 'query' and query:
+                depends_on = [dep for dep in template_variables(query)
+                              if dep in stages and dep != name]
+                stage = 1 + max((stages[dep] for dep in depends_on), default=0)
+                stages[name] = stage
+                text = self.interpolate(query)
+                request = self.variable_request(text, name, stage)
+                values = sort_values(apply_variable_regex(variable.get('regex') or '',
+                                                          self.variable_texts(request, text)),
+                                     variable.get('sort'))
+                request.series = len(values)
+                self.load.append(request)
+                if variable.get('refresh') == 2:
+                    self.refresh.append(Request(**{**asdict(request), 'error': request.error}))
+            elif var_type == 'custom' and isinstance(query, str):
+                values = [v.split(' : ')[-1].strip() for v in query.split(',') if v.strip()]
+            elif var_type == 'interval' and isinstance(query, str):
+                values = [v.strip() for v in query.split(',') if v.strip()]
+            elif var_type in ('constant', 'textbox'):
+                values = [query] if isinstance(query, str) else []
+
+            all_selected = bool(variable.get('includeAll') or variable.get('multi')) and len(values) > 0 \
+                and var_type not in ('constant', 'textbox', 'interval')
+            selected = values if all_selected else values[:1]
+            self.values[name] = (values, selected, all_selected)
+
+    def repeat_values(self, name: Optional[str]) -> List[Optional[str]]:
+        """Return the values a row or panel is repeated for, [None] when it is not repeated."""
+        if not name or name not in self.values:
+            return [None]
+        _, selected, _ = self.values[name]
+        return list(selected) or [None]
+
+    # Panels
+
+    def builtins(self, panel) -> Dict[str, str]:
+        """Return the Grafana built-in variables of a panel, and its interval in seconds."""
+        width = (panel.get('gridPos') or {}).get('w', 12)
+        max_data_points = panel.get('maxDataPoints') or max(1, int(width / GRID_COLUMNS * self.screen_width))
+        min_interval = duration_seconds(self.interpolate(panel.get('interval') or '')) or self.scrape_interval
+        interval = max(round_interval(self.range_seconds * 1000 / max_data_points) / 1000, min_interval)
+        rate_interval = max(interval + self.scrape_interval, 4 * self.scrape_interval)
+        return {
+            '__interval': format_interval(interval),
+            '__interval_ms': str(int(interval * 1000)),
+            '__rate_interval': format_interval(rate_interval),
+            '__range': format_interval(self.range_seconds),
+            '__range_s': str(int(self.range_seconds)),
+            '__range_ms': str(int(self.range_seconds * 1000)),
+        }, interval
+
+    def panel_requests(self, panel, scoped, stage) -> List[Request]:
+        builtins, interval = self.builtins(panel)
+        for name, variable in self.variables.items():
+            if variable.get('type') == 'interval':
+                builtins[f"__auto_interval_{name}"] = builtins['__interval']
+        requests = []
+        label = panel_label(panel)
+        if scoped:
+            label += ' (' + ', '.join(f"{name}={value}" for name, value in scoped.items()) + ')'
+        for target in panel.get('targets') or []:
+            if not isinstance(target, dict) or target.get('hide') or not str(target.get('expr') or '').strip():
+                continue
+            query = self.interpolate(target['expr'], scoped, builtins)
+            factor = target.get('intervalFactor') or 1
+            target_interval = duration_seconds(self.interpolate(target.get('interval') or '', scoped, builtins))
+            step = max(interval * factor, target_interval or 0, math.ceil(self.range_seconds / MAX_POINTS_PER_SERIES))
+            instant = target.get('instant') is True
+            source = f"{label} ({target.get('refId')})"
+            if not instant or target.get('range') is True:
+                start = math.floor(self.start / step) * step
+                end = math.floor(self.end / step) * step
+                requests.append(Request('panel', stage, source, '/api/v1/query_range',
+                                        {'query': query, 'start': start, 'end': end, 'step': step}))
+            if instant:
+                requests.append(Request('panel', stage, source, '/api/v1/query', {'query': query, 'time': self.end}))
+            if target.get('exemplar') is True:
+                requests.append(Request('panel', stage, source, '/api/v1/query_exemplars',
+                                        {'query': query, 'start': self.start, 'end': self.end}))
+        return [self._estimate(request) for request in requests]
+
+    def iter_visible_panels(self):
+        """
+        Yield (panel, scoped variables) for every panel queried on load, with rows
+        and panels repeated for the selected variable values.
+        """
+        sections = []  # (row or None, [panels])
+        skip_section = False
+        for panel in self.dashboard.get('panels') or []:
+            if not isinstance(panel, dict):
+                continue
+            if panel.get('type') == 'row':
+                # Saved copies of repeated rows are dropped and re-created by Grafana
+                skip_section = 'repeatPanelId' in panel
+                if skip_section:
+                    continue
+                if panel.get('collapsed'):
+                    self.panels_deferred += sum(1 for p in panel.get('panels') or [] if isinstance(p, dict))
+                sections.append((panel, []))
+                continue
+            if skip_section or 'repeatPanelId' in panel:
+                continue
+            if not sections:
+                sections.append((None, []))
+            sections[-1][1].append(panel)
+
+        for row, panels in sections:
+            if row is not None and row.get('collapsed'):
+                continue
+            row_values = self.repeat_values(row.get('repeat') if row else None)
+            for row_value in row_values:
+                row_scope = {row['repeat']: row_value} if row_value is not None else {}
+                for panel in panels:
+                    for panel_value in self.repeat_values(panel.get('repeat')):
+                        scoped = dict(row_scope)
+                        if panel_value is not None:
+                            scoped[panel['repeat']] = panel_value
+                        if row_value is not None or panel_value is not None:
+                            self.repeated_copies += 1
+                        yield panel, scoped
+
+    def plan(self):
+        """Plan the requests of a dashboard load and of an auto-refresh."""
+        self.resolve_variables()
+        variable_stages = max((r.stage for r in self.load), default=0)
+        refresh_stages = max((r.stage for r in self.refresh), default=0)
+
+        for panel, scoped in self.iter_visible_panels():
+            if panel.get('type') in NO_QUERY_PANEL_TYPES or panel.get('libraryPanel'):
+                continue
+            datasource = datasource_uid(panel.get('datasource'))
+            if datasource in NON_PROMETHEUS_DATASOURCES:
+                if datasource == DASHBOARD_DATASOURCE:
+                    self.panels_shared += 1
+                continue
+            requests = self.panel_requests(panel, scoped, variable_stages + 1)
+            if not requests:
+                continue
+            self.panels_queried += 1
+            self.load.extend(requests)
+            self.refresh.extend(Request(**{**asdict(r), 'stage': refresh_stages + 1}) for r in requests)
+
+        for annotation in (self.dashboard.get('annotations') or {}).get('list') or []:
+            datasource = datasource_uid(annotation.get('datasource'))
+            if not annotation.get('enable') or not annotation.get('expr') or datasource in NON_PROMETHEUS_DATASOURCES:
+                continue
+            step = duration_seconds(annotation.get('step') or '60s') or 60
+            request = self._estimate(Request('annotation', variable_stages + 1, annotation.get('name') or 'annotation',
+                                             '/api/v1/query_range',
+                                             {'query': self.interpolate(annotation['expr']),
+                                              'start': self.start, 'end': self.end, 'step': step}))
+            self.load.append(request)
+            self.refresh.append(Request(**{**asdict(request), 'stage': refresh_stages + 1}))
+
+
+def summarize(requests: List[Request], concurrency: int) -> Dict[str, Any]:
+    """Summarize the requests of a load or a refresh."""
+    stages = {}
+    for request in requests:
+        stages[request.stage] = stages.get(request.stage, 0) + 1
+    by_phase = {}
+    for request in requests:
+        by_phase[request.phase] = by_phase.get(request.phase, 0) + 1
+    return {
+        'queries': len(requests),
+        'points': sum(r.points for r in requests),
+        'series': sum(r.series for r in requests if r.phase != 'variable'),
+        'stages': len(stages),
+        'waves': sum(math.ceil(count / concurrency) for count in stages.values()),
+        'errors': sum(1 for r in requests if r.error),
+        'by_phase': by_phase,
+    }
+
+
+def replay(server: StubPrometheusServer, requests: List[Request], concurrency: int) -> Dict[str, Any]:
+    """Send the requests to the stub server stage by stage and return the server statistics."""
+    def send(request: Request):
+        body = urllib.parse.urlencode(request.params).encode('utf-8')
+        try:
+            with urllib.request.urlopen(f"{server.url}{request.path}", data=body, timeout=300) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            e.read()
+
+    server.reset_stats()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for stage in sorted({r.stage for r in requests}):
+            list(executor.map(send, [r for r in requests if r.stage == stage]))
+    stats = server.stats()
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def dashboard_key(file_path: str) -> str:
+    """Return the budget key of a dashboard file, its path relative to the repository root."""
+    return os.path.relpath(os.path.abspath(file_path), REPO_ROOT)
+
+
+def simulate_dashboard(file_path, dashboard, backend, args, server=None):
+    """
+    Plan, estimate and optionally replay the load of a dashboard.
+
+    Returns:
+        dict: Dashboard report
+    """
+    range_seconds = duration_seconds(args.time_range) if args.time_range else None
+    range_seconds = range_seconds or relative_time_seconds((dashboard.get('time') or {}).get('from')) or 3600
+    simulator = DashboardSimulator(dashboard, backend, range_seconds, args.screen_width, args.scrape_interval)
+    simulator.plan()
+
+    load = summarize(simulator.load, args.concurrency)
+    refresh = summarize(simulator.refresh, args.concurrency)
+    report = {
+        'file': file_path,
+        'key': dashboard_key(file_path),
+        'title': dashboard.get('title'),
+        'time_range_seconds': range_seconds,
+        'refresh': dashboard.get('refresh') or None,
+        'queries_per_load': load['queries'],
+        'points_per_load': load['points'],
+        'queries_per_refresh': refresh['queries'],
+        'points_per_refresh': refresh['points'],
+        'load': load,
+        'auto_refresh': refresh,
+        'panels': {
+            'queried': simulator.panels_queried,
+            'deferred': simulator.panels_deferred,
+            'shared': simulator.panels_shared,
+            'repeated_copies': simulator.repeated_copies,
+        },
+        'requests': [asdict(r) for r in simulator.load],
+    }
+    if server is not None:
+        report['replay'] = {
+            'load': replay(server, simulator.load, args.concurrency),
+            'auto_refresh': replay(server, simulator.refresh, args.concurrency),
+        }
+    return report
+
+
+def check_budget(reports, budget):
+    """Return the budget violations of the reports."""
+    violations = []
+    for report in reports:
+        limits = budget.get(report['key'])
+        if not limits:
+            continue
+        for key in BUDGET_KEYS:
+            if key in limits and report[key] > limits[key]:
+                violations.append(f"{report['key']}: {key} {report[key]:,} exceeds the budget of {limits[key]:,}")
+    return violations
+
+
+def print_report(reports, fleet, args):
+    print(f"Fleet: {fleet.topics:,} topics, {fleet.namespaces:,} namespaces, {fleet.brokers} brokers; "
+          f"screen width {args.screen_width}px, concurrency {args.concurrency}")
+    print()
+    replayed = any('replay' in report for report in reports)
+    header = (f"  {'queries/load':>12}  {'points/load':>12}  {'queries/refresh':>15}  {'points/refresh':>14}"
+              f"  {'waves':>5}  {'deferred':>8}  {'errors':>6}")
+    if replayed:
+        header += f"  {'bytes/load':>12}  {'in flight':>9}"
+    print(header + "  file")
+    for report in sorted(reports, key=lambda r: r['points_per_load'], reverse=True):
+        line = (f"  {report['queries_per_load']:>12,}  {report['points_per_load']:>12,}"
+                f"  {report['queries_per_refresh']:>15,}  {report['points_per_refresh']:>14,}"
+                f"  {report['load']['waves']:>5}  {report['panels']['deferred']:>8}  {report['load']['errors']:>6}")
+        if replayed:
+            stats = report['replay']['load']
+            line += f"  {stats['bytes']:>12,}  {stats['max_in_flight']:>9}"
+        print(line + f"  {report['file']}")
+    print()
+    print(f"Total: {sum(r['queries_per_load'] for r in reports):,} queries and "
+          f"{sum(r['points_per_load'] for r in reports):,} points per load of all {len(reports)} dashboards")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Dashboard Load Simulator",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='Dashboard JSON files to simulate (default: all dashboards in pulsar/ and oxia/)')
+    parser.add_argument('--scale', default='10k',
+                        help=f"Fleet size: {', '.join(SCALES)} or a number of topics")
+    parser.add_argument('--time-range', metavar='DURATION',
+                        help="Override the dashboard time range, e.g. '6h'")
+    parser.add_argument('--screen-width', type=int, default=DEFAULT_SCREEN_WIDTH,
+                        help='Dashboard width in pixels, used for the default maxDataPoints')
+    parser.add_argument('--scrape-interval', type=int, default=REFERENCE_FLEET['scrape_interval'],
+                        help='Data source scrape interval in seconds')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Concurrent requests per wave')
+    parser.add_argument('--replay', action='store_true',
+                        help='Replay the requests against a local stub Prometheus server')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Latency of every stub response in milliseconds')
+    parser.add_argument('--json', metavar='FILE',
+                        help="Write the full report to FILE ('-' for stdout)")
+    parser.add_argument('--budget', metavar='FILE',
+                        help='Fail if a dashboard exceeds its budget in FILE')
+    parser.add_argument('--write-budget', metavar='FILE',
+                        help='Write the current numbers as the budget to FILE')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    try:
+        fleet = fleets_for_scales([args.scale])[args.scale]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    dashboards = {}
+    failed_count = 0
+    for file_path in args.files or default_dashboard_files():
+        try:
+            dashboards[file_path] = load_dashboard(file_path)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error processing '{file_path}': {e}. Skipping.", file=sys.stderr)
+            failed_count += 1
+
+    metric_labels = labels_by_metric(collect_label_usage(
+        [load_dashboard(file_path) for file_path in default_dashboard_files()] + list(dashboards.values())),
+        EXTRA_LABEL_VALUES)
+    backend = SyntheticPrometheus(fleet, metric_labels)
+
+    server = StubPrometheusServer(backend, latency=args.latency / 1000).start() if args.replay else None
+    try:
+        reports = [simulate_dashboard(file_path, dashboard, backend, args, server)
+                   for file_path, dashboard in dashboards.items()]
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json != '-':
+        print_report(reports, fleet, args)
+
+    if args.json:
+        output = {
+            'fleet': fleet.as_dict(),
+            'screen_width': args.screen_width,
+            'scrape_interval': args.scrape_interval,
+            'concurrency': args.concurrency,
+            'dashboards': reports,
+        }
+        if args.json == '-':
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(output, f, indent=2)
+            print(f"\nWrote JSON report to {args.json}")
+
+    if args.write_budget:
+        budget = {report['key']: {key: report[key] for key in BUDGET_KEYS} for report in reports}
+        with open(args.write_budget, 'w', encoding='utf-8') as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Wrote budget of {len(budget)} dashboards to {args.write_budget}", file=sys.stderr)
+
+    if args.budget:
+        with open(args.budget, 'r', encoding='utf-8') as f:
+            violations = check_budget(reports, json.load(f))
+        if violations:
+            print("\nBudget violations:", file=sys.stderr)
+            for violation in violations:
+                print(f"  {violation}", file=sys.stderr)
+            sys.exit(1)
+        print("\nAll dashboards are within budget", file=sys.stderr)
+
+    if failed_count > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
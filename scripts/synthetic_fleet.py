@@ -0,0 +1,532 @@
+"""
+Synthetic Fleet
+---------------
+
+A model of the series that a Pulsar and Oxia deployment of a given size exposes
+for the metrics queried by the dashboards in this repository. It is the shared
+offline fixture of the performance tooling:
+1. `SeriesModel.iter_series` enumerates every series of a metric, e.g. to write
+   Prometheus exposition text (see generate-synthetic-metrics.py)
+2. `SeriesModel.count` counts the series a selector matches without enumerating
+   them, so that dashboards can be evaluated at 1M topics
+   (see calculate-series-cardinality.py)
+
+Series follow the metric families of metric_catalog.py: each family is exposed
+by the pods of a component and split by the labels of its cardinality level
+(namespace, topic, subscription, function, Oxia shard, ...). Labels that the
+dashboards query on top of that, e.g. 'quantile' or 'grpc_method', multiply the
+series by the values listed in `EXTRA_LABEL_VALUES`.
+
+Naming scheme of the generated label values:
+    namespace   tenant-<t>/ns-<n>
+    topic       persistent://tenant-<t>/ns-<n>/topic-<k>
+    pods        pulsar-broker-<i>, pulsar-bookie-<i>, oxia-server-<i>, ...
+
+Topics are spread evenly over namespaces, and the topics of a namespace are
+spread round-robin over the brokers.
+"""
+
+import itertools
+import math
+import re
+from dataclasses import dataclass, fields
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from metric_catalog import REFERENCE_FLEET, TOPIC_LEVELS, family_for_metric
+
+# Scales the tools evaluate by default, by number of topics
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1M': 1_000_000,
+}
+
+# Pulsar components: fleet attribute holding the pod count, pod name prefix, job label, metrics port
+PULSAR_COMPONENTS = {
+    'broker': ('brokers', 'pulsar-broker', 'broker', 8080),
+    'bookie': ('bookies', 'pulsar-bookie', 'bookie', 8000),
+    'zookeeper': ('zookeepers', 'pulsar-zookeeper', 'zookeeper', 8000),
+    'proxy': ('proxies', 'pulsar-proxy', 'proxy', 8080),
+    'function': ('function_workers', 'pulsar-function', 'function', 6750),
+}
+
+# Labels added by each cardinality level on top of the pod labels
+LEVEL_LABELS = {
+    'cluster': (),
+    'zookeeper': (),
+    'instance': (),
+    'container': (),
+    'namespace': ('namespace',),
+    'topic': ('namespace', 'topic'),
+    'subscription': ('namespace', 'topic', 'subscription'),
+    'consumer': ('namespace', 'topic', 'subscription', 'consumer_name', 'consumer_id'),
+    'function': ('exported_namespace', 'name', 'exported_name', 'fqfn', 'instance_id'),
+    'shard': ('oxia_namespace', 'shard'),
+}
+
+# Values of labels that are not part of the fleet topology
+EXTRA_LABEL_VALUES = {
+    'le': ['0.005', '0.01', '0.025', '0.05', '0.1', '0.25', '0.5', '1', '2.5', '5', '10', '+Inf'],
+    'quantile': ['0.5', '0.75', '0.95', '0.99', '0.999'],
+    'success': ['true', 'false'],
+    'mode': ['idle', 'iowait', 'irq', 'nice', 'softirq', 'steal', 'system', 'user'],
+    'device': ['eth0', 'nvme0n1'],
+    'area': ['heap', 'nonheap'],
+    'state': ['RUNNABLE', 'BLOCKED', 'WAITING', 'TIMED_WAITING'],
+    'thread': ['0', '1', '2', '3'],
+    'remote_cluster': ['pulsar-remote'],
+    'grpc_service': ['io.streamnative.oxia.proto.OxiaClient', 'io.streamnative.oxia.proto.OxiaLogReplication'],
+    'grpc_method': ['Write', 'Read', 'List', 'GetShardAssignments', 'Replicate'],
+    'grpc_code': ['OK', 'Canceled', 'Unavailable'],
+}
+
+# Number of values of extra labels without an entry in EXTRA_LABEL_VALUES
+DEFAULT_EXTRA_LABEL_VALUES = 2
+
+_NAMESPACE_RE = re.compile(r'tenant-(\d+)/ns-(\d+)')
+_TOPIC_RE = re.compile(r'persistent://(tenant-\d+/ns-\d+)/topic-(\d+)')
+
+# Matchers are (label, op, value) tuples with template variables already resolved
+Matcher = Tuple[str, str, str]
+
+
+class Pod(NamedTuple):
+    component: str
+    index: int
+    labels: Dict[str, str]
+
+
+@lru_cache(maxsize=4096)
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def matcher_matches(op: str, pattern: str, value: str) -> bool:
+    """Evaluate a label matcher against a label value, '' standing for a missing label."""
+    if op == '=':
+        return value == pattern
+    if op == '!=':
+        return value != pattern
+    matched = _compile(pattern).fullmatch(value) is not None
+    return matched if op == '=~' else not matched
+
+
+def _matches_all(matchers: List[Tuple[str, str]], value: str) -> bool:
+    return all(matcher_matches(op, pattern, value) for op, pattern in matchers)
+
+
+def _count_matching(values, matchers: List[Tuple[str, str]]) -> int:
+    if not matchers:
+        return len(values)
+    return sum(1 for value in values if _matches_all(matchers, value))
+
+
+@dataclass(frozen=True)
+class Fleet:
+    """
+    Size of a synthetic Pulsar and Oxia deployment. Defaults follow the
+    reference fleet of metric_catalog.py.
+    """
+    brokers: int = REFERENCE_FLEET['brokers']
+    bookies: int = REFERENCE_FLEET['bookies']
+    zookeepers: int = REFERENCE_FLEET['zookeepers']
+    proxies: int = REFERENCE_FLEET['proxies']
+    function_workers: int = REFERENCE_FLEET['function_workers']
+    functions: int = 10
+    oxia_nodes: int = REFERENCE_FLEET['oxia_nodes']
+    oxia_shards: int = REFERENCE_FLEET['oxia_shards']
+    oxia_namespaces: int = 1
+    oxia_replication_factor: int = 3
+    kubernetes_nodes: int = 10
+    tenants: int = REFERENCE_FLEET['tenants']
+    namespaces: int = REFERENCE_FLEET['namespaces']
+    topics: int = REFERENCE_FLEET['topics']
+    subscriptions_per_topic: int = REFERENCE_FLEET['subscriptions_per_topic']
+    consumers_per_subscription: int = REFERENCE_FLEET['consumers_per_subscription']
+    cluster: str = 'pulsar'
+    oxia_cluster: str = 'oxia'
+    kubernetes_namespace: str = 'pulsar'
+
+    @classmethod
+    def for_topics(cls, topics: int, **overrides) -> 'Fleet':
+        """
+        Return a fleet sized for a number of topics: one broker and bookie per
+        10k topics (at least the reference fleet), 100 topics per namespace
+        and 10 namespaces per tenant.
+        """
+        brokers = max(REFERENCE_FLEET['brokers'], math.ceil(topics / 10_000))
+        namespaces = max(REFERENCE_FLEET['namespaces'], topics // 100)
+        sizes = {
+            'brokers': brokers,
+            'bookies': brokers,
+            'kubernetes_nodes': brokers * 2,
+            'namespaces': namespaces,
+            'tenants': max(REFERENCE_FLEET['tenants'], namespaces // 10),
+            'topics': topics,
+        }
+        sizes.update(overrides)
+        return cls(**sizes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    # Naming
+
+    def namespace_name(self, index: int) -> str:
+        return f"tenant-{index % self.tenants}/ns-{index // self.tenants}"
+
+    def namespace_index(self, name: str) -> Optional[int]:
+        match = _NAMESPACE_RE.fullmatch(name)
+        if not match:
+            return None
+        tenant, local = int(match.group(1)), int(match.group(2))
+        index = local * self.tenants + tenant
+        return index if tenant < self.tenants and index < self.namespaces else None
+
+    def topic_name(self, namespace_index: int, topic_index: int) -> str:
+        return f"persistent://{self.namespace_name(namespace_index)}/topic-{topic_index}"
+
+    def topics_in_namespace(self, namespace_index: int) -> int:
+        return self.topics // self.namespaces + (1 if namespace_index < self.topics % self.namespaces else 0)
+
+    def topics_on_broker(self, namespace_index: int, broker_index: int) -> int:
+        """Number of topics of a namespace owned by a broker."""
+        topics = self.topics_in_namespace(namespace_index)
+        return max(0, (topics - broker_index + self.brokers - 1) // self.brokers)
+
+    def function_labels(self, index: int) -> Dict[str, str]:
+        namespace = self.namespace_name(index % self.namespaces)
+        name = f"function-{index}"
+        return {
+            'exported_namespace': namespace,
+            'name': name,
+            'exported_name': name,
+            'fqfn': f"{namespace}/{name}",
+            'instance_id': '0',
+        }
+
+    def oxia_namespace_name(self, index: int) -> str:
+        return 'default' if index == 0 else f"namespace-{index}"
+
+    def shard_replicas(self) -> Iterator[Tuple[int, int]]:
+        """Yield (shard, oxia server index) for all shard replicas."""
+        for shard in range(self.oxia_shards):
+            for replica in range(min(self.oxia_replication_factor, self.oxia_nodes)):
+                yield shard, (shard + replica) % self.oxia_nodes
+
+    # Pods
+
+    def _node_name(self, index: int) -> str:
+        return f"node-{index % max(1, self.kubernetes_nodes)}"
+
+    @cached_property
+    def pulsar_pods(self) -> Dict[str, List[Pod]]:
+        pods = {}
+        for component, (attribute, prefix, job, port) in PULSAR_COMPONENTS.items():
+            pods[component] = [
+                Pod(component, i, {
+                    'cluster': self.cluster,
+                    'job': job,
+                    'instance': f"{prefix}-{i}:{port}",
+                    'kubernetes_namespace': self.kubernetes_namespace,
+                    'kubernetes_pod_name': f"{prefix}-{i}",
+                })
+                for i in range(getattr(self, attribute))
+            ]
+        return pods
+
+    @cached_property
+    def oxia_pods(self) -> List[Pod]:
+        pods = []
+        for component, count in (('server', self.oxia_nodes), ('coordinator', 1)):
+            for i in range(count):
+                pods.append(Pod('oxia', i, {
+                    'oxia_cluster': self.oxia_cluster,
+                    'app_kubernetes_io_component': component,
+                    'job': 'oxia',
+                    'instance': f"oxia-{component}-{i}:8080",
+                    'kubernetes_namespace': self.kubernetes_namespace,
+                    'kubernetes_pod_name': f"oxia-{component}-{i}",
+                }))
+        return pods
+
+    @cached_property
+    def node_pods(self) -> List[Pod]:
+        return [Pod('node', i, {'job': 'node-exporter', 'instance': f"{self._node_name(i)}:9100"})
+                for i in range(self.kubernetes_nodes)]
+
+    @cached_property
+    def container_pods(self) -> List[Pod]:
+        """One cAdvisor container per workload pod."""
+        workloads = [pod for pods in self.pulsar_pods.values() for pod in pods] + self.oxia_pods
+        return [Pod('kubernetes', i, {
+                    'job': 'kubelet',
+                    'instance': self._node_name(i),
+                    'namespace': pod.labels['kubernetes_namespace'],
+                    'pod': pod.labels['kubernetes_pod_name'],
+                    'container': pod.labels['kubernetes_pod_name'].rsplit('-', 1)[0],
+                })
+                for i, pod in enumerate(workloads)]
+
+    def metric_pods(self, metric: str) -> List[Pod]:
+        """Return the pods that expose a metric."""
+        component = family_for_metric(metric).component
+        jvm_pods = [pod for pods in self.pulsar_pods.values() for pod in pods]
+        if component in self.pulsar_pods:
+            return self.pulsar_pods[component]
+        if component == 'oxia':
+            if metric.startswith('oxia_coordinator_'):
+                return [pod for pod in self.oxia_pods if pod.labels['app_kubernetes_io_component'] == 'coordinator']
+            if metric.startswith('oxia_server_'):
+                return [pod for pod in self.oxia_pods if pod.labels['app_kubernetes_io_component'] == 'server']
+            return self.oxia_pods
+        if component == 'kubernetes':
+            return self.container_pods
+        if component == 'node':
+            return self.node_pods
+        # Runtime metrics
+        if metric == 'up':
+            return jvm_pods + self.oxia_pods + self.node_pods
+        if metric.startswith('go_'):
+            return self.oxia_pods
+        if metric.startswith('process_'):
+            return jvm_pods + self.oxia_pods
+        return jvm_pods
+
+
+class SeriesModel:
+    """
+    The series of one metric in a fleet.
+
+    Args:
+        fleet: The fleet exposing the metric
+        metric: The metric name
+        labels: Labels the metric has, see dashboards.labels_by_metric. Labels
+                that are neither pod nor level labels become extra labels.
+    """
+
+    def __init__(self, fleet: Fleet, metric: str, labels=()):
+        self.fleet = fleet
+        self.metric = metric
+        self.level = family_for_metric(metric).level
+        self.pods = fleet.metric_pods(metric)
+        self.pod_labels = set().union(*(pod.labels for pod in self.pods))
+        self.level_labels = set(LEVEL_LABELS.get(self.level, ()))
+        extra_labels = set(labels) | ({'le'} if metric.endswith('_bucket') else set())
+        self.extra_labels = {
+            label: EXTRA_LABEL_VALUES.get(label, [f"{label}-{i}" for i in range(DEFAULT_EXTRA_LABEL_VALUES)])
+            for label in sorted(extra_labels - self.pod_labels - self.level_labels - {'__name__'})
+        }
+
+    @property
+    def labels(self) -> set:
+        return self.pod_labels | self.level_labels | set(self.extra_labels)
+
+    # Enumeration
+
+    def _iter_level_labels(self, pod: Pod) -> Iterator[Dict[str, str]]:
+        fleet = self.fleet
+        if self.level == 'namespace':
+            for ns in range(fleet.namespaces):
+                if fleet.topics_on_broker(ns, pod.index):
+                    yield {'namespace': fleet.namespace_name(ns)}
+        elif self.level in TOPIC_LEVELS:
+            for ns in range(fleet.namespaces):
+                namespace = fleet.namespace_name(ns)
+                for topic in range(pod.index, fleet.topics_in_namespace(ns), fleet.brokers):
+                    labels = {'namespace': namespace, 'topic': fleet.topic_name(ns, topic)}
+                    if self.level == 'topic':
+                        yield labels
+                        continue
+                    for subscription in range(fleet.subscriptions_per_topic):
+                        subscription_labels = {**labels, 'subscription': f"sub-{subscription}"}
+                        if self.level == 'subscription':
+                            yield subscription_labels
+                            continue
+                        for consumer in range(fleet.consumers_per_subscription):
+                            yield {**subscription_labels, 'consumer_name': f"consumer-{consumer}", 'consumer_id': str(consumer)}
+        elif self.level == 'function':
+            for function in range(pod.index, fleet.functions, max(1, fleet.function_workers)):
+                yield fleet.function_labels(function)
+        elif self.level == 'shard':
+            for shard, server in fleet.shard_replicas():
+                if server == pod.index:
+                    yield {'oxia_namespace': fleet.oxia_namespace_name(shard % fleet.oxia_namespaces),
+                           'shard': str(shard)}
+        else:
+            yield {}
+
+    def iter_series(self) -> Iterator[Dict[str, str]]:
+        """Yield the label set of every series, without the metric name."""
+        extra_names = list(self.extra_labels)
+        for pod in self.pods:
+            for level_labels in self._iter_level_labels(pod):
+                for values in itertools.product(*self.extra_labels.values()):
+                    yield {**pod.labels, **level_labels, **dict(zip(extra_names, values))}
+
+    def first_value(self, label: str) -> Optional[str]:
+        """Return the value of a label in the first series, e.g. to stand in for a single-valued variable."""
+        for series in self.iter_series():
+            return series.get(label)
+        return None
+
+    def iter_matching(self, matchers: List[Matcher]) -> Iterator[Dict[str, str]]:
+        """Yield the label sets of the series matched by a list of label matchers."""
+        if not self.count(matchers):
+            return
+        for series in self.iter_series():
+            if all(matcher_matches(op, value, series.get(label, '')) for label, op, value in matchers):
+                yield series
+
+    def label_values(self, matchers: List[Matcher], label: str) -> set:
+        """Return the distinct values of a label over the series matched by a list of label matchers."""
+        if label in self.pod_labels:
+            return {pod.labels[label] for pod in self.pods if label in pod.labels
+                    and self.count(matchers + [(name, '=', value) for name, value in pod.labels.items()])}
+        if label in self.extra_labels:
+            return {value for value in self.extra_labels[label] if self.count(matchers + [(label, '=', value)])}
+        if label not in self.level_labels:
+            return set()
+        return {series[label] for series in self.iter_matching(matchers)}
+
+    def distinct_count(self, matchers: List[Matcher], labels) -> int:
+        """
+        Estimate the number of distinct combinations of labels over the series
+        matched by a list of label matchers, e.g. the number of groups of
+        `sum by (labels)`. Labels are assumed to vary independently.
+        """
+        total = self.count(matchers)
+        if not total:
+            return 0
+        by_label = self._group_matchers(matchers)
+        groups = 1
+        for label in labels:
+            if label not in self.labels:
+                continue
+            if label == 'topic' and self.level in TOPIC_LEVELS:
+                groups *= self.count(matchers, level='topic', with_extra_labels=False)
+            elif label == 'namespace' and label in self.level_labels:
+                groups *= len(self._count_namespaces(by_label.get('namespace', [])))
+            else:
+                groups *= len(self.label_values(matchers, label))
+            if groups >= total:
+                return total
+        return max(1, groups)
+
+    # Counting
+
+    def _group_matchers(self, matchers: List[Matcher]) -> Dict[str, List[Tuple[str, str]]]:
+        by_label: Dict[str, List[Tuple[str, str]]] = {}
+        for label, op, value in matchers:
+            # Presence matchers on labels every series carries select everything
+            if op == '=~' and value in ('.*', '.+') and label in self.labels:
+                continue
+            by_label.setdefault(label, []).append((op, value))
+        return by_label
+
+    def count(self, matchers: List[Matcher], level: Optional[str] = None, with_extra_labels: bool = True) -> int:
+        """
+        Count the series matched by a list of label matchers. Matchers on
+        different labels are independent, so the count is the product of the
+        matching pods, level label combinations and extra label values.
+
+        Args:
+            matchers: Label matchers with resolved values
+            level: Count at another cardinality level, e.g. 'topic' to count
+                   the topics of a subscription level metric
+            with_extra_labels: Whether to multiply by the extra label values
+        """
+        by_label = self._group_matchers(matchers)
+
+        for label, label_matchers in by_label.items():
+            if label not in self.labels and not _matches_all(label_matchers, ''):
+                return 0
+
+        extra = 1
+        for label, values in self.extra_labels.items():
+            extra *= _count_matching(values, by_label.get(label, []))
+            if not extra:
+                return 0
+
+        pods = [pod for pod in self.pods
+                if all(_matches_all(label_matchers, pod.labels.get(label, ''))
+                       for label, label_matchers in by_label.items() if label in self.pod_labels)]
+        if not pods:
+            return 0
+        return self._count_level(pods, by_label, level or self.level) * (extra if with_extra_labels else 1)
+
+    def _count_namespaces(self, label_matchers) -> List[int]:
+        fleet = self.fleet
+        if not label_matchers:
+            return list(range(fleet.namespaces))
+        if label_matchers[0][0] == '=':
+            index = fleet.namespace_index(label_matchers[0][1])
+            if index is None:
+                return []
+            candidates = [index]
+        else:
+            candidates = range(fleet.namespaces)
+        return [ns for ns in candidates if _matches_all(label_matchers, fleet.namespace_name(ns))]
+
+    def _count_topics(self, ns: int, brokers: List[int], label_matchers) -> int:
+        fleet = self.fleet
+        all_brokers = len(brokers) == fleet.brokers
+        if not label_matchers:
+            if all_brokers:
+                return fleet.topics_in_namespace(ns)
+            return sum(fleet.topics_on_broker(ns, broker) for broker in brokers)
+        if label_matchers[0][0] == '=':
+            match = _TOPIC_RE.fullmatch(label_matchers[0][1])
+            if not match or fleet.namespace_index(match.group(1)) != ns:
+                return 0
+            candidates = [int(match.group(2))]
+            candidates = [t for t in candidates if t < fleet.topics_in_namespace(ns)]
+        else:
+            candidates = range(fleet.topics_in_namespace(ns))
+        broker_set = set(brokers)
+        return sum(1 for topic in candidates
+                   if (all_brokers or topic % fleet.brokers in broker_set)
+                   and _matches_all(label_matchers, fleet.topic_name(ns, topic)))
+
+    def _count_level(self, pods: List[Pod], by_label, level: str) -> int:
+        fleet = self.fleet
+        if level == 'namespace':
+            brokers = [pod.index for pod in pods]
+            return sum(sum(1 for broker in brokers if broker < fleet.topics_in_namespace(ns))
+                       for ns in self._count_namespaces(by_label.get('namespace', [])))
+        if level in TOPIC_LEVELS:
+            brokers = [pod.index for pod in pods]
+            topic_matchers = by_label.get('topic', [])
+            topics = sum(self._count_topics(ns, brokers, topic_matchers)
+                         for ns in self._count_namespaces(by_label.get('namespace', [])))
+            if level == 'topic' or not topics:
+                return topics
+            subscriptions = _count_matching([f"sub-{i}" for i in range(fleet.subscriptions_per_topic)],
+                                            by_label.get('subscription', []))
+            if level == 'subscription':
+                return topics * subscriptions
+            consumers = sum(1 for i in range(fleet.consumers_per_subscription)
+                            if _matches_all(by_label.get('consumer_name', []), f"consumer-{i}")
+                            and _matches_all(by_label.get('consumer_id', []), str(i)))
+            return topics * subscriptions * consumers
+        if level in ('function', 'shard'):
+            level_matchers = {label: m for label, m in by_label.items() if label in self.level_labels}
+            return sum(1 for pod in pods for labels in self._iter_level_labels(pod)
+                       if all(_matches_all(m, labels[label]) for label, m in level_matchers.items()))
+        return len(pods)
+
+
+def fleets_for_scales(scales: List[str]) -> Dict[str, Fleet]:
+    """Return a fleet per scale name, e.g. '100k' or a plain number of topics."""
+    fleets = {}
+    for scale in scales:
+        if scale in SCALES:
+            topics = SCALES[scale]
+        else:
+            try:
+                topics = int(scale)
+            except ValueError:
+                raise ValueError(f"Unknown scale '{scale}', expected one of {', '.join(SCALES)} or a number of topics")
+        fleets[scale] = Fleet.for_topics(topics)
+    return fleets
@@ -0,0 +1,35 @@
+"""
+Tests of the series counts of calculate-series-cardinality.py in the synthetic
+fleets of synthetic_fleet.py, with the labels the dashboards of this
+repository query each metric with.
+"""
+
+import pytest
+
+from dashboards import collect_label_usage, default_dashboard_files, labels_by_metric, load_dashboard, load_script
+from synthetic_fleet import EXTRA_LABEL_VALUES, Fleet, SeriesModel
+
+cardinality = load_script('calculate-series-cardinality')
+
+
+@pytest.fixture(scope='module')
+def calculator():
+    metric_labels = labels_by_metric(
+        collect_label_usage([load_dashboard(file_path) for file_path in default_dashboard_files()]),
+        EXTRA_LABEL_VALUES)
+    return cardinality.Calculator(Fleet.for_topics(10_000), metric_labels)
+
+
+@pytest.mark.parametrize('metric, expr', [
+    ('pulsar_subscriptions_count', 'avg(pulsar_subscriptions_count) by (broker)'),
+    ('pulsar_subscriptions_count', 'sum(pulsar_subscriptions_count{cluster=~".+"}) by (broker, topic)'),
+    ('pulsar_rate_in', 'sum by (cluster, broker) (rate(pulsar_rate_in[5m]))'),
+])
+def test_aggregation_selects_the_series_of_its_metric(calculator, metric, expr):
+    # Grouping by a label the metric does not have must not multiply its series
+    assert calculator.count_expr(expr, {}) == SeriesModel(calculator.fleet, metric).count([])
+
+
+def test_grouping_only_labels_are_not_modelled(calculator):
+    assert 'broker' not in calculator.model('pulsar_subscriptions_count').labels
+    assert calculator.count_expr('pulsar_subscriptions_count', {}) == 10_000
@@ -0,0 +1,78 @@
+"""
+Tests of update-dashboards-from-grafana.py against the local stub Grafana of
+grafana_stub.py, serving copies of the dashboards of this repository.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from dashboards import default_dashboard_files, load_dashboard, load_script
+from grafana_stub import StubGrafanaServer, load_stub
+
+sync = load_script('update-dashboards-from-grafana')
+
+
+@pytest.fixture
+def dashboard_files(tmp_path):
+    """Copies of the dashboards of this repository, in pulsar/ and oxia/ directories."""
+    files = []
+    for file_path in default_dashboard_files():
+        target = tmp_path / os.path.basename(os.path.dirname(os.path.abspath(file_path))) / os.path.basename(file_path)
+        target.parent.mkdir(exist_ok=True)
+        shutil.copyfile(file_path, target)
+        files.append(str(target))
+    return files
+
+
+@pytest.fixture
+def grafana(dashboard_files):
+    """The stub Grafana serving the dashboards, in folders named after their directory."""
+    return load_stub(dashboard_files)
+
+
+def run_sync(server, dashboard_files, manifest_path, **kwargs):
+    return sync.export_and_replace_dashboards(dashboard_files, server.url, workers=4,
+                                              manifest_path=str(manifest_path), **kwargs)
+
+
+def test_second_sync_skips_unchanged_dashboards(grafana, dashboard_files, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    with StubGrafanaServer(grafana) as server:
+        first = run_sync(server, dashboard_files, manifest_path)
+        server.reset_stats()
+        second = run_sync(server, dashboard_files, manifest_path)
+        stats = server.stats()
+
+    count = len(dashboard_files)
+    assert first == {'replaced': 0, 'unchanged': count, 'skipped': 0, 'failed': 0}
+    assert second == {'replaced': 0, 'unchanged': 0, 'skipped': count, 'failed': 0}
+    # Skipped dashboards are only looked up in their version history, never exported
+    assert '/api/dashboards/uid/<uid>' not in stats['by_endpoint']
+    assert stats['by_endpoint']['/api/dashboards/uid/<uid>/versions'] == count
+
+
+def test_sync_replaces_dashboard_with_new_version(grafana, dashboard_files, tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    changed_file = dashboard_files[0]
+    with StubGrafanaServer(grafana) as server:
+        run_sync(server, dashboard_files, manifest_path)
+        dashboard = load_dashboard(changed_file)
+        dashboard['title'] = f"{dashboard['title']} (edited)"
+        grafana.add_dashboard(dashboard, folder_uid='pulsar')
+        counts = run_sync(server, dashboard_files, manifest_path)
+
+    assert counts == {'replaced': 1, 'unchanged': 0, 'skipped': len(dashboard_files) - 1, 'failed': 0}
+    assert load_dashboard(changed_file)['title'] == dashboard['title']
+    assert 'version' not in load_dashboard(changed_file)
+
+
+def test_sync_filters_on_several_folders(grafana, dashboard_files, tmp_path):
+    oxia_files = [file_path for file_path in dashboard_files if os.sep + 'oxia' + os.sep in file_path]
+    with StubGrafanaServer(grafana) as server:
+        both = run_sync(server, dashboard_files, tmp_path / 'both.json', folder_uids=['pulsar', 'oxia'])
+        oxia = run_sync(server, dashboard_files, tmp_path / 'oxia.json', folder_uids=['oxia'])
+
+    assert both['unchanged'] == len(dashboard_files)
+    assert oxia['unchanged'] == len(oxia_files)
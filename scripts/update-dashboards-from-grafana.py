@@ -5,10 +5,36 @@
 #     "requests",
 # ]
 # ///
+"""
+Export dashboards from Grafana and replace the local files with matching UIDs.
+
+Dashboards are listed with a paginated /api/search, optionally limited to
+folders, and exported concurrently over a pooled HTTP session. A sync
+manifest records the Grafana version of every exported dashboard and the hash
+of the file written for it, so that dashboards unchanged on both sides since
+the last sync are skipped after a cheap version lookup. Files are only
+rewritten when the exported content differs.
+
+It can be tried out against a local stub Grafana serving the dashboards of
+this repository, see grafana_stub.py:
+
+    python grafana_stub.py --port 3000 pulsar/*.json oxia/*.json
+"""
 import os
 import json
+import hashlib
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Number of /api/search hits requested per page
+SEARCH_PAGE_SIZE = 1000
+
+DEFAULT_WORKERS = 8
+DEFAULT_MANIFEST = 'build/grafana-sync-manifest.json'
 
 
 def extract_uid_from_file(file_path):
@@ -30,88 +56,253 @@ def extract_uid_from_file(file_path):
         return None
 
 
-def export_and_replace_dashboards(dashboard_files, grafana_url):
+def create_session(workers):
+    """Create an HTTP session with a connection pool sized for the workers and retries for transient errors."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def search_dashboards(session, grafana_url, folder_uids=None, page_size=SEARCH_PAGE_SIZE):
+    """
+    List all dashboards, following the pages of /api/search.
+
+    Args:
+        session: HTTP session
+        grafana_url (str): Grafana URL
+        folder_uids (list, optional): Only list dashboards in these folders
+        page_size (int): Number of hits requested per page
+
+    Returns:
+        list: Search hits of all dashboards
+    """
+    params = {'type': 'dash-db', 'limit': page_size}
+    if folder_uids:
+        params['folderUIDs'] = list(folder_uids)
+
+    all_dashboards = []
+    page = 1
+    while True:
+        response = session.get(f"{grafana_url}/api/search", params={**params, 'page': page})
+        response.raise_for_status()
+        hits = response.json()
+        all_dashboards.extend(hits)
+        if len(hits) < page_size:
+            return all_dashboards
+        page += 1
+
+
+def normalize_dashboard(dashboard_content):
+    """Return the file content of an exported dashboard, without the Grafana instance specific version and id."""
+    dashboard_content = dict(dashboard_content)
+    # delete version and id fields
+    dashboard_content.pop('version', None)
+    dashboard_content.pop('id', None)
+    return json.dumps(dashboard_content, indent=2, ensure_ascii=False)
+
+
+def normalize_file_content(content):
+    """Return the normalized content of a local dashboard file, or the content as is if it is not valid JSON."""
+    try:
+        return normalize_dashboard(json.loads(content))
+    except (TypeError, ValueError, AttributeError):
+        return content
+
+
+def read_file(file_path):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest() if content is not None else None
+
+
+def latest_version(session, grafana_url, uid):
+    """Return the latest version number of a dashboard from its version history."""
+    response = session.get(f"{grafana_url}/api/dashboards/uid/{uid}/versions", params={'limit': 1})
+    response.raise_for_status()
+    versions = response.json()
+    # Grafana 11 wraps the versions in an object
+    if isinstance(versions, dict):
+        versions = versions.get('versions', [])
+    return versions[0].get('version') if versions else None
+
+
+def sync_dashboard(session, grafana_url, uid, file_path, manifest_entry):
+    """
+    Export a dashboard and replace its file if the content differs.
+
+    Args:
+        session: HTTP session
+        grafana_url (str): Grafana URL
+        uid (str): Dashboard UID
+        file_path (str): Path to the local dashboard file
+        manifest_entry (dict, optional): Sync manifest entry of the dashboard from the last sync
+
+    Returns:
+        tuple: (status, manifest entry) where status is 'skipped', 'unchanged' or 'replaced'
+    """
+    existing = read_file(file_path)
+
+    # Skip the export if neither the dashboard in Grafana nor the local file changed since the last sync
+    if manifest_entry and manifest_entry.get('sha256') == content_hash(existing):
+        if latest_version(session, grafana_url, uid) == manifest_entry.get('version'):
+            return 'skipped', manifest_entry
+
+    # Get the dashboard JSON
+    dashboard_response = session.get(f"{grafana_url}/api/dashboards/uid/{uid}")
+    dashboard_response.raise_for_status()
+    dashboard_data = dashboard_response.json()
+
+    # Extract just the dashboard part (no meta)
+    dashboard_content = dashboard_data.get('dashboard', {})
+    if not dashboard_content:
+        raise ValueError(f"No dashboard content found for UID {uid}")
+
+    meta = dashboard_data.get('meta', {})
+    content = normalize_dashboard(dashboard_content)
+    status = 'unchanged'
+    if content != normalize_file_content(existing):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        existing = content
+        status = 'replaced'
+
+    return status, {
+        'version': meta.get('version', dashboard_content.get('version')),
+        'file': file_path,
+        'sha256': content_hash(existing),
+    }
+
+
+def load_sync_manifest(manifest_path, grafana_url):
+    """Load the sync manifest entries by UID, ignoring a manifest of another Grafana instance."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('grafana_url') != grafana_url:
+        return {}
+    return manifest.get('dashboards', {})
+
+
+def save_sync_manifest(manifest_path, grafana_url, entries):
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'grafana_url': grafana_url, 'dashboards': entries}, f, indent=2, sort_keys=True)
+
+
+def export_and_replace_dashboards(dashboard_files, grafana_url, workers=DEFAULT_WORKERS, folder_uids=None,
+                                  manifest_path=DEFAULT_MANIFEST, session=None):
     """
     Export dashboards from Grafana and replace specified files where UID matches.
+
+    Args:
+        dashboard_files (list): Dashboard JSON files to update
+        grafana_url (str): Grafana URL
+        workers (int): Number of dashboards exported concurrently
+        folder_uids (list, optional): Only export dashboards in these folders
+        manifest_path (str, optional): Sync manifest file, None to always export every dashboard
+        session (optional): HTTP session to use instead of a new pooled session
+
+    Returns:
+        dict: Number of dashboards by sync status ('replaced', 'unchanged', 'skipped', 'failed')
     """
+    counts = {'replaced': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
     if not dashboard_files:
         print("No input files provided")
-        return
-    
+        return counts
+
     print(f"Processing {len(dashboard_files)} input files")
-    
+
     # Map UIDs to file paths
     uid_to_file = {}
     for file_path in dashboard_files:
         if not os.path.exists(file_path):
             print(f"Warning: File {file_path} does not exist")
             continue
-            
+
         uid = extract_uid_from_file(file_path)
         if uid:
             uid_to_file[uid] = file_path
-    
+
     if not uid_to_file:
         print("No valid dashboard files with UIDs found")
-        return
-    
+        return counts
+
     print(f"Found {len(uid_to_file)} valid dashboard files with UIDs")
-    
+
+    session = session or create_session(workers)
+
     # Get all dashboards from Grafana
     try:
-        response = requests.get(f"{grafana_url}/api/search?type=dash-db")
-        response.raise_for_status()
-        all_dashboards = response.json()
+        all_dashboards = search_dashboards(session, grafana_url, folder_uids)
     except requests.RequestException as e:
         print(f"Error fetching dashboards from Grafana: {e}")
-        return
-    
-    # Export and replace matching dashboards
-    replaced_count = 0
-    
-    for dashboard in all_dashboards:
-        uid = dashboard.get('uid')
-        if not uid or uid not in uid_to_file:
-            continue
-        
-        print(f"Exporting dashboard: {dashboard.get('title')} (UID: {uid})")
-        
-        try:
-            # Get the dashboard JSON
-            dashboard_response = requests.get(f"{grafana_url}/api/dashboards/uid/{uid}")
-            dashboard_response.raise_for_status()
-            dashboard_data = dashboard_response.json()
-            
-            # Extract just the dashboard part (no meta)
-            dashboard_content = dashboard_data.get('dashboard', {})
-            
-            if not dashboard_content:
-                print(f"Warning: No dashboard content found for UID {uid}")
+        return counts
+
+    manifest = load_sync_manifest(manifest_path, grafana_url) if manifest_path else {}
+    matching = [dashboard for dashboard in all_dashboards if dashboard.get('uid') in uid_to_file]
+
+    # Export and replace matching dashboards concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (dashboard, executor.submit(sync_dashboard, session, grafana_url, dashboard['uid'],
+                                        uid_to_file[dashboard['uid']], manifest.get(dashboard['uid'])))
+            for dashboard in matching
+        ]
+        for dashboard, future in futures:
+            uid = dashboard['uid']
+            try:
+                status, entry = future.result()
+            except requests.RequestException as e:
+                print(f"Error exporting dashboard {uid}: {e}")
+                counts['failed'] += 1
                 continue
-            
-            # Replace the file
-            file_path = uid_to_file[uid]
-            # delete version and id fields
-            dashboard_content.pop('version', None)
-            dashboard_content.pop('id', None)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(dashboard_content, f, indent=2, ensure_ascii=False)
-            
-            replaced_count += 1
-            print(f"Successfully replaced {file_path}")
-            
-        except requests.RequestException as e:
-            print(f"Error exporting dashboard {uid}: {e}")
-        except Exception as e:
-            print(f"Error writing dashboard {uid} to file: {e}")
-    
-    print(f"Done! Replaced {replaced_count} dashboard files out of {len(uid_to_file)}")
+            except Exception as e:
+                print(f"Error writing dashboard {uid} to file: {e}")
+                counts['failed'] += 1
+                continue
+
+            manifest[uid] = entry
+            counts[status] += 1
+            if status == 'replaced':
+                print(f"Successfully replaced {entry['file']} with {dashboard.get('title')} (UID: {uid})")
+            elif status == 'unchanged':
+                print(f"Exported dashboard {dashboard.get('title')} (UID: {uid}), {entry['file']} is up to date")
+
+    if manifest_path:
+        save_sync_manifest(manifest_path, grafana_url, manifest)
+
+    print(f"Done! Replaced {counts['replaced']} dashboard files out of {len(uid_to_file)} "
+          f"({counts['unchanged']} up to date, {counts['skipped']} skipped as unchanged since the last sync, "
+          f"{counts['failed']} failed)")
+    return counts
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Export and replace Grafana dashboards")
     parser.add_argument("files", nargs='+', help="Dashboard JSON files to update")
     parser.add_argument("--grafana-url", default="http://localhost:3000", help="Grafana URL (default: http://localhost:3000)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of dashboards exported concurrently (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--folder-uid", action='append', dest='folder_uids', metavar='UID',
+                        help="Only export dashboards in this folder, can be repeated")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST,
+                        help=f"Sync manifest of the exported dashboard versions (default: {DEFAULT_MANIFEST})")
+    parser.add_argument("--no-manifest", action='store_true',
+                        help="Export every dashboard without reading or writing the sync manifest")
     args = parser.parse_args()
-    
-    export_and_replace_dashboards(args.files, args.grafana_url)
+
+    export_and_replace_dashboards(args.files, args.grafana_url.rstrip('/'), args.workers, args.folder_uids,
+                                  None if args.no_manifest else args.manifest)